@@ -2,15 +2,19 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-import os, json, smtplib
+import os, json, smtplib, hmac
 from pathlib import Path
 
 import dash
 from dash import dcc, html, Input, Output
 from itsdangerous import URLSafeSerializer, BadSignature
+from flask import jsonify, request, abort
 
 from components.sidebar import sidebar, content_style
 from utils.trait_db import load_trait_db
+from utils.perf import cache_stats
+from utils.jobs import configure as configure_jobs
+from utils.downloads import register_download_routes
 
 from pages.home import page_home
 from pages.documentation import page_documentation
@@ -21,6 +25,7 @@ from pages.module_dairy import register_callbacks as dairy_callbacks, page_modul
 from pages.module_antibacterial import register_callbacks as abx_callbacks, page_module as page_abx
 from pages.module_antifungal import register_callbacks as af_callbacks, page_module as page_af
 from pages.results import register_callbacks as results_callbacks, page_results
+from pages.batch import register_callbacks as batch_callbacks, page_batch
 from pages.about import page_about
 from pages.contact import page_contact, register_callbacks as contact_callbacks
 from pages.cite import page_cite
@@ -32,6 +37,7 @@ app.title = "DairyBioControl"
 # ---- Load DB once
 TRAIT_DB = load_trait_db()
 app.server.config["TRAIT_DB"] = TRAIT_DB
+configure_jobs(TRAIT_DB)  # background analysis jobs share the loaded DB
 
 # ---- Email verification config
 USERS_DB = Path("assets/users.db.json")
@@ -105,16 +111,31 @@ def smtp_selftest():
 def health():
     return "ok", 200
 
+# ---- Detection cache stats (per worker) ----
+# Off unless CACHE_STATS_TOKEN is set; then pass it as ?token= or X-Stats-Token.
+CACHE_STATS_TOKEN = os.environ.get("CACHE_STATS_TOKEN", "")
+
+@server.get("/cache-stats")
+def cache_stats_route():
+    token = request.headers.get("X-Stats-Token") or request.args.get("token", "")
+    if not CACHE_STATS_TOKEN or not hmac.compare_digest(token.encode(), CACHE_STATS_TOKEN.encode()):
+        abort(404)
+    return jsonify(cache_stats())
+
+# ---- Streaming result downloads (CSV / CSV.gz / Parquet) ----
+register_download_routes(server)
+
 # ------------------ GLOBAL stores (always present) ------------------
 # These are referenced by module/result callbacks. Keeping them here
 # avoids “nonexistent object” errors when navigating off the upload page.
 _global_stores = html.Div([
     dcc.Store(id="store-features"),
+    dcc.Store(id="store-bundle"),
     dcc.Store(id="store-filename"),
     dcc.Store(id="store-filekind"),
     dcc.Store(id="store-email"),
     dcc.Store(id="store-upload-status"),
-    dcc.Store(id="store-upload-started"),
+    dcc.Store(id="store-job"),
     dcc.Store(id="store-analysis-mode"),
     dcc.Store(id="store-progress", data=0),
     dcc.Interval(id="progress-interval", interval=350, n_intervals=0, disabled=True),
@@ -140,6 +161,7 @@ def render_page_content(pathname):
     if page == "antibacterial": return page_abx()
     if page == "antifungal": return page_af()
     if page == "results": return page_results()
+    if page == "batch": return page_batch()
     if page == "aboutus": return page_about()
     if page == "contact": return page_contact()
     if page == "cite": return page_cite()
@@ -153,6 +175,7 @@ dairy_callbacks(app)
 abx_callbacks(app)
 af_callbacks(app)
 results_callbacks(app)
+batch_callbacks(app)
 contact_callbacks(app)
 
 if __name__ == "__main__":
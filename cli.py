@@ -0,0 +1,150 @@
+# cli.py
+"""
+Headless scoring: parse + detect + score a directory of genomes without the
+web app, streaming per-genome results as each genome finishes.
+
+    python cli.py genomes/ -o out/ -j 32 --format parquet
+
+Writes scores, summary (one row per genome × trait) and hits tables to
+--out. The trait DB is loaded (and its match index compiled) once in the
+parent; workers are forked from it, so they share it copy-on-write.
+"""
+from __future__ import annotations
+
+import argparse, gc, multiprocessing as mp, os, sys, time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from utils.batch import genome_names, is_genome_file
+from utils.export import EXTENSIONS, FORMATS, open_writer, parquet_available
+from utils.features import FeatureTable
+from utils.parsing import parse_bytes
+from utils.score_engine import match_vectors, reference_caps, scores_frame
+
+# set in the parent before the pool starts; forked workers inherit them
+_DB: Optional[Dict[str, Any]] = None
+_REF_CAP = 0.0
+_WITH_HITS = True
+
+def iter_genome_files(paths: List[str]) -> Iterator[Path]:
+    """Files as given, directories walked recursively for GenBank/FASTA files (sorted)."""
+    for p in map(Path, paths):
+        if p.is_dir():
+            for f in sorted(p.rglob("*")):
+                if f.is_file() and not f.name.startswith(".") and is_genome_file(f.name):
+                    yield f
+        elif p.is_file():
+            yield p
+
+def _load(use_snapshot: bool) -> None:
+    global _DB, _REF_CAP
+    from utils.trait_db import get_trait_index, load_trait_db
+    _DB = load_trait_db(use_snapshot=use_snapshot)
+    get_trait_index(_DB)  # compile once, before the fork
+    _REF_CAP = float(reference_caps(_DB).sum())
+
+def _init_worker(use_snapshot: bool, with_hits: bool) -> None:
+    global _WITH_HITS
+    _WITH_HITS = with_hits
+    if _DB is None:  # spawn start method: nothing inherited
+        _load(use_snapshot)
+
+def score_file(task: Tuple[str, str]) -> Dict[str, Any]:
+    """Worker: (path, genome name) -> {"genome", "scores", "summary", "hits", "error", "seconds"}."""
+    from utils.trait_db import detect_all  # lazy import
+    path, name = task
+    t0 = time.perf_counter()
+    try:
+        parsed = parse_bytes(Path(path).read_bytes(), path)
+    except OSError as e:
+        parsed = {"features": [], "error": str(e)}
+    table = FeatureTable.from_records(parsed["features"])
+    det = detect_all(table, name, _DB)
+    summaries, hits = [], []
+    for cat, (summary, h) in det.items():
+        if not summary.empty:
+            summaries.append(summary.assign(Genome=name, Category=cat, Detected=summary["Detected"].astype(int))
+                             [["Genome", "Category", "Trait", "Detected", "Genes"]])
+        if _WITH_HITS and h is not None and not h.empty:
+            hits.append(h)
+    n_traits = sum(int((s["Detected"] > 0).sum()) for s in summaries)
+    scores = scores_frame([name], [len(table)], [n_traits], *match_vectors(det), ref_cap=_REF_CAP)
+    scores.insert(1, "File", path)
+    return {"genome": name, "scores": scores,
+            "summary": pd.concat(summaries, ignore_index=True) if summaries else pd.DataFrame(),
+            "hits": pd.concat(hits, ignore_index=True) if hits else pd.DataFrame(),
+            "error": parsed.get("error") or ("" if len(table) else "no features"),
+            "seconds": time.perf_counter() - t0}
+
+def _results(tasks: List[Tuple[str, str]], jobs: int, use_snapshot: bool, with_hits: bool) -> Iterator[Dict[str, Any]]:
+    if jobs <= 1:
+        _init_worker(use_snapshot, with_hits)
+        yield from map(score_file, tasks)
+        return
+    methods = mp.get_all_start_methods()
+    ctx = mp.get_context("fork" if "fork" in methods else "spawn")
+    # keep the collector from touching (and so copying) the inherited DB pages
+    gc.collect(); gc.freeze()
+    with ctx.Pool(jobs, initializer=_init_worker, initargs=(use_snapshot, with_hits), maxtasksperchild=200) as pool:
+        yield from pool.imap_unordered(score_file, tasks, chunksize=1)
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="dairybiocontrol",
+                                 description="Score GenBank/protein FASTA genomes against the DairyBioControl trait DB.")
+    ap.add_argument("inputs", nargs="+", help="genome files and/or directories (searched recursively)")
+    ap.add_argument("-o", "--out", default="dairybio_out", help="output directory (default: %(default)s)")
+    ap.add_argument("-f", "--format", choices=FORMATS, default="csv", help="output format (default: %(default)s)")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                    help="worker processes (default: all CPUs)")
+    ap.add_argument("--gzip", action="store_true", help="gzip csv/jsonl output")
+    ap.add_argument("--no-hits", action="store_true", help="skip the per-feature hits table")
+    ap.add_argument("--no-snapshot", action="store_true", help="rebuild the trait DB from the CSVs instead of the snapshot")
+    ap.add_argument("-q", "--quiet", action="store_true", help="no per-genome progress on stderr")
+    return ap
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = build_parser()
+    args = ap.parse_args(argv)
+    if args.format == "parquet" and not parquet_available():
+        ap.error("--format parquet needs the optional `pyarrow` package")
+
+    files = list(iter_genome_files(args.inputs))
+    if not files:
+        ap.error("no GenBank/FASTA files found")
+    tasks = [(str(f), n) for f, n in zip(files, genome_names(f.name for f in files))]
+    jobs = max(1, min(args.jobs, len(tasks)))
+    use_snapshot, with_hits = not args.no_snapshot, not args.no_hits
+
+    t0 = time.perf_counter()
+    _load(use_snapshot)
+    if not args.quiet:
+        print(f"trait DB ready in {time.perf_counter() - t0:.2f}s; {len(tasks)} genomes, {jobs} workers",
+              file=sys.stderr)
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    ext = EXTENSIONS[args.format] + (".gz" if args.gzip and args.format != "parquet" else "")
+    names = ["scores", "summary"] + (["hits"] if with_hits else [])
+    writers = {k: open_writer(out / f"{k}{ext}", args.format, compress=args.gzip) for k in names}
+    failed = 0
+    try:
+        for i, res in enumerate(_results(tasks, jobs, use_snapshot, with_hits), 1):
+            for k, w in writers.items():
+                w.write(res[k])
+            failed += bool(res["error"])
+            if not args.quiet:
+                sc = res["scores"].iloc[0]
+                note = f" [{res['error']}]" if res["error"] else ""
+                print(f"[{i}/{len(tasks)}] {res['genome']}: {sc['Features']} features, "
+                      f"biocontrol {sc['Biocontrol']:.1f}, {res['seconds']:.2f}s{note}", file=sys.stderr)
+    finally:
+        for w in writers.values():
+            w.close()
+    if not args.quiet:
+        print(f"done in {time.perf_counter() - t0:.1f}s -> {out}/ ({failed} with errors)", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
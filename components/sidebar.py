@@ -10,7 +10,7 @@ content_style = {"margin-left": "300px", "margin-right": "20px", "padding": "20p
 
 tabs = [
     "Home","Documentation","Upload","Safety Screening",
-    "Dairy Adaptation","Antibacterial","Antifungal","Results",
+    "Dairy Adaptation","Antibacterial","Antifungal","Results","Batch",
     "About Us","Contact","Cite"
 ]
 
@@ -26,8 +26,9 @@ def sidebar():
         ]),
         # Global stores
         dcc.Store(id="store-features", data=[]),
+        dcc.Store(id="store-bundle"),
         dcc.Store(id="store-upload-status", data="idle"),
-        dcc.Store(id="store-upload-started", data=False),
+        dcc.Store(id="store-job"),
         dcc.Store(id="store-analysis-mode", data="full"),
         dcc.Store(id="store-email", data=""),
         dcc.Store(id="store-filename", data=""),
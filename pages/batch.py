@@ -0,0 +1,162 @@
+# pages/batch.py
+from __future__ import annotations
+
+from dash import dcc, html, Input, Output, State, no_update
+from dash.dash_table import DataTable
+
+from utils.batch import BATCH_MAX_GENOMES, get_batch
+from utils.downloads import batch_download_url, download_formats
+from utils.jobs import read_state, submit_batch
+
+PAGE_KEY = "batch"
+
+_CARD = {"background":"#fff", "border":"1px solid #e9eef5", "borderRadius":"12px",
+         "padding":"16px", "boxShadow":"0 2px 8px rgba(0,0,0,0.04)"}
+
+_UPLOAD_STYLE = {
+    "width": "100%", "height": "60px", "lineHeight": "60px",
+    "borderWidth": "1px", "borderStyle": "dashed", "borderRadius": "5px",
+    "textAlign": "center", "marginBottom": "8px", "cursor": "pointer"
+}
+
+def _progress_style(pct):
+    return {"height":"10px", "width":f"{int(pct or 0)}%", "background":"linear-gradient(90deg,#7ad,#4bb)",
+            "transition":"width 0.18s linear", "borderRadius":"8px"}
+
+def _empty_heatmap():
+    return {"data":[], "layout":{"height":280, "margin":{"l":40,"r":10,"t":10,"b":40}}}
+
+def _heatmap_figure(matrix):
+    """Genomes × traits seen in at least one genome; cell = Detected count."""
+    df = matrix.to_frame(drop_empty=True)
+    if df.empty:
+        return _empty_heatmap()
+    return {
+        "data":[{"type":"heatmap", "z":df.to_numpy().tolist(), "x":list(df.columns), "y":list(df.index),
+                 "colorscale":"Blues", "colorbar":{"title":"Detected"},
+                 "hovertemplate":"%{y}<br>%{x}<br>Detected: %{z}<extra></extra>"}],
+        "layout":{"height":max(320, 24 * len(df.index) + 220),
+                  "margin":{"l":160,"r":20,"t":10,"b":200},
+                  "xaxis":{"tickangle":-45, "automargin":True}, "yaxis":{"automargin":True}}
+    }
+
+def page_batch():
+    return html.Div([
+        html.Div([
+            html.H3("Batch Analysis — many genomes at once"),
+            html.Label(f"Upload several GenBank/FASTA files (optionally .gz/.bz2/.zst) or one .zip/.tar.gz "
+                       f"archive of them — up to {BATCH_MAX_GENOMES} genomes"),
+            dcc.Upload(
+                id="batch-upload",
+                children=html.Div([
+                    "📁 Drag & Drop or ",
+                    html.Button("Browse ...", style={"display": "inline-block", "marginLeft": "10px"})
+                ]),
+                style=_UPLOAD_STYLE,
+                multiple=True
+            ),
+            html.Div(html.Div(id="batch-progress-inner", style=_progress_style(0)),
+                     style={"width":"100%","background":"#eef2f7","borderRadius":"8px","marginTop":"8px"}),
+            html.Div(id="batch-status", style={"marginTop": "8px"}),
+        ], style=_CARD),
+
+        dcc.Store(id="store-batch"),
+        dcc.Store(id="store-batch-job"),
+        dcc.Interval(id="batch-interval", interval=500, n_intervals=0, disabled=True),
+
+        html.Br(),
+        html.Div([
+            html.H3("Genome × trait matrix", style={"margin":"0 0 12px","fontWeight":"800"}),
+            dcc.Graph(id="batch-heatmap", figure=_empty_heatmap(),
+                      config={"displaylogo": False, "toImageButtonOptions": {"format":"png","filename":"dairybio_batch"}}),
+            html.H3("Per-genome scores", style={"margin":"16px 0 12px","fontWeight":"800"}),
+            html.Div(id="batch-scores"),
+            html.Div([
+                html.A(html.Button("📥 Download Matrix"), id="download-link-batch-matrix", download="",
+                       style={"marginRight":"8px"}),
+                html.A(html.Button("📥 Download Matrix (long)"), id="download-link-batch-long", download="",
+                       style={"marginRight":"8px"}),
+                html.A(html.Button("📥 Download Scores"), id="download-link-batch-scores", download="",
+                       style={"marginRight":"12px"}),
+                dcc.RadioItems(id="batch-dl-format", value="csv", options=download_formats(),
+                               labelStyle={"display":"inline-block","marginRight":"12px"},
+                               style={"display":"inline-block"}),
+            ], style={"marginTop":"12px"}),
+        ], style=_CARD),
+    ], style={"padding":"16px 18px"})
+
+def _status(*lines):
+    return html.Div([html.Div(n) for n in lines], style={"color":"#456","fontSize":"15px"})
+
+def _scores_table(scores):
+    return DataTable(
+        columns=[{"name": c, "id": c} for c in scores.columns],
+        data=scores.to_dict("records"),
+        sort_action="native",
+        style_cell={"fontSize":"14px","padding":"6px"},
+        style_header={"backgroundColor":"#f7f7f7","fontWeight":"700"},
+        page_size=20
+    )
+
+def register_callbacks(app):
+    @app.callback(
+        Output("store-batch-job","data"),
+        Output("batch-interval","disabled"),
+        Output("batch-status","children"),
+        Input("batch-upload","contents"),
+        State("batch-upload","filename"),
+        prevent_initial_call=True
+    )
+    def submit(contents, filenames):
+        if not contents:
+            return no_update, no_update, no_update
+        # archives are expanded, parsed, detected and scored as a background job
+        job_id = submit_batch(contents, filenames)
+        return {"id": job_id}, False, _status(f"⏳ {len(contents)} file(s) queued for analysis")
+
+    @app.callback(
+        Output("batch-progress-inner","style"),
+        Output("batch-interval","disabled", allow_duplicate=True),
+        Output("batch-status","children", allow_duplicate=True),
+        Output("store-batch","data"),
+        Output("batch-heatmap","figure"),
+        Output("batch-scores","children"),
+        Input("store-batch-job","data"),
+        Input("batch-interval","n_intervals"),
+        State("store-batch","data"),
+        prevent_initial_call=True
+    )
+    def poll(job, ticks, shown):
+        st = read_state((job or {}).get("id", ""))
+        if st is None:
+            return _progress_style(0), True, _status("❌ Batch job not found, please upload again."), None, _empty_heatmap(), html.Div()
+        if st["status"] == "error":
+            skipped = (st.get("result") or {}).get("skipped") or []
+            notes = [f"❌ {st.get('message') or 'Batch analysis failed.'}"] + (["Skipped: " + "; ".join(skipped)] if skipped else [])
+            return _progress_style(0), True, _status(*notes), None, _empty_heatmap(), html.Div()
+        pct = int(round(100 * float(st.get("progress") or 0)))
+        if st["status"] != "done":
+            return (_progress_style(pct), False, _status(f"⏳ {st.get('message') or 'Queued'} ({pct}%)"),
+                    no_update, no_update, no_update)
+        info = st["result"]
+        if (shown or {}).get("id") == info["batch"]["id"]:
+            return _progress_style(100), True, no_update, no_update, no_update, no_update
+        res = get_batch(info["batch"]["id"])
+        if res is None:
+            return _progress_style(0), True, _status("❌ Batch result expired, please upload again."), None, _empty_heatmap(), html.Div()
+        notes = [f"✅ {len(res['scores'])} genomes analysed, {info['nnz']} genome × trait hits."]
+        if info["skipped"]:
+            notes.append("Skipped: " + "; ".join(info["skipped"]))
+        return (_progress_style(100), True, _status(*notes), info["batch"],
+                _heatmap_figure(res["matrix"]), _scores_table(res["scores"]))
+
+    @app.callback(
+        Output("download-link-batch-matrix","href"),
+        Output("download-link-batch-long","href"),
+        Output("download-link-batch-scores","href"),
+        Input("store-batch","data"),
+        Input("batch-dl-format","value"),
+    )
+    def download_links(batch, fmt):
+        # streamed by the /download/batch route (utils/downloads.py)
+        return tuple(batch_download_url(batch, t, fmt) for t in ("matrix", "long", "scores"))
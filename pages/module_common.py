@@ -1,13 +1,15 @@
 # pages/module_common.py
 from __future__ import annotations
-from typing import Dict, Any, List, Tuple
+import re
+from typing import Dict, Any, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
-import plotly.express as px
-from dash import dcc, html, Input, Output, State, no_update
+from dash import dcc, html, Input, Output, State
 from dash import dash_table
 
-from utils.trait_db import build_detection_tables
+from utils.downloads import download_formats, result_download_url
+from utils.perf import cached_value, bundle_module, get_result_bundle
 
 GRAPH_CONFIG = {
     "displaylogo": False,
@@ -30,99 +32,148 @@ def module_layout(page_key: str, title: str) -> html.Div:
         dcc.Graph(id=f"{page_key}-graph", config=GRAPH_CONFIG),
         html.Div(id=f"{page_key}-table", style={"marginTop":"8px"}),
 
-        html.Div([
-            html.Button("📥 Download Summary CSV", id=f"download-btn-{page_key}", n_clicks=0, style={"marginTop":"12px","marginRight":"8px"}),
-            dcc.Download(id=f"download-table-{page_key}"),
-            html.Button("📥 Download Hits CSV", id=f"download-hits-btn-{page_key}", n_clicks=0, style={"marginTop":"12px"}),
-            dcc.Download(id=f"download-hits-{page_key}")
-        ])
+        download_bar(page_key)
     ])
 
-def _bar(summary: pd.DataFrame, palette: List[str] | None = None):
-    if summary.empty:
-        summary = pd.DataFrame({"Trait": ["No traits found"], "Detected": [0]})
-    fig = px.bar(summary, x="Trait", y="Detected", color="Trait",
-                 labels={"Trait":"Trait","Detected":"Detected Count"},
-                 color_discrete_sequence=palette or px.colors.qualitative.Set2)
-    fig.update_layout(width=1200, height=620, margin=dict(l=40,r=20,t=10,b=80),
-                      plot_bgcolor="white", paper_bgcolor="white",
-                      xaxis=dict(title_font=dict(size=16), tickfont=dict(size=13), showgrid=True, gridcolor="rgba(0,0,0,0.07)"),
-                      yaxis=dict(title_font=dict(size=16), tickfont=dict(size=13), showgrid=True, gridcolor="rgba(0,0,0,0.07)"),
-                      legend=dict(orientation="h", yanchor="bottom", y=1.02, x=0, font=dict(size=12)), title=None)
-    fig.update_traces(marker_line_width=0.8, marker_line_color="rgba(0,0,0,0.3)")
-    return fig
-
-def register_callbacks(app, *, page_key: str, category: str, flatten_safety: bool = False, palette: List[str] | None = None):
+# ---------------- Downloads ----------------
+# Plain links to the streaming routes in utils/downloads.py; the file never
+# passes through a callback.
+def download_bar(page_key: str) -> html.Div:
+    return html.Div([
+        html.A(html.Button("📥 Download Summary"), id=f"download-link-{page_key}",
+               download="", style={"marginRight":"8px"}),
+        html.A(html.Button("📥 Download Hits"), id=f"download-hits-link-{page_key}",
+               download="", style={"marginRight":"12px"}),
+        dcc.RadioItems(id=f"{page_key}-dl-format", value="csv", options=download_formats(),
+                       labelStyle={"display":"inline-block","marginRight":"12px"},
+                       style={"display":"inline-block"}),
+    ], style={"marginTop":"12px"})
+
+def register_download_links(app, *, page_key: str, category: str, hits: str = "hits"):
+    """Point the page's download links at the current bundle; hits="genes" for the Gene/Product export."""
     @app.callback(
-        Output(f"{page_key}-graph","figure"),
-        Output(f"{page_key}-notice","children"),
-        Output(f"{page_key}-table","children"),
-        Input("store-features","data"),
-        Input("store-upload-status","data"),
-        Input(f"{page_key}-view","value"),
-        State("store-filename","data"),
-        prevent_initial_call=False  # so page shows something right away
+        Output(f"download-link-{page_key}","href"),
+        Output(f"download-hits-link-{page_key}","href"),
+        Input("store-bundle","data"),
+        Input(f"{page_key}-dl-format","value"),
     )
-    def update_module(features: List[Dict[str, Any]], status: str, view: str, fname: str):
-        try:
-            trait_db = app.server.config.get("TRAIT_DB", {}) or {}
-
-            if status != "ready":
-                empty = pd.DataFrame({"Trait": [], "Detected": []})
-                return _bar(empty, palette), "⬆️ Upload a file and click Submit.", html.Div()
-
-            summary, hits = build_detection_tables(trait_db, category, features or [], genome_name=fname or "query", flatten_safety=flatten_safety)
-            fig = _bar(summary.rename(columns={"Detected":"Detected"}), palette)
-            total = int(summary["Detected"].sum()) if not summary.empty else 0
-            notice = f"Detected total: {total} matches across {len(summary)} traits."
-
-            if view == "table":
-                tbl = dash_table.DataTable(
-                    columns=[{"name":c, "id":c} for c in summary.columns],
-                    data=summary.to_dict("records"),
-                    page_size=15,
-                    style_cell={"fontSize":"14px","padding":"6px","whiteSpace":"normal","height":"auto"},
-                    style_header={"backgroundColor":"#f7f7f7","fontWeight":"700"},
-                )
-                tbl2 = dash_table.DataTable(
-                    columns=[{"name":c, "id":c} for c in hits.columns],
-                    data=hits.to_dict("records"),
-                    page_size=12,
-                    style_cell={"fontSize":"13px","padding":"5px","whiteSpace":"normal","height":"auto"},
-                    style_header={"backgroundColor":"#f7f7f7","fontWeight":"700"},
-                )
-                return fig, notice, html.Div([html.H4("Summary"), tbl, html.H4("Hits"), tbl2])
+    def download_links(bundle_ref, fmt):
+        return (result_download_url(bundle_ref, category, "summary", fmt),
+                result_download_url(bundle_ref, category, hits, fmt))
+
+# ---------------- Hits table (server-side paging) ----------------
+# The hits frame stays in the cached result bundle; the DataTable runs with
+# page/filter/sort_action="custom" and only the visible page is sent.
+HITS_PAGE_SIZE = 15
+HITS_COLUMNS = ["Trait", "Hit", "Product", "Kind", "Weight", "Locus", "Start", "End", "Strand"]
+
+# (spellings, canonical op) in match order, as the DataTable query syntax has them
+_FILTER_OPS = ((("ge ", ">="), ">="), (("le ", "<="), "<="), (("lt ", "<"), "<"), (("gt ", ">"), ">"),
+               (("ne ", "!="), "!="), (("eq ", "="), "="), (("contains ",), "contains"),
+               (("datestartswith ",), "datestartswith"))
+
+def _split_filter_part(part: str) -> Tuple[Optional[str], Optional[str], Any]:
+    """'{Weight} ge 2' -> ("Weight", ">=", 2.0); (None, None, None) if unparsable."""
+    part = re.sub(r"^(\{[^}]*\}) i(\w+) ", r"\1 \2 ", part.strip())  # icontains/ieq/...: matching is case-blind anyway
+    for spellings, op in _FILTER_OPS:
+        for token in spellings:
+            if token not in part:
+                continue
+            name, value = part.split(token, 1)
+            name, value = name.strip(), value.strip()
+            if not (name.startswith("{") and name.endswith("}")):
+                continue
+            if len(value) > 1 and value[0] == value[-1] and value[0] in ("'", '"', "`"):
+                value = value[1:-1].replace("\\" + value[0], value[0])
             else:
-                return fig, notice, html.Div()
+                try:
+                    value = float(value)
+                except ValueError:
+                    pass
+            return name[1:-1], op, value
+    return None, None, None
 
-        except Exception as e:
-            empty = pd.DataFrame({"Trait": [], "Detected": []})
-            return _bar(empty, palette), f"⚠️ Error rendering module: {e}", html.Div()
+def filter_hits(hits: pd.DataFrame, filter_query: str) -> pd.DataFrame:
+    """Apply a DataTable filter_query ("{col} op value && ...") to the hits frame."""
+    for part in (filter_query or "").split(" && "):
+        col, op, value = _split_filter_part(part)
+        if col not in hits.columns:
+            continue
+        s = hits[col]
+        if op in ("contains", "datestartswith") or (isinstance(value, str) and op in ("=", "!=")):
+            text = s.astype(str).str.lower()
+            needle = str(value).lower()
+            if op == "contains":
+                mask = text.str.contains(needle, regex=False)
+            elif op == "datestartswith":
+                mask = text.str.startswith(needle)
+            else:
+                mask = (text == needle) if op == "=" else (text != needle)
+        else:
+            num = pd.to_numeric(s, errors="coerce")
+            mask = {"=": num == value, "!=": num != value, "<": num < value, "<=": num <= value,
+                    ">": num > value, ">=": num >= value}[op]
+        hits = hits[mask.to_numpy()]
+    return hits
 
-    # CSV downloads
-    @app.callback(
-        Output(f"download-table-{page_key}", "data"),
-        Input(f"download-btn-{page_key}", "n_clicks"),
-        State("store-features","data"),
-        State("store-filename","data"),
-        prevent_initial_call=True
+def sort_hits(hits: pd.DataFrame, sort_by: Optional[List[Dict[str, str]]]) -> pd.DataFrame:
+    cols = [s for s in (sort_by or []) if s.get("column_id") in hits.columns]
+    if not cols:
+        return hits
+    return hits.sort_values([s["column_id"] for s in cols],
+                            ascending=[s.get("direction") != "desc" for s in cols],
+                            kind="mergesort", na_position="last")
+
+def _view_rows(key: Tuple, hits: pd.DataFrame, sort_by, filter_query: str) -> np.ndarray:
+    """Row positions of the filtered + sorted view, cached so paging does not redo them."""
+    key = ("hitsview",) + key + (repr(sort_by or []), filter_query or "")
+    return cached_value(key, lambda: sort_hits(filter_hits(hits.reset_index(drop=True), filter_query),
+                                               sort_by).index.to_numpy())
+
+def hits_page(hits: pd.DataFrame, page_current: int = 0, page_size: int = HITS_PAGE_SIZE,
+              sort_by=None, filter_query: str = "", key: Optional[Tuple] = None) -> Tuple[List[Dict[str, Any]], int]:
+    """(records of the requested page, page count) for the filtered + sorted hits."""
+    cols = [c for c in HITS_COLUMNS if c in hits.columns]
+    if key is not None:
+        rows = _view_rows(key, hits, sort_by, filter_query)
+    else:
+        rows = sort_hits(filter_hits(hits.reset_index(drop=True), filter_query), sort_by).index.to_numpy()
+    page_size = max(1, int(page_size or HITS_PAGE_SIZE))
+    n_pages = max(1, -(-len(rows) // page_size))
+    page_current = min(max(0, int(page_current or 0)), n_pages - 1)
+    sel = rows[page_current * page_size:(page_current + 1) * page_size]
+    return hits.iloc[sel][cols].to_dict("records"), n_pages
+
+def hits_table(page_key: str, hits: pd.DataFrame, key: Optional[Tuple] = None) -> dash_table.DataTable:
+    """Hits DataTable with backend paging; rendered with its first page only."""
+    data, n_pages = hits_page(hits, key=key)
+    return dash_table.DataTable(
+        id=f"{page_key}-hits",
+        columns=[{"name": c, "id": c, "type": "numeric" if pd.api.types.is_numeric_dtype(hits[c]) else "text"}
+                 for c in HITS_COLUMNS if c in hits.columns],
+        data=data,
+        page_action="custom", page_current=0, page_size=HITS_PAGE_SIZE, page_count=n_pages,
+        filter_action="custom", filter_query="",
+        sort_action="custom", sort_mode="multi", sort_by=[],
+        style_cell={"fontSize":"13px","padding":"5px","whiteSpace":"normal","height":"auto"},
+        style_header={"backgroundColor":"#f7f7f7","fontWeight":"700"},
     )
-    def dl_summary(n, features, fname):
-        if not n: return no_update
-        trait_db = app.server.config.get("TRAIT_DB", {}) or {}
-        summary, _ = build_detection_tables(trait_db, category, features or [], genome_name=fname or "query", flatten_safety=flatten_safety)
-        return dcc.send_data_frame(summary.to_csv, f"{page_key}_summary.csv", index=False)
 
+def register_hits_table(app, *, page_key: str, category: str):
+    """Serve page/filter/sort requests of `{page_key}-hits` from the cached bundle."""
     @app.callback(
-        Output(f"download-hits-{page_key}", "data"),
-        Input(f"download-hits-btn-{page_key}", "n_clicks"),
-        State("store-features","data"),
-        State("store-filename","data"),
-        prevent_initial_call=True
+        Output(f"{page_key}-hits","data"),
+        Output(f"{page_key}-hits","page_count"),
+        Input(f"{page_key}-hits","page_current"),
+        Input(f"{page_key}-hits","page_size"),
+        Input(f"{page_key}-hits","sort_by"),
+        Input(f"{page_key}-hits","filter_query"),
+        State("store-bundle","data"),
+        prevent_initial_call=True  # first page ships with the table
     )
-    def dl_hits(n, features, fname):
-        if not n: return no_update
-        trait_db = app.server.config.get("TRAIT_DB", {}) or {}
-        _, hits = build_detection_tables(trait_db, category, features or [], genome_name=fname or "query", flatten_safety=flatten_safety)
-        return dcc.send_data_frame(hits.to_csv, f"{page_key}_hits.csv", index=False)
-
+    def page_hits(page_current, page_size, sort_by, filter_query, bundle_ref):
+        bundle = get_result_bundle(bundle_ref, page=page_key)
+        if bundle is None:
+            return [], 1
+        _, hits = bundle_module(bundle, category)
+        return hits_page(hits, page_current, page_size, sort_by, filter_query, key=(bundle["id"], category))
@@ -1,12 +1,12 @@
 # pages/module_safety.py
 from __future__ import annotations
 
-import pandas as pd
-import plotly.express as px
-from dash import dcc, html, Input, Output, State, no_update, dash_table
+from dash import dcc, html, Input, Output, dash_table
 
 from components.common import info_banner
-from utils.trait_db import build_detection_table_and_hits
+from pages.module_common import download_bar, hits_table, register_download_links, register_hits_table
+from utils.figures import bar_figure
+from utils.perf import RESULTS_EXPIRED, bundle_figure, bundle_module, get_result_bundle
 
 PAGE_KEY = "safetyscreening"
 CATEGORY = "Safety"
@@ -34,98 +34,67 @@ def page_module():
         dcc.Graph(id=f"{PAGE_KEY}-graph", config=GRAPH_CONFIG),
         html.Div(id=f"{PAGE_KEY}-table", style={"marginTop":"8px"}),
 
-        html.Div([
-            html.Button("📥 Download Summary CSV", id=f"download-btn-{PAGE_KEY}", n_clicks=0, style={"marginTop":"12px","marginRight":"8px"}),
-            dcc.Download(id=f"download-table-{PAGE_KEY}"),
-            html.Button("📥 Download Hits CSV", id=f"download-hits-btn-{PAGE_KEY}", n_clicks=0, style={"marginTop":"12px"}),
-            dcc.Download(id=f"download-hits-{PAGE_KEY}")
-        ])
+        download_bar(PAGE_KEY)
     ])
 
 def _empty_figure():
-    return px.bar(pd.DataFrame({"Trait":["No data"], "Detected":[0]}), x="Trait", y="Detected")
+    return bar_figure(None, empty_label="No data")
 
 def register_callbacks(app):
+    # graph + notice only follow the bundle; the Graph/Table toggle re-renders the table alone
     @app.callback(
         Output(f"{PAGE_KEY}-graph","figure"),
         Output(f"{PAGE_KEY}-notice","children"),
-        Output(f"{PAGE_KEY}-table","children"),
-        Input("store-features","data"),
+        Input("store-bundle","data"),
         Input("store-analysis-mode","data"),
         Input("store-upload-status","data"),
-        Input(f"{PAGE_KEY}-view","value"),
-        State("store-filename","data")
     )
-    def update_module(features, mode, status, view, fname):
+    def update_module(bundle_ref, mode, status):
         allowed = (mode == "full") or (mode == "safety")
         if not allowed:
-            return _empty_figure(), info_banner("ℹ️ Hidden for current Analysis Mode."), html.Div()
+            return _empty_figure(), info_banner("ℹ️ Hidden for current Analysis Mode.")
 
-        if status != "ready":
-            return _empty_figure(), info_banner("⬆️ Upload a file and click Submit."), html.Div()
+        if status != "ready" or not bundle_ref:
+            return _empty_figure(), info_banner("⬆️ Upload a file and click Submit.")
 
         # Build data strictly from Safety DB (ARGs_db.csv, VFs_db.csv, TA_db.csv)
-        summary, hits = build_detection_table_and_hits(CATEGORY, features or [], genome_name=fname or "query")
+        bundle = get_result_bundle(bundle_ref, page=PAGE_KEY)
+        if bundle is None:
+            return _empty_figure(), info_banner(f"⚠️ {RESULTS_EXPIRED}")
+        summary, _ = bundle_module(bundle, CATEGORY)
         # Total = unique matches across subcategories, but use the summary number you already show
         total = int(summary["Detected"].sum()) if not summary.empty else 0
         notice = html.Div(f"Detected total: {total} matches across {len(summary)} subcategories.",
                           style={"margin":"4px 0 10px 2px","color":"#456","fontSize":"15px"})
-
-        # Graph
-        fig = px.bar(
-            summary if not summary.empty else pd.DataFrame({"Trait":["No traits found"],"Detected":[0]}),
-            x="Trait", y="Detected", color="Trait", title=None
-        )
-        fig.update_layout(width=1200, height=620, margin=dict(l=40,r=20,t=10,b=80),
-                          plot_bgcolor="white", paper_bgcolor="white")
-
-        # Optional table view
-        if view == "table":
-            table = dash_table.DataTable(
-                columns=[{"name":"Trait","id":"Trait"},{"name":"Detected","id":"Detected"},{"name":"Genes","id":"Genes"}],
-                data=summary.to_dict("records"),
-                style_cell={"fontSize":"14px","padding":"6px"},
-                style_header={"backgroundColor":"#f7f7f7","fontWeight":"700"},
-                page_size=20
-            )
-            return fig, notice, table
-        else:
-            return fig, notice, html.Div()
-
-    @app.callback(
-        Output(f"download-table-{PAGE_KEY}","data"),
-        Input(f"download-btn-{PAGE_KEY}","n_clicks"),
-        State("store-features","data"),
-        State("store-filename","data"),
-        prevent_initial_call=True
-    )
-    def download_summary(n, features, fname):
-        summary, _ = build_detection_table_and_hits(CATEGORY, features or [], genome_name=fname or "query")
-        csv = summary.to_csv(index=False)
-        return dict(content=csv, filename=f"{(fname or 'results').split('/')[-1]}_{CATEGORY}_summary.csv")
+        return bundle_figure(bundle, CATEGORY), notice
 
     @app.callback(
-        Output(f"download-hits-{PAGE_KEY}","data"),
-        Input(f"download-hits-btn-{PAGE_KEY}","n_clicks"),
-        State("store-features","data"),
-        State("store-filename","data"),
-        prevent_initial_call=True
+        Output(f"{PAGE_KEY}-table","children"),
+        Input("store-bundle","data"),
+        Input("store-analysis-mode","data"),
+        Input("store-upload-status","data"),
+        Input(f"{PAGE_KEY}-view","value"),
     )
-    def download_hits(n, features, fname):
-        """
-        Export ONLY Gene and Product (no tier/weight/kind/category columns),
-        per your Safety CSV schemas (ARGs_db.csv, VFs_db.csv, TA_db.csv).
-        """
-        _, hits = build_detection_table_and_hits(CATEGORY, features or [], genome_name=fname or "query")
-        if hits is None or hits.empty:
-            simple = pd.DataFrame(columns=["Gene","Product"])
-        else:
-            # Gene column: only keep the name if the match was by gene; otherwise leave blank
-            gene_series = hits.apply(lambda r: r["Hit"] if str(r.get("Kind","")) == "gene" else "", axis=1)
-            product_series = hits["Product"].astype(str)
-            # De-duplicate identical Gene/Product pairs
-            simple = pd.DataFrame({"Gene": gene_series, "Product": product_series}).drop_duplicates()
+    def update_table(bundle_ref, mode, status, view):
+        allowed = (mode == "full") or (mode == "safety")
+        if view != "table" or not allowed or status != "ready" or not bundle_ref:
+            return html.Div()
+
+        bundle = get_result_bundle(bundle_ref, page=PAGE_KEY)
+        if bundle is None:
+            return info_banner(f"⚠️ {RESULTS_EXPIRED}")
+        summary, hits = bundle_module(bundle, CATEGORY)
+        table = dash_table.DataTable(
+            columns=[{"name":"Trait","id":"Trait"},{"name":"Detected","id":"Detected"},{"name":"Genes","id":"Genes"}],
+            data=summary.to_dict("records"),
+            style_cell={"fontSize":"14px","padding":"6px"},
+            style_header={"backgroundColor":"#f7f7f7","fontWeight":"700"},
+            page_size=20
+        )
+        return html.Div([table, html.H4("Hits", style={"margin":"16px 0 8px"}),
+                         hits_table(PAGE_KEY, hits, key=(bundle["id"], CATEGORY))])
 
-        csv = simple.to_csv(index=False)
-        return dict(content=csv, filename=f"{(fname or 'results').split('/')[-1]}_{CATEGORY}_hits.csv")
+    register_hits_table(app, page_key=PAGE_KEY, category=CATEGORY)
 
+    # hits export is Gene + Product only, per the Safety CSV schemas (ARGs_db.csv, VFs_db.csv, TA_db.csv)
+    register_download_links(app, page_key=PAGE_KEY, category=CATEGORY, hits="genes")
@@ -6,8 +6,7 @@ from dash import dcc, html, Input, Output, State
 from dash.dash_table import DataTable
 import plotly.graph_objects as go  # for the dial
 
-from utils.perf import cached_build_detection
-from utils.trait_db import get_module_ref_cap  # realistic denominator
+from utils.perf import RESULTS_EXPIRED, get_result_bundle
 
 _CARD = {"background":"#fff", "border":"1px solid #e9eef5", "borderRadius":"12px",
          "padding":"16px", "boxShadow":"0 2px 8px rgba(0,0,0,0.04)"}
@@ -88,52 +87,20 @@ def register_callbacks(app):
         Output("biocontrol-dial","figure"),
         Output("benefit-bars","figure"),
         Output("results-notice","children"),
-        Input("store-features","data"),
+        Input("store-bundle","data"),
         State("store-filename","data"),
         prevent_initial_call=False
     )
-    def compute_indices(features, fname):
-        feats = features or []
-        genome = fname or "query"
+    def compute_indices(bundle_ref, fname):
+        # the upload's result bundle already holds every module and the score
+        bundle = get_result_bundle(bundle_ref, page="results")
+        if bundle is None:
+            return _dial_figure(0.0), _empty_bar_figure(), (RESULTS_EXPIRED if bundle_ref else "")
 
-        if not feats:
-            return _dial_figure(0.0), _empty_bar_figure(), ""
-
-        # benefit modules (weighted) — cached
-        d_sum, d_hits = cached_build_detection("DairyAdaptation", feats, genome)
-        a_sum, a_hits = cached_build_detection("Antibacterial",  feats, genome)
-        f_sum, f_hits = cached_build_detection("Antifungal",     feats, genome)
-
-        S_Dairy_w = float(d_hits["Weight"].sum()) if not d_hits.empty else 0.0
-        S_Abx_w   = float(a_hits["Weight"].sum()) if not a_hits.empty else 0.0
-        S_Af_w    = float(f_hits["Weight"].sum()) if not f_hits.empty else 0.0
-
-        # Safety → risk (counts) — cached
-        s_sum, s_hits = cached_build_detection("Safety", feats, genome)
-        arg_n = vf_n = ta_n = 0
-        if not s_hits.empty:
-            grp = s_hits.groupby("Trait")["Hit"].nunique().to_dict()
-            arg_n = int(grp.get("ARGs", 0))
-            vf_n  = int(grp.get("Virulence Factors", 0))
-            ta_n  = int(grp.get("Toxin-Antitoxin", 0))
-
-        # Risk indices
-        PPRS  = (arg_n**2 + vf_n**2 + ta_n**2) ** 0.5
-        gamma = 0.5  # gentler penalty
-        PPRI  = PPRS / (1.0 + PPRS)
-
-        # Realistic reference cap
-        ref_cap = (
-            get_module_ref_cap("DairyAdaptation", 40) +
-            get_module_ref_cap("Antibacterial",  30) +
-            get_module_ref_cap("Antifungal",     30)
-        )
-        ref_cap = max(ref_cap, 1e-9)
-
-        benefit_w    = S_Dairy_w + S_Abx_w + S_Af_w
-        norm_benefit = benefit_w / ref_cap
-        biocontrol   = 100.0 * norm_benefit / (1.0 + gamma * PPRI)
-        biocontrol   = max(0.0, min(100.0, biocontrol))
+        # weighted benefit sums, safety risk (PPRS/PPRI) and the 0–100 score
+        sc = bundle["score"]
+        S_Dairy_w, S_Abx_w, S_Af_w = (float(x) for x in sc["benefit_w"])
+        biocontrol = float(sc["Biocontrol"])
 
         # Build dial
         dial_fig = _dial_figure(biocontrol)
@@ -148,7 +115,7 @@ def register_callbacks(app):
             "layout":{"height":300,"margin":{"l":50,"r":10,"t":10,"b":40},"yaxis":{"title":"Weighted hits"}}
         }
 
-        note = "" if (benefit_w + arg_n + vf_n + ta_n) > 0 else \
+        note = "" if (sc["benefit"] + sc["safety_n"].sum()) > 0 else \
                "No traits matched. Check gene/product names or upload an annotated GenBank/FASTA."
 
         return dial_fig, bars_fig, note
@@ -1,12 +1,8 @@
 # pages/upload.py
 from __future__ import annotations
-import hashlib
 
 from dash import dcc, html, Input, Output, State, no_update
-from utils.parsing import (
-    parse_contents, is_genbank, is_protein_fasta,
-    detect_annotator_from_text, parse_genbank_features, parse_protein_fasta_features
-)
+from utils.jobs import read_state, submit_upload
 
 _CARD = {
     "background": "#fff",
@@ -55,7 +51,7 @@ def page_upload():
                 )
             ]),
 
-            html.Label("Upload GenBank (*.gb/*.gbk/*.gbff/*.genbank) or Protein FASTA (*.faa)"),
+            html.Label("Upload GenBank (*.gb/*.gbk/*.gbff/*.genbank) or Protein FASTA (*.faa), optionally .gz/.bz2/.zst"),
             dcc.Upload(
                 id="upload-data",
                 children=html.Div([
@@ -117,38 +113,14 @@ def page_upload():
         ], style=_CARD),
 
         html.Div(
-            "Select a specific module and click Submit to run the job. "
-            "The results will be displayed in the corresponding module tabs. "
+            "The analysis starts as soon as the file is uploaded (all modules at once). "
+            "Select a specific module and click Submit to view its results in the corresponding tab. "
             "Please be patient if it takes some time.",
             style={"marginTop": "10px", "color": "#556", "fontStyle": "italic", "fontSize": "15px"}
         ),
     ], style={"padding": "16px 18px"})
 
 def register_callbacks(app):
-    @app.callback(
-        Output("store-upload-started", "data"),
-        Input("upload-data", "contents"),
-        prevent_initial_call=True
-    )
-    def mark_upload_started(contents):
-        return bool(contents)
-
-    @app.callback(
-        Output("progress-interval", "disabled"),
-        Output("store-progress", "data"),
-        Input("store-upload-started", "data"),
-        Input("store-upload-status", "data"),
-        Input("progress-interval", "n_intervals"),
-        State("store-progress", "data"),
-        prevent_initial_call=True
-    )
-    def animate_progress(started, status, ticks, prog):
-        if started and status != "ready":
-            return False, min(90, (prog or 0) + 6)
-        if status == "ready":
-            return True, 100
-        return no_update, min(95, (prog or 0) + 2)
-
     @app.callback(Output("progress-inner", "style"), Input("store-progress", "data"))
     def set_progress_style(p):
         return {
@@ -166,11 +138,9 @@ def register_callbacks(app):
 
     @app.callback(
         Output("uploaded-filename", "children"),
-        Output("store-upload-status", "data"),
-        Output("store-features", "data"),
+        Output("store-job", "data"),
         Output("store-email", "data"),
         Output("store-filename", "data"),
-        Output("store-filekind", "data"),
         Input("upload-data", "contents"),
         State("upload-data", "filename"),
         State("email-input", "value"),
@@ -178,24 +148,46 @@ def register_callbacks(app):
     )
     def handle_upload(contents, filename, email_value):
         if not contents or not filename:
-            return "", "idle", [], (email_value or ""), (filename or ""), ""
-
-        text = parse_contents(contents)
-        fname = (filename or "").lower()
-        _ = hashlib.md5(text.encode("utf-8", "ignore")).hexdigest()
-
-        if is_genbank(fname):
-            detected = detect_annotator_from_text(text)
-            feats = parse_genbank_features(text)
-            kind = f"GenBank ({(detected or 'unknown').upper()})"
-        elif is_protein_fasta(fname):
-            feats = parse_protein_fasta_features(text)
-            kind = "Protein FASTA (.faa)"
-        else:
-            return "❌ Unsupported file type.", "idle", [], (email_value or ""), filename, ""
-
-        msg = f"✅ Uploaded File: {filename} — Parsed ~{len(feats)} features [{kind}]"
-        return msg, "ready", feats, (email_value or ""), filename, kind
+            return "", None, (email_value or ""), (filename or "")
+        # parse -> detect -> score runs as a background job; this request returns now
+        job_id = submit_upload(contents, filename, genome_name=filename)
+        return f"⏳ Uploaded File: {filename} — queued for analysis", {"id": job_id}, (email_value or ""), filename
+
+    @app.callback(
+        Output("store-progress", "data"),
+        Output("progress-interval", "disabled"),
+        Output("store-upload-status", "data"),
+        Output("store-features", "data"),
+        Output("store-bundle", "data"),
+        Output("store-filekind", "data"),
+        Output("uploaded-filename", "children", allow_duplicate=True),
+        Input("store-job", "data"),
+        Input("progress-interval", "n_intervals"),
+        State("store-filename", "data"),
+        State("store-upload-status", "data"),
+        State("store-bundle", "data"),
+        prevent_initial_call=True
+    )
+    def poll_job(job, ticks, filename, status, current):
+        """Reads the job's state file; only changed values go back to the browser."""
+        st = read_state((job or {}).get("id", ""))
+        if st is None:
+            return 0, True, "idle", [], None, "", ("❌ Analysis job not found, please upload again." if job else "")
+        pct = int(round(100 * float(st.get("progress") or 0)))
+        if st["status"] == "done":
+            res = st["result"]
+            # skip only if these results are already on screen: a re-upload of an earlier
+            # file reuses its finished job and must still replace the current genome
+            if status == "ready" and (current or {}).get("id") == res["bundle"]["id"]:
+                return 100, True, no_update, no_update, no_update, no_update, no_update
+            msg = f"✅ Uploaded File: {filename} — Parsed ~{res['n_features']} features [{res['kind']}]"
+            return 100, True, "ready", res["features"], res["bundle"], res["kind"], msg
+        if st["status"] == "error":
+            return 0, True, "idle", [], None, "", f"❌ {st.get('message') or 'Analysis failed.'}"
+        msg = f"⏳ {filename}: {st.get('message') or 'Queued'} ({pct}%)"
+        fresh = status == "ready"  # a new upload replaces the previous results
+        return (pct, False, ("running" if status != "running" else no_update),
+                ([] if fresh else no_update), (None if fresh else no_update), no_update, msg)
 
     @app.callback(
         Output("router", "href"),
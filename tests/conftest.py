@@ -0,0 +1,6 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+# the app is run from the repo root (no package install); make `utils` importable the same way
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
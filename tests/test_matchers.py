@@ -0,0 +1,101 @@
+# tests/test_matchers.py
+import pickle
+import random
+
+from utils.features import as_feature_table
+from utils.matchers import ECTrie, KeywordAutomaton, ec_levels, ec_prefix_match
+from utils.scoring import match_tiers
+
+# ---------------- KeywordAutomaton ----------------
+def _brute_force(keywords, text):
+    return frozenset(payload for kw, payload in keywords if kw and kw in text)
+
+def test_automaton_matches_brute_force_substring_search():
+    rng = random.Random(15)
+    for _ in range(200):
+        # a tiny alphabet makes overlapping and nested keywords common
+        keywords = [("".join(rng.choice("abc") for _ in range(rng.randint(1, 5))), rng.randint(0, 9))
+                    for _ in range(rng.randint(1, 12))]
+        ac = KeywordAutomaton(keywords)
+        for _ in range(10):
+            text = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 30)))
+            assert ac.find(text) == _brute_force(keywords, text), (keywords, text)
+
+def test_automaton_overlaps_suffixes_and_shared_keywords():
+    ac = KeywordAutomaton([("he", 1), ("she", 2), ("his", 3), ("hers", 4), ("he", 5), ("", 6)])
+    assert ac.n_keywords == 5  # the empty keyword is ignored
+    assert ac.find("ushers") == {1, 2, 4, 5}
+    assert ac.find("this") == {3}
+    assert ac.find("") == frozenset()
+    assert ac.find("xyz") == frozenset()
+
+def test_automaton_on_product_keywords():
+    keywords = [("beta-galactosidase", ("DairyAdaptation", "Lactose")),
+                ("galactosidase", ("DairyAdaptation", "Galactose")),
+                ("lantibiotic", ("Antibacterial", "Bacteriocins"))]
+    ac = KeywordAutomaton(keywords)
+    for text in ("putative beta-galactosidase lacz", "alpha-galactosidase", "lantibiotic dehydratase", "nisin"):
+        assert ac.find(text) == _brute_force(keywords, text)
+
+def test_automaton_survives_pickling():
+    ac = KeywordAutomaton([("abc", "x"), ("bc", "y")])
+    again = pickle.loads(pickle.dumps(ac))
+    assert again.find("zabcz") == {"x", "y"} and again.n_keywords == 2
+
+# ---------------- EC numbers ----------------
+EC_PATTERNS = [("3.2.1.23", "lacZ"), ("3.2.1.2", "amylase"), ("3.4.-.-", "peptidases"),
+               ("3.2.1.-", "glycosidases"), ("EC:1.1.1.1", "adh"), ("-.-.-.-", "nothing")]
+
+def _trie():
+    return ECTrie(EC_PATTERNS)
+
+def test_ec_levels():
+    assert ec_levels("3.2.1.23") == ("3", "2", "1", "23")
+    assert ec_levels("EC:3.2.-.-") == ("3", "2")
+    assert ec_levels(" 3.2.1 ") == ("3", "2", "1")
+    assert ec_levels("-.-.-.-") == ()
+
+def test_ec_exact_match():
+    assert _trie().find("1.1.1.1") == {"adh"}
+    assert _trie().find("3.2.1.2") == {"amylase", "glycosidases"}
+
+def test_ec_sibling_number_is_not_a_match():
+    # "3.2.1.2" used to match "3.2.1.23" as a substring; levels are compared whole now
+    assert "amylase" not in _trie().find("3.2.1.23")
+    assert "lacZ" not in _trie().find("3.2.1.2")
+    assert not ec_prefix_match("3.2.1.23", ["3.2.1.2"])
+    assert not ec_prefix_match("1.1.1.10", ["1.1.1.1"])
+
+def test_ec_partial_pattern_is_a_prefix():
+    assert _trie().find("3.4.21.96") == {"peptidases"}
+    assert _trie().find("3.5.2.6") == frozenset()
+    assert ec_prefix_match("3.4.21.96", ["3.4"])
+
+def test_ec_dash_is_a_wildcard():
+    assert _trie().find("3.2.1.23") == {"lacZ", "glycosidases"}
+    assert _trie().find("3.2.1.99") == {"glycosidases"}
+    assert _trie().find("3.2.2.1") == frozenset()
+    assert ec_prefix_match("3.2.1.99", ["3.2.1.-"])
+    # an all-dash pattern says nothing and matches nothing
+    assert _trie().n_patterns == len(EC_PATTERNS) - 1
+    assert not ec_prefix_match("3.2.1.1", ["-.-.-.-"])
+
+def test_ec_multi_valued_feature_field():
+    assert _trie().find("2.7.7.7; 3.4.21.96,1.1.1.1") == {"peptidases", "adh"}
+    assert ec_prefix_match("2.7.7.7;3.2.1.23", ["3.2.1.23"])
+
+def test_ec_trie_matches_reference_form():
+    rng = random.Random(16)
+    level = lambda: rng.choice(["1", "2", "3", "12", "-"])
+    patterns = [(".".join(level() for _ in range(4)), i) for i in range(40)]
+    trie = ECTrie(patterns)
+    for _ in range(300):
+        value = ";".join(".".join(rng.choice(["1", "2", "3", "12", "23"]) for _ in range(4))
+                         for _ in range(rng.randint(1, 3)))
+        expected = {i for p, i in patterns if ec_prefix_match(value, [p])}
+        assert trie.find(value) == expected, value
+
+def test_ec_semantics_in_trait_matching():
+    entry = {"genes": [], "product_keywords": [], "KO": [], "EC": ["3.2.1.2", "3.4.-.-"]}
+    features = [{"gene": "", "product": "", "KO": "", "EC": ec} for ec in ("3.2.1.23", "3.2.1.2", "3.4.11.2")]
+    assert list(match_tiers(as_feature_table(features), entry)) == ["", "ec", "ec"]
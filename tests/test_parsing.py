@@ -0,0 +1,36 @@
+# tests/test_parsing.py
+import gzip
+from pathlib import Path
+
+from utils.parsing import parse_bytes, parse_genbank_features, parse_genbank_features_seqio
+
+FIXTURE = Path(__file__).parent / "data" / "parity.gbk"
+
+def _text():
+    return FIXTURE.read_text()
+
+def test_streaming_parser_matches_seqio():
+    text = _text()
+    fast, ref = parse_genbank_features(text), parse_genbank_features_seqio(text)
+    assert len(ref) == 5  # nisA gene + 4 CDS (incl. complement, join and origin-spanning)
+    assert fast == ref
+
+def test_multi_ec_and_db_xref_qualifiers():
+    nisA = next(f for f in parse_genbank_features(_text()) if f["locus_tag"] == "PFX_00001" and f["EC"])
+    assert nisA["EC"] == "3.4.21.-;3.4.21.96"  # every EC_number, duplicates dropped
+    assert nisA["KO"] == "K20480"
+    assert nisA["xrefs"] == "KO:K20480;UNIPROT:P13068;GO:0050830"
+    assert nisA["product"] == "lantibiotic nisin A precursor with a deliberately long product name that wraps onto the next line"
+    assert nisA["translation"] == "MSTKDFNLDLVSVSKKDSGASPRITSISLCTPGCKTGALMGCNMKTATCHCSIHVSK"
+
+    abc = next(f for f in parse_genbank_features(_text()) if f["locus_tag"] == "PFX_00002")
+    assert abc["KO"] == "K01990;K09687"
+    assert abc["strand"] == -1 and (abc["start"], abc["end"]) == (399, 660)
+
+def test_upload_path_matches_seqio():
+    data = FIXTURE.read_bytes()
+    ref = parse_genbank_features_seqio(data.decode())
+    for name, payload in (("a.gbk", data), ("a.gbk.gz", gzip.compress(data))):
+        parsed = parse_bytes(payload, name)
+        assert parsed["format"] == "genbank" and not parsed["error"]
+        assert parsed["features"] == ref
@@ -0,0 +1,171 @@
+# tests/test_result_cache.py
+import os, socket, socketserver, stat, threading, time
+
+import pytest
+
+from utils import result_cache
+from utils.result_cache import NullCache, SQLiteCache, make_backend, private_dir
+
+class _Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = _Clock()
+    monkeypatch.setattr(result_cache, "time", c)
+    return c
+
+# ---------------- SQLite ----------------
+def test_sqlite_roundtrip_and_ttl(tmp_path, clock):
+    cache = SQLiteCache(tmp_path / "r.sqlite", ttl_s=60, max_bytes=1 << 20)
+    cache.set("a", {"x": [1, 2, 3]})
+    cache.set_many({"b": "bee", "c": 3})
+    assert cache.get("a") == {"x": [1, 2, 3]}
+    assert cache.get_many(["a", "b", "c", "missing"]) == {"a": {"x": [1, 2, 3]}, "b": "bee", "c": 3}
+
+    clock.now += 59
+    assert cache.get("b") == "bee"
+    clock.now += 2  # past the TTL
+    assert cache.get("b") is None
+    assert cache.get_many(["a", "b", "c"]) == {}
+
+def test_sqlite_size_eviction_drops_least_recently_read(tmp_path, clock):
+    blob = b"x" * 1000
+    cache = SQLiteCache(tmp_path / "r.sqlite", ttl_s=3600, max_bytes=3500)
+    for k in ("a", "b", "c"):
+        cache.set(k, blob)
+        clock.now += 1
+    assert cache.get("a") == blob  # "a" is now the most recently read
+    clock.now += 1
+    cache.set("d", blob)  # 4 x ~1 KB > 3.5 KB: one entry has to go
+    assert cache.get("b") is None
+    assert {k for k in "acd" if cache.get(k) is not None} == set("acd")
+    assert cache.stats()["bytes"] <= 3500
+
+def test_sqlite_shared_between_instances(tmp_path):
+    path = tmp_path / "r.sqlite"
+    SQLiteCache(path, ttl_s=60, max_bytes=1 << 20).set("k", [1])
+    assert SQLiteCache(path, ttl_s=60, max_bytes=1 << 20).get("k") == [1]
+
+def test_make_backend_selection(tmp_path):
+    assert type(make_backend("off")) is NullCache
+    assert isinstance(make_backend(f"sqlite:///{tmp_path / 'x.sqlite'}"), SQLiteCache)
+
+def test_private_dir_is_owner_only(tmp_path):
+    d = private_dir(tmp_path / "a" / "b")
+    assert stat.S_IMODE(d.stat().st_mode) == 0o700
+    loose = tmp_path / "loose"
+    loose.mkdir(mode=0o777)
+    os.chmod(loose, 0o777)
+    assert stat.S_IMODE(private_dir(loose).stat().st_mode) == 0o700
+
+def test_private_dir_refuses_a_symlink(tmp_path):
+    (tmp_path / "real").mkdir()
+    (tmp_path / "link").symlink_to(tmp_path / "real")
+    with pytest.raises(PermissionError):
+        private_dir(tmp_path / "link")
+
+@pytest.mark.skipif(not hasattr(os, "getuid") or os.getuid() != 0, reason="needs root to chown")
+def test_default_sqlite_cache_refuses_a_foreign_dir(tmp_path, monkeypatch):
+    foreign = tmp_path / "dairybiocontrol"
+    foreign.mkdir()
+    os.chown(foreign, 12345, 12345)
+    monkeypatch.setattr(result_cache, "DEFAULT_SQLITE_PATH", foreign / "results.sqlite")
+    with pytest.warns(UserWarning, match="disabled"):
+        assert type(make_backend("")) is NullCache
+    assert not (foreign / "results.sqlite").exists()
+
+# ---------------- Redis protocol (local stub server) ----------------
+class _RespHandler(socketserver.StreamRequestHandler):
+    """Just enough of the Redis protocol for RedisCache: HELLO, GET, MGET, SET [EX n], INFO; anything else is +OK."""
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        assert line[:1] == b"*"
+        args = []
+        for _ in range(int(line[1:])):
+            n = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(n + 2)[:-2])
+        return args
+
+    def _bulk(self, value):
+        if value is None:  # the null bulk string differs between RESP2 and RESP3
+            return b"_\r\n" if self.proto == 3 else b"$-1\r\n"
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def _lookup(self, key):
+        item = self.server.data.get(key)
+        if item is None or (item[1] is not None and item[1] <= time.time()):
+            return None
+        return item[0]
+
+    def handle(self):
+        self.proto = 2
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            cmd = args[0].upper()
+            self.server.commands.append([cmd] + args[1:])
+            if cmd == b"GET":
+                out = self._bulk(self._lookup(args[1]))
+            elif cmd == b"MGET":
+                out = b"*%d\r\n" % (len(args) - 1) + b"".join(self._bulk(self._lookup(k)) for k in args[1:])
+            elif cmd == b"SET":
+                ex = int(args[args.index(b"EX") + 1]) if b"EX" in args else None
+                self.server.data[args[1]] = (args[2], time.time() + ex if ex is not None else None)
+                out = b"+OK\r\n"
+            elif cmd == b"HELLO":  # redis-py >= 5 negotiates RESP3
+                self.proto = int(args[1]) if len(args) > 1 else 2
+                out = b"%%2\r\n$6\r\nserver\r\n$5\r\nredis\r\n$5\r\nproto\r\n:%d\r\n" % self.proto
+            elif cmd == b"INFO":
+                out = self._bulk(b"# Memory\r\nused_memory:1024\r\nmaxmemory_policy:allkeys-lru\r\n")
+            else:
+                out = b"+OK\r\n"
+            self.wfile.write(out)
+
+@pytest.fixture
+def resp_server():
+    pytest.importorskip("redis")
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _RespHandler)
+    server.daemon_threads = True
+    server.data, server.commands = {}, []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_redis_roundtrip_with_ttl(resp_server):
+    host, port = resp_server.server_address
+    cache = make_backend(f"redis://{host}:{port}/0")
+    assert cache.name == "redis"
+    cache.set("a", {"x": 1})
+    cache.set_many({"b": [2], "c": "three"})
+    assert cache.get("a") == {"x": 1}
+    assert cache.get_many(["a", "b", "c", "missing"]) == {"a": {"x": 1}, "b": [2], "c": "three"}
+    # keys are prefixed and written with SET ... EX <ttl>
+    sets = [c for c in resp_server.commands if c[0] == b"SET"]
+    assert {c[1] for c in sets} == {b"dbc:a", b"dbc:b", b"dbc:c"}
+    assert all(c[c.index(b"EX") + 1] == str(cache.ttl_s).encode() for c in sets)
+    assert cache.stats()["maxmemory_policy"] == "allkeys-lru"
+
+def test_redis_expired_entry_is_a_miss(resp_server):
+    host, port = resp_server.server_address
+    cache = make_backend(f"redis://{host}:{port}/0")
+    cache.set("k", 1)
+    resp_server.data[b"dbc:k"] = (resp_server.data[b"dbc:k"][0], time.time() - 1)  # expire it server-side
+    assert cache.get("k") is None
+
+def test_redis_unreachable_is_best_effort():
+    pytest.importorskip("redis")
+    with socket.socket() as s:  # a port nothing listens on
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    cache = make_backend(f"redis://127.0.0.1:{port}/0")
+    cache.set("k", 1)
+    assert cache.get("k") is None
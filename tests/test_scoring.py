@@ -0,0 +1,67 @@
+# tests/test_scoring.py
+import numpy as np
+import pytest
+
+from utils.features import as_feature_table
+from utils.scoring import compute_mc_intervals, compute_ppri_counts, get_trait_entry, match_tiers, norm01
+
+DB = {
+    "DairyAdaptation": {"Subcategories": {
+        "Lactose utilization": {"genes": ["lacZ", "lacY"], "product_keywords": ["beta-galactosidase"], "KO": ["K01190"], "EC": ["3.2.1.23"]},
+        "Proteolysis": {"genes": ["prtP"], "product_keywords": ["oligopeptide"], "KO": [], "EC": ["3.4.-.-"]}}},
+    "Antibacterial": {"Subcategories": {"Bacteriocins": {"genes": ["nisA"], "product_keywords": ["lantibiotic"], "KO": ["K20480"], "EC": []}}},
+    "Antifungal": {"Subcategories": {"Chitinases": {"genes": ["chiA"], "product_keywords": ["chitinase"], "KO": [], "EC": ["3.2.1.14"]}}},
+    "Safety": {"Subcategories": {"ARGs": {"genes": ["tetM"], "product_keywords": [], "KO": [], "EC": []}}},
+}
+FEATURES = [
+    {"gene": "lacZ", "product": "beta-galactosidase", "KO": "K01190", "EC": "3.2.1.23"},
+    {"gene": "", "product": "putative beta-galactosidase", "KO": "", "EC": ""},
+    {"gene": "", "product": "hypothetical protein", "KO": "K01190", "EC": ""},
+    {"gene": "", "product": "", "KO": "", "EC": "3.2.1.23"},
+    {"gene": "", "product": "oligopeptide ABC transporter", "KO": "", "EC": "3.4.21.96"},
+    {"gene": "nisA", "product": "nisin", "KO": "", "EC": ""},
+    {"gene": "", "product": "lantibiotic dehydratase", "KO": "K20480", "EC": ""},
+    {"gene": "", "product": "", "KO": "", "EC": "3.2.1.14"},
+    {"gene": "tetM", "product": "tetracycline resistance", "KO": "", "EC": ""},
+]
+
+def _reference(db, features, n, seed):
+    """compute_mc_intervals as it was before vectorising: weights drawn per iteration."""
+    features = as_feature_table(features)
+    rng = np.random.default_rng(seed)
+    cats = ["DairyAdaptation", "Antibacterial", "Antifungal"]
+    sims = {c: [] for c in cats}; sims["BPI"] = []
+    for _ in range(n):
+        w = {"gene": rng.uniform(0.9, 1.0), "product": rng.uniform(0.5, 0.7),
+             "ko": rng.uniform(0.5, 0.7), "ec": rng.uniform(0.5, 0.7), "context": rng.uniform(0.2, 0.4)}
+        S = {}
+        for c in cats:
+            s = 0.0
+            for trait in db[c]["Subcategories"]:
+                E = sum(w.get(str(t), w["context"]) for t in match_tiers(features, get_trait_entry(db, c, trait)) if t)
+                s += norm01(E, k=0.8)
+            S[c] = s
+            sims[c].append(s)
+        ppri = compute_ppri_counts(db, features)
+        risk = ppri["ARGs"] + ppri["VFs"] + ppri["PGs"]
+        sims["BPI"].append(sum(S.values()) / (1.0 + risk / (risk + 5.0)))
+    return {k: tuple(float(x) for x in np.percentile(v, [2.5, 97.5])) for k, v in sims.items()}
+
+# seed 7, n=200 on the tables above
+PINNED = {
+    "DairyAdaptation": (1.204047513557338, 1.3245660903259353),
+    "Antibacterial": (0.683015923023135, 0.7375949218402791),
+    "Antifungal": (0.33330558095565943, 0.42534350885993283),
+    "BPI": (1.916094973450297, 2.1086380211338147),
+}
+
+def test_mc_intervals_are_pinned_for_a_fixed_seed():
+    ci = compute_mc_intervals(DB, FEATURES, n=200, seed=7)
+    assert ci.keys() == PINNED.keys()
+    for k, (lo, hi) in PINNED.items():
+        assert ci[k] == pytest.approx((lo, hi), rel=1e-12, abs=0)
+    assert compute_mc_intervals(DB, FEATURES, n=200, seed=7) == ci
+    assert compute_mc_intervals(DB, FEATURES, n=200, seed=8) != ci
+
+def test_mc_intervals_match_the_per_iteration_model():
+    assert compute_mc_intervals(DB, FEATURES, n=50, seed=13) == _reference(DB, FEATURES, 50, 13)
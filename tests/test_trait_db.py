@@ -0,0 +1,105 @@
+# tests/test_trait_db.py
+from pathlib import Path
+
+import pytest
+
+from utils import trait_db
+
+FIXTURES = Path(__file__).parent / "data" / "trait_db"
+
+@pytest.fixture
+def fixture_tables(monkeypatch):
+    """Point the builders at the small tables in tests/data/trait_db (VFs is a .tsv fallback)."""
+    for attr, name in (("ARGS_PATH", "ARGs_db.csv"), ("VFS_PATH", "VFs_db.csv"), ("TA_PATH", "TA_db.csv"),
+                       ("ADAPT_CSV", "adaptation_db.csv"), ("ANTIBACT_CSV", "antibacterial_db.csv"),
+                       ("ANTIFUNG_CSV", "antifungal_db.csv")):
+        monkeypatch.setattr(trait_db, attr, FIXTURES / name)
+
+EXPECTED = {
+    "Safety": {"Subcategories": {
+        "ARGs": {"genes": ["blatem", "tetm", "vana"],
+                 # "hypothetical protein" is generic and dropped
+                 "product_keywords": ["beta-lactamase tem", "d-alanine--d-lactate ligase vana",
+                                      "tetracycline resistance protein tetm"],
+                 "KO": ["K18220", "K18698"], "EC": ["3.5.2.6", "6.1.2.1", "6.3.2.-"], "xrefs": []},
+        "Virulence Factors": {"genes": ["cyla", "hlya"], "product_keywords": ["hemolysin a"],
+                              "KO": [], "EC": [], "xrefs": ["COG:COG2931"]},
+        "Toxin-Antitoxin": {"genes": ["maze", "mazf"],
+                            "product_keywords": ["antitoxin maze", "mrna interferase toxin mazf"],
+                            "KO": [], "EC": [], "xrefs": []},
+    }},
+    "DairyAdaptation": {
+        "Subcategories": {
+            "Lactose utilization": {
+                "genes": ["lacy", "lacz"],
+                "product_keywords": ["beta-galactosidase", "beta-galactosidase lacz", "lactose permease"],
+                "KO": ["K01190", "K02532"], "EC": ["3.2.1.-", "3.2.1.23"], "xrefs": [],
+                # a repeated gene keeps the tier of its last row
+                "tiers": {"lacz": "contextual", "lacy": "supportive"},
+                "id_tiers": {"KO:K01190": "core", "KO:K02532": "supportive"}},
+            "Proteolysis": {
+                "genes": ["oppa", "pepn", "prtp"],
+                "product_keywords": ["aminopeptidase n", "cell envelope proteinase prtp",
+                                     "oligopeptide-binding protein oppa"],
+                "KO": ["K15580"], "EC": ["3.4.11.2", "3.4.21.96"], "xrefs": [],
+                # tiers are lower-cased; a blank or unknown tier is "supportive"
+                "tiers": {"prtp": "core", "oppa": "supportive", "pepn": "supportive"},
+                "id_tiers": {"KO:K15580": "supportive"}},
+        },  # the row without a Category (xylA) is dropped
+        "Cap": 5.0,
+        "CapList": [1.0, 1.0, 0.6, 0.6, 0.6, 0.3]},
+    "Antibacterial": {
+        "Subcategories": {
+            "Bacteriocins": {
+                # a blank Gene cell reads as "nan", as it always has
+                "genes": ["nan", "nisa", "nisb", "pln"],
+                "product_keywords": ["bacteriocin immunity protein", "lantibiotic dehydratase nisb",
+                                     "nisin structural peptide lantibiotic core"],
+                "KO": [], "EC": [], "xrefs": ["PFAM:PF02052", "PFAM:PF04738"],
+                "tiers": {"nisa": "core", "nisb": "supportive", "nan": "contextual", "pln": "core"},
+                "id_tiers": {"PFAM:PF02052": "core", "PFAM:PF04738": "supportive"}},
+        },
+        "Cap": 4.0,
+        "CapList": [1.0, 1.0, 0.6, 0.3]},
+    "Antifungal": {
+        "Subcategories": {
+            "Chitinases": {"genes": ["chia"], "product_keywords": ["chitinase a"], "KO": [], "EC": [],
+                           "xrefs": [], "tiers": {"chia": "supportive"}, "id_tiers": {}},
+            "Lipopeptides": {"genes": ["itua", "itud"],
+                             "product_keywords": ["malonyl-coa transacylase", "nrps core assembly"],
+                             "KO": [], "EC": [], "xrefs": [], "tiers": {"itud": "core", "itua": "core"},
+                             "id_tiers": {}},
+        },
+        "Cap": 3.0,
+        "CapList": [1.0, 1.0, 0.6]},
+}
+
+def _ordered(x):
+    """Nested dicts as (key, value) lists, so key order is compared as well."""
+    if isinstance(x, dict):
+        return [(k, _ordered(v)) for k, v in x.items()]
+    return [_ordered(v) for v in x] if isinstance(x, list) else x
+
+def test_load_trait_db_matches_expected(fixture_tables):
+    db = trait_db.load_trait_db(use_snapshot=False)
+    assert db[trait_db.VERSION_KEY] == trait_db.source_signature()[:16]
+    body = {k: v for k, v in db.items() if k not in (trait_db.INDEX_KEY, trait_db.VERSION_KEY)}
+    assert body == EXPECTED
+    # tiers keep first-seen gene order and CapList is sorted by weight
+    assert _ordered(body) == _ordered(EXPECTED)
+
+def test_compiled_index_weights(fixture_tables):
+    idx = trait_db.load_trait_db(use_snapshot=False)[trait_db.INDEX_KEY]
+    assert idx["traits"]["DairyAdaptation"] == ["Lactose utilization", "Proteolysis"]
+    assert idx["gene"]["lacz"] == [("DairyAdaptation", "Lactose utilization", 0.3)]
+    assert idx["gene"]["tetm"] == [("Safety", "ARGs", 1.0)]
+    assert idx["product"]["chitinase a"] == [("Antifungal", "Chitinases", trait_db.PRODUCT_MATCH_WEIGHT)]
+    assert idx["ids"]["KO"]["K01190"] == [("DairyAdaptation", "Lactose utilization", 1.0)]
+    assert idx["ids"]["PFAM"]["PF04738"] == [("Antibacterial", "Bacteriocins", 0.6)]
+
+def test_snapshot_round_trip(fixture_tables, tmp_path):
+    path = tmp_path / "trait_db.snapshot.pkl"
+    built = trait_db.build_snapshot(path)
+    loaded = trait_db._read_snapshot(trait_db.source_signature(), path)
+    assert loaded == built
+    assert trait_db._read_snapshot("stale", path) is None
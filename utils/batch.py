@@ -0,0 +1,350 @@
+# utils/batch.py
+from __future__ import annotations
+
+import hashlib, os, tarfile, threading, zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path, PurePosixPath
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.features import FeatureTable
+from utils.parsing import DECOMPRESS_CHUNK, is_genbank, is_protein_fasta, parse_file, strip_compression_ext
+from utils.result_cache import cache_key, get_result_cache
+from utils.score_engine import match_matrices, scores_frame
+
+# Batch mode: many genomes (files or archives, expanded to disk under a
+# per-file and a per-batch size cap) -> parsed in a process pool ->
+# detection against the one compiled trait index -> a sparse genome × trait
+# count matrix plus per-genome composite scores.
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "0") or 0) or min(4, os.cpu_count() or 1)
+BATCH_MAX_GENOMES = int(os.environ.get("BATCH_MAX_GENOMES", "200"))
+BATCH_MAX_FILE_MB = float(os.environ.get("BATCH_MAX_FILE_MB", "256"))  # per genome file, as stored
+BATCH_MAX_TOTAL_MB = float(os.environ.get("BATCH_MAX_TOTAL_MB", "2048"))  # all genome files of one batch
+
+_ARCHIVE_EXT = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+# ---------------- Inputs ----------------
+def is_archive(fn: str) -> bool:
+    return (fn or "").lower().endswith(_ARCHIVE_EXT)
+
+def is_genome_file(fn: str) -> bool:
+    fn = (fn or "").lower()
+    return is_genbank(fn) or is_protein_fasta(fn)
+
+def _too_big(name: str, max_bytes: int) -> str:
+    return f"{name} (larger than {max_bytes / 2**20:.0f} MB)"
+
+def _over_total(name: str) -> str:
+    return f"{name} and later files (the batch is over {BATCH_MAX_TOTAL_MB:.0f} MB)"
+
+def _copy_capped(fh, dest: Path, limit: int) -> Optional[int]:
+    """Copy fh to dest in DECOMPRESS_CHUNK blocks; None (and no file) once it runs past limit bytes."""
+    n = 0
+    with open(dest, "wb") as out:
+        while n <= limit:
+            block = fh.read(min(DECOMPRESS_CHUNK, limit + 1 - n))
+            if not block:
+                return n
+            n += len(block)
+            if n <= limit:
+                out.write(block)
+    dest.unlink(missing_ok=True)
+    return None
+
+def expand_archive(filename: str, path: Path, max_files: int = BATCH_MAX_GENOMES,
+                   max_bytes: Optional[int] = None,
+                   budget: Optional[List[int]] = None) -> Tuple[List[Tuple[str, Path]], List[str]]:
+    """
+    GenBank/FASTA members of the zip or tar(.gz/.bz2/.xz) archive at path,
+    extracted next to it: ([(name, member path), ...], skipped). Reading
+    stops after max_files genomes or once budget[0] (bytes left for the
+    whole batch, charged here; -1 when it ran out) is spent. Members over
+    max_bytes are skipped.
+    """
+    max_bytes = int(max_bytes or BATCH_MAX_FILE_MB * 2**20)
+    budget = budget if budget is not None else [int(BATCH_MAX_TOTAL_MB * 2**20)]
+    out: List[Tuple[str, Path]] = []
+    skipped: List[str] = []
+
+    def over_total(name: str) -> bool:
+        skipped.append(_over_total(name))
+        budget[0] = -1  # spent: the caller stops reading as well
+        return False
+
+    def take(name: str, size: int, open_member: Callable[[], Any]) -> bool:
+        """Extract one member; False once the batch budget is spent."""
+        if size > max_bytes:  # declared size; the copy below does not trust it
+            skipped.append(_too_big(name, max_bytes))
+            return True
+        if size > budget[0]:
+            return over_total(name)
+        limit = min(max_bytes, budget[0])
+        dest = path.with_name(f"{path.name}.{len(out):05d}")
+        with open_member() as fh:
+            n = _copy_capped(fh, dest, limit)
+        if n is None:
+            if limit < max_bytes:
+                return over_total(name)
+            skipped.append(_too_big(name, max_bytes))
+            return True
+        budget[0] -= n
+        out.append((name, dest))
+        return True
+
+    if filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                name = PurePosixPath(info.filename).name
+                if info.is_dir() or name.startswith(".") or not is_genome_file(name):
+                    continue
+                if len(out) >= max_files:
+                    skipped.append(f"{filename}: genomes after the first {max_files} were not read")
+                    break
+                if not take(name, info.file_size, lambda: zf.open(info)):
+                    break
+    else:
+        with tarfile.open(path, mode="r:*") as tf:
+            for member in tf:
+                name = PurePosixPath(member.name).name
+                if not member.isfile() or name.startswith(".") or not is_genome_file(name):
+                    continue
+                if len(out) >= max_files:
+                    skipped.append(f"{filename}: genomes after the first {max_files} were not read")
+                    break
+                if not take(name, member.size, lambda: tf.extractfile(member)):
+                    break
+    return out, skipped
+
+def expand_files(items: Iterable[Tuple[str, Path]],
+                 max_files: int = BATCH_MAX_GENOMES) -> Tuple[List[Tuple[str, Path]], List[str]]:
+    """
+    (filename, path) uploads on disk -> ([(filename, path), ...], skipped).
+    Archives are extracted next to their file; anything that is not
+    GenBank/FASTA is skipped. Items are consumed lazily and reading stops at
+    max_files genomes or BATCH_MAX_TOTAL_MB of genome files in all.
+    """
+    max_bytes = int(BATCH_MAX_FILE_MB * 2**20)
+    budget = [int(BATCH_MAX_TOTAL_MB * 2**20)]
+    files: List[Tuple[str, Path]] = []
+    skipped: List[str] = []
+    for fn, path in items:
+        fn, path = fn or "", Path(path)
+        if len(files) >= max_files:
+            skipped.append(f"genomes after the first {max_files} were not read")
+            break
+        if is_archive(fn):
+            try:
+                got, skip = expand_archive(fn, path, max_files - len(files), max_bytes, budget)
+                files.extend(got); skipped.extend(skip)
+            except (zipfile.BadZipFile, tarfile.TarError, OSError, EOFError) as e:
+                skipped.append(f"{fn} ({e})")
+            if budget[0] < 0:
+                break
+            continue
+        size = path.stat().st_size
+        if not is_genome_file(fn):
+            skipped.append(fn)
+        elif size > max_bytes:
+            skipped.append(_too_big(fn, max_bytes))
+        elif size > budget[0]:
+            skipped.append(_over_total(fn))
+            break
+        else:
+            budget[0] -= size
+            files.append((fn, path))
+    return files, skipped
+
+# ---------------- Parsing (process pool) ----------------
+def _parse_one(item: Tuple[str, Path]) -> Dict[str, Any]:
+    """Worker: one file on disk -> {"file", "table", "digest", "format", "error"} (picklable)."""
+    filename, path = item
+    parsed = parse_file(path, filename)
+    err = parsed["error"] or ("" if parsed["features"] else "no features")
+    return {"file": filename, "table": FeatureTable.from_records(parsed["features"]),
+            "digest": parsed["digest"], "format": parsed["format"], "error": err}
+
+def parse_genomes(files: Sequence[Tuple[str, Path]], workers: Optional[int] = None,
+                  progress: Optional[Callable[[float], None]] = None) -> List[Dict[str, Any]]:
+    """
+    Parse files in a process pool (in order); falls back to this process if
+    no pool can be had. progress(fraction) is called as files finish.
+    """
+    def collect(results: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        out = []
+        for r in results:
+            out.append(r)
+            if progress:
+                progress(len(out) / max(1, len(files)))
+        return out
+
+    workers = max(1, min(int(workers or BATCH_WORKERS), len(files)))
+    if workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                return collect(pool.map(_parse_one, files, chunksize=1))
+        except (OSError, BrokenProcessPool, NotImplementedError):
+            pass
+    return collect(map(_parse_one, files))
+
+def genome_names(files: Iterable[str]) -> List[str]:
+    """Display names from filenames ("a.gbk.gz" -> "a"), made unique."""
+    seen: Dict[str, int] = {}
+    out = []
+    for fn in files:
+        base = PurePosixPath(fn or "genome").name
+        base = base[:len(strip_compression_ext(base))]  # keep the original case
+        base = base.rsplit(".", 1)[0] if "." in base else base
+        n = seen[base] = seen.get(base, 0) + 1
+        out.append(base if n == 1 else f"{base}#{n}")
+    return out
+
+# ---------------- Genome × trait matrix ----------------
+class GenomeTraitMatrix:
+    """
+    Sparse (COO) genome × trait count matrix: counts[k] is the Detected
+    count of trait cols[k] in genome rows[k]. Traits are (category, trait)
+    pairs in compiled-index order; zero cells are not stored.
+    """
+    __slots__ = ("genomes", "traits", "rows", "cols", "counts")
+
+    def __init__(self, genomes: List[str], traits: List[Tuple[str, str]],
+                 rows: np.ndarray, cols: np.ndarray, counts: np.ndarray):
+        self.genomes, self.traits = list(genomes), list(traits)
+        self.rows = np.asarray(rows, dtype=np.int32)
+        self.cols = np.asarray(cols, dtype=np.int32)
+        self.counts = np.asarray(counts, dtype=np.int32)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.genomes), len(self.traits)
+
+    @property
+    def nnz(self) -> int:
+        return int(self.counts.size)
+
+    def labels(self) -> List[str]:
+        return [f"{c}: {t}" for c, t in self.traits]
+
+    def to_dense(self) -> np.ndarray:
+        out = np.zeros(self.shape, dtype=np.int32)
+        out[self.rows, self.cols] = self.counts
+        return out
+
+    def to_frame(self, drop_empty: bool = False) -> pd.DataFrame:
+        """Wide genome × trait DataFrame; drop_empty keeps only traits seen in some genome."""
+        df = pd.DataFrame(self.to_dense(), index=pd.Index(self.genomes, name="Genome"), columns=self.labels())
+        if drop_empty:
+            df = df.loc[:, np.bincount(self.cols, minlength=len(self.traits)) > 0]
+        return df
+
+    def iter_frames(self, rows: int = 256) -> Iterator[pd.DataFrame]:
+        """Wide frame (Genome column first) in blocks of `rows` genomes, densified one block at a time."""
+        labels = self.labels()
+        for lo in range(0, max(1, len(self.genomes)), rows):
+            hi = min(lo + rows, len(self.genomes))
+            block = np.zeros((hi - lo, len(self.traits)), dtype=np.int32)
+            k = (self.rows >= lo) & (self.rows < hi)
+            block[self.rows[k] - lo, self.cols[k]] = self.counts[k]
+            df = pd.DataFrame(block, columns=labels)
+            df.insert(0, "Genome", self.genomes[lo:hi])
+            yield df
+
+    def to_long(self) -> pd.DataFrame:
+        """Non-zero cells only: Genome, Category, Trait, Detected."""
+        cats = np.array([c for c, _ in self.traits], dtype=object)
+        traits = np.array([t for _, t in self.traits], dtype=object)
+        return pd.DataFrame({"Genome": np.array(self.genomes, dtype=object)[self.rows],
+                             "Category": cats[self.cols], "Trait": traits[self.cols],
+                             "Detected": self.counts})
+
+def batch_detect(genomes: Sequence[Tuple[str, FeatureTable]], TRAIT_DB: Optional[Dict[str, Any]] = None,
+                 page: str = "batch", progress: Optional[Callable[[float], None]] = None) -> Dict[str, Any]:
+    """
+    Detection for every genome against the shared compiled index (through
+    the detection cache), folded into a GenomeTraitMatrix and a per-genome
+    score frame.
+    """
+    from utils.perf import cached_detect_all  # lazy import
+    from utils.trait_db import get_trait_index
+
+    index = get_trait_index(TRAIT_DB)
+    traits = [(c, t) for c, ts in index["traits"].items() for t in ts]
+    col = {k: j for j, k in enumerate(traits)}
+    names = [n for n, _ in genomes]
+    G = len(genomes)
+    rows: List[np.ndarray] = []; cols: List[np.ndarray] = []; counts: List[np.ndarray] = []
+    dets = []
+    for name, table in genomes:
+        dets.append(cached_detect_all(table, name, TRAIT_DB, page=page))
+        if progress:
+            progress(len(dets) / max(1, G))
+
+    for g, det in enumerate(dets):
+        for cat, (summary, _) in det.items():
+            if not summary.empty:
+                detected = summary["Detected"].to_numpy(dtype=np.int64)
+                keep = detected > 0
+                j = np.fromiter((col[(cat, t)] for t in summary["Trait"]), dtype=np.int64, count=len(summary))
+                rows.append(np.full(int(keep.sum()), g)); cols.append(j[keep]); counts.append(detected[keep])
+
+    cat_ = lambda xs: np.concatenate(xs) if xs else np.array([], dtype=np.int64)
+    matrix = GenomeTraitMatrix(names, traits, cat_(rows), cat_(cols), cat_(counts))
+    scores = scores_frame(names, [len(t) for _, t in genomes], np.bincount(matrix.rows, minlength=G),
+                          *match_matrices(dets), TRAIT_DB=TRAIT_DB)
+    return {"matrix": matrix, "scores": scores}
+
+# ---------------- Run + keep results ----------------
+_MAX_KEPT = 4
+_kept: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_kept_lock = threading.Lock()
+
+def batch_id(genomes: Iterable[Tuple[str, str]], db_version: str) -> str:
+    """Stable id over (display name, content digest) pairs; the names label every result row."""
+    h = hashlib.sha256(db_version.encode())
+    for name, d in genomes:
+        h.update(b"\0" + name.encode() + b"\0" + (d or "").encode())
+    return h.hexdigest()[:24]
+
+def run_batch(files: Sequence[Tuple[str, Path]], TRAIT_DB: Optional[Dict[str, Any]] = None,
+              workers: Optional[int] = None,
+              progress: Optional[Callable[[str, float], None]] = None) -> Dict[str, Any]:
+    """
+    Parse + detect + score a batch of (filename, path) files on disk.
+    Returns {"id", "matrix", "scores", "errors"}; results are kept by id for
+    the download callbacks (this process, then the shared result cache).
+    progress(stage, fraction) reports "parse"/"detect"/"score".
+    """
+    from utils.perf import _db_version  # lazy import
+
+    stage = (lambda name: (lambda f: progress(name, f))) if progress else (lambda name: None)
+    files = list(files)[:BATCH_MAX_GENOMES]
+    parsed = parse_genomes(files, workers, progress=stage("parse"))
+    ok = [p for p in parsed if len(p["table"])]
+    errors = [f"{p['file']}: {p['error']}" for p in parsed if p["error"]]
+    names = genome_names(p["file"] for p in ok)
+    res = batch_detect([(n, p["table"]) for n, p in zip(names, ok)], TRAIT_DB, progress=stage("detect"))
+    if progress:
+        progress("score", 1.0)
+    res["id"] = batch_id(((n, p["digest"]) for n, p in zip(names, ok)), _db_version(TRAIT_DB))
+    res["errors"] = errors
+    keep_batch(res)
+    return res
+
+def keep_batch(res: Dict[str, Any]) -> None:
+    with _kept_lock:
+        _kept[res["id"]] = res
+        _kept.move_to_end(res["id"])
+        while len(_kept) > _MAX_KEPT:
+            _kept.popitem(last=False)
+    get_result_cache().set(cache_key("batch", res["id"]), res)
+
+def get_batch(bid: str) -> Optional[Dict[str, Any]]:
+    if not bid:
+        return None
+    with _kept_lock:
+        res = _kept.get(bid)
+    return res if res is not None else get_result_cache().get(cache_key("batch", bid))
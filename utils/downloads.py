@@ -0,0 +1,109 @@
+# utils/downloads.py
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import pandas as pd
+from flask import Response, abort, request
+
+from utils.export import frame_chunks, iter_table_bytes, parquet_available
+
+# Download routes on the Flask server. Tables are streamed from the cached
+# result bundle (or batch result) in row chunks, so neither the worker nor
+# the Dash callback channel ever holds the whole encoded file.
+#   /download/result/<bundle id>/<category>/<summary|hits|genes>?format=
+#   /download/batch/<batch id>/<matrix|long|scores>?format=
+# Only results that are already cached are served; nothing is recomputed
+# for an anonymous GET (an expired result is a 404 asking for a re-upload).
+DOWNLOAD_FORMATS = {  # format -> (writer format, gzip, extension, mimetype)
+    "csv": ("csv", False, ".csv", "text/csv"),
+    "csv.gz": ("csv", True, ".csv.gz", "application/gzip"),
+    "parquet": ("parquet", False, ".parquet", "application/vnd.apache.parquet"),
+}
+RESULT_TABLES = ("summary", "hits", "genes")
+_ID_RE = re.compile(r"^[0-9a-f]{24}$")  # bundle_id / batch_id
+BATCH_TABLES = ("matrix", "long", "scores")
+
+def download_formats() -> List[Dict[str, str]]:
+    """Options for a format picker (Parquet only when pyarrow is installed)."""
+    opts = [{"label": "CSV", "value": "csv"}, {"label": "CSV (gzip)", "value": "csv.gz"}]
+    if parquet_available():
+        opts.append({"label": "Parquet", "value": "parquet"})
+    return opts
+
+def result_download_url(ref: Optional[Dict[str, Any]], category: str, table: str, fmt: str = "csv") -> Optional[str]:
+    """Link for one module table of a store-bundle ref; None without a ref."""
+    if not ref or not ref.get("id"):
+        return None
+    return f"/download/result/{ref['id']}/{category}/{table}?{urlencode({'format': fmt or 'csv'})}"
+
+def batch_download_url(batch: Optional[Dict[str, Any]], table: str, fmt: str = "csv") -> Optional[str]:
+    if not batch or not batch.get("id"):
+        return None
+    return f"/download/batch/{batch['id']}/{table}?{urlencode({'format': fmt or 'csv'})}"
+
+def gene_product_table(hits: pd.DataFrame) -> pd.DataFrame:
+    """Distinct Gene/Product pairs; Gene is only filled for gene-name matches (Safety export)."""
+    if hits is None or hits.empty:
+        return pd.DataFrame(columns=["Gene", "Product"])
+    gene = hits["Hit"].where(hits["Kind"].astype(str) == "gene", "")
+    return pd.DataFrame({"Gene": gene, "Product": hits["Product"].astype(str)}).drop_duplicates()
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^\w.+-]+", "_", (name or "results").split("/")[-1]).strip("_") or "results"
+
+def _format(fmt: str) -> Tuple[str, bool, str, str]:
+    spec = DOWNLOAD_FORMATS.get((fmt or "csv").lower())
+    if spec is None:
+        abort(400, f"unknown format {fmt!r}")
+    if spec[0] == "parquet" and not parquet_available():
+        abort(400, "Parquet export needs the optional `pyarrow` package")
+    return spec
+
+def _stream(frames: Iterator[pd.DataFrame], fmt: str, filename: str) -> Response:
+    writer_fmt, gz, ext, mimetype = _format(fmt)
+    return Response(iter_table_bytes(frames, writer_fmt, compress=gz), mimetype=mimetype,
+                    headers={"Content-Disposition": f'attachment; filename="{filename}{ext}"',
+                             "Cache-Control": "no-store"})
+
+def _result_frame(bundle: Dict[str, Any], category: str, table: str) -> pd.DataFrame:
+    from utils.perf import bundle_module  # lazy import
+    summary, hits = bundle_module(bundle, category)
+    if table == "summary":
+        return summary
+    return hits if table == "hits" else gene_product_table(hits)
+
+def register_download_routes(server) -> None:
+    @server.get("/download/result/<bid>/<category>/<table>")
+    def download_result(bid: str, category: str, table: str):
+        from utils.perf import get_result_bundle  # lazy import
+        if table not in RESULT_TABLES or not _ID_RE.match(bid):
+            abort(404)
+        fmt = request.args.get("format", "csv")
+        _format(fmt)  # reject a bad format before any work
+        bundle = get_result_bundle({"id": bid}, page="download", rebuild=False)
+        if bundle is None or category not in bundle["modules"]:
+            abort(404, "Result not found; please upload the file again.")
+        frame = _result_frame(bundle, category, table)
+        label = "hits" if table == "genes" else table
+        return _stream(frame_chunks(frame), fmt, f"{_safe_name(bundle['genome'])}_{category}_{label}")
+
+    @server.get("/download/batch/<bid>/<table>")
+    def download_batch(bid: str, table: str):
+        from utils.batch import get_batch  # lazy import
+        if table not in BATCH_TABLES or not _ID_RE.match(bid):
+            abort(404)
+        fmt = request.args.get("format", "csv")
+        _format(fmt)
+        res = get_batch(bid)
+        if res is None:
+            abort(404, "Batch result expired; please run the batch again.")
+        if table == "scores":
+            frames = frame_chunks(res["scores"])
+        elif table == "long":
+            frames = frame_chunks(res["matrix"].to_long())
+        else:
+            frames = res["matrix"].iter_frames()
+        return _stream(frames, fmt, f"dairybio_batch_{table}")
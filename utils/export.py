@@ -0,0 +1,185 @@
+# utils/export.py
+from __future__ import annotations
+
+import gzip
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import IO, Any, Iterable, Iterator, List, Optional, Union
+
+import pandas as pd
+
+# Append-only table writers: frames are written as they arrive (one genome
+# at a time), so nothing holds the full result set. The column order of the
+# first frame is kept for the rest of the stream.
+FORMATS = ("csv", "jsonl", "parquet")
+EXTENSIONS = {"csv": ".csv", "jsonl": ".jsonl", "parquet": ".parquet"}
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401  (optional dependency)
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+class TableWriter(ABC):
+    """Streaming writer for one table; use as a context manager or call close()."""
+    fmt = ""
+
+    def __init__(self, target: Union[str, Path, IO[bytes]], compress: bool = False):
+        self._own = isinstance(target, (str, Path))
+        raw: IO[bytes] = open(target, "wb") if self._own else target  # type: ignore[arg-type]
+        self._raw = raw
+        self._fh: IO[bytes] = gzip.GzipFile(fileobj=raw, mode="wb") if compress else raw
+        self.columns: Optional[List[str]] = None
+        self.rows = 0
+
+    def _align(self, df: pd.DataFrame) -> pd.DataFrame:
+        if self.columns is None:
+            self.columns = [str(c) for c in df.columns]
+            return df
+        return df.reindex(columns=self.columns)
+
+    def write(self, df: pd.DataFrame) -> None:
+        if df is None or df.empty:
+            return
+        df = self._align(df)
+        self._write(df)
+        self.rows += len(df)
+
+    @abstractmethod
+    def _write(self, df: pd.DataFrame) -> None:
+        ...
+
+    def write_schema(self, df: pd.DataFrame) -> None:
+        """Header/schema only, so a table with no rows still carries its columns."""
+        if self.rows == 0 and df is not None:
+            self._write(self._align(df).iloc[:0])
+
+    def close(self) -> None:
+        if self._fh is not self._raw:
+            self._fh.close()
+        if self._own:
+            self._raw.close()
+        else:
+            self._raw.flush()
+
+    def __enter__(self) -> "TableWriter":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+class CSVWriter(TableWriter):
+    fmt = "csv"
+
+    def _write(self, df: pd.DataFrame) -> None:
+        self._fh.write(df.to_csv(index=False, header=(self.rows == 0)).encode("utf-8"))
+
+class JSONLWriter(TableWriter):
+    fmt = "jsonl"
+
+    def write_schema(self, df: pd.DataFrame) -> None:
+        pass  # no header in JSON lines
+
+    def _write(self, df: pd.DataFrame) -> None:
+        self._fh.write(df.to_json(orient="records", lines=True, force_ascii=False).rstrip("\n").encode("utf-8") + b"\n")
+
+class ParquetWriter(TableWriter):
+    """One row group per write(); needs the optional `pyarrow` package."""
+    fmt = "parquet"
+
+    def __init__(self, target: Union[str, Path, IO[bytes]], compress: bool = False):
+        import pyarrow  # noqa: F401  (optional dependency; fail before opening the file)
+        super().__init__(target, compress=False)  # parquet compresses its own pages
+        self._pq = None
+        self._schema = None
+
+    def _write(self, df: pd.DataFrame) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if self._pq is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            self._schema = table.schema
+            self._pq = pq.ParquetWriter(self._fh, self._schema, compression="zstd")
+        else:
+            table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        self._pq.write_table(table)
+
+    def close(self) -> None:
+        if self._pq is not None:
+            self._pq.close()
+        super().close()
+
+_WRITERS = {"csv": CSVWriter, "jsonl": JSONLWriter, "parquet": ParquetWriter}
+
+def open_writer(target: Union[str, Path, IO[bytes]], fmt: str, compress: bool = False) -> TableWriter:
+    """fmt in FORMATS; compress gzips csv/jsonl output."""
+    fmt = (fmt or "csv").lower()
+    if fmt not in _WRITERS:
+        raise ValueError(f"unknown format {fmt!r} (expected one of {', '.join(FORMATS)})")
+    return _WRITERS[fmt](target, compress=compress)
+
+# ---------------- Streaming ----------------
+STREAM_CHUNK_ROWS = 5000
+_FLUSH_BYTES = 1 << 16
+
+class _Spool:
+    """Write-only sink that hands its bytes back out as they accumulate."""
+    closed = False
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self.pending = 0
+        self._pos = 0
+
+    def write(self, b: bytes) -> int:
+        b = bytes(b)
+        self._parts.append(b)
+        self.pending += len(b)
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def writable(self) -> bool:
+        return True
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        self.pending = 0
+        return out
+
+def frame_chunks(df: pd.DataFrame, rows: int = STREAM_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Row slices of df (views, not copies); an empty df is yielded once."""
+    if df.empty:
+        yield df
+        return
+    for i in range(0, len(df), rows):
+        yield df.iloc[i:i + rows]
+
+def iter_table_bytes(frames: Iterable[pd.DataFrame], fmt: str, compress: bool = False) -> Iterator[bytes]:
+    """
+    Encode frames as one csv/jsonl/parquet stream, yielding bytes every
+    ~64 KiB, so a download never holds the whole file.
+    """
+    sink = _Spool()
+    writer = open_writer(sink, fmt, compress=compress)  # type: ignore[arg-type]
+    first = None
+    for df in frames:
+        if first is None:
+            first = df
+        writer.write(df)
+        if sink.pending >= _FLUSH_BYTES:
+            yield sink.drain()
+    if writer.rows == 0 and first is not None:
+        writer.write_schema(first)
+    writer.close()
+    tail = sink.drain()
+    if tail:
+        yield tail
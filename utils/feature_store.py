@@ -0,0 +1,126 @@
+# utils/feature_store.py
+from __future__ import annotations
+
+import hashlib, os, pickle, re, tempfile, threading, time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from utils.features import FeatureInput, FeatureTable, as_feature_table
+from utils.result_cache import private_dir
+
+# Parsed genomes live on the server, keyed by feature_key(): the sha256 of
+# the uploaded bytes together with the format they were parsed as.
+# The browser's store-features only holds a small handle
+#   {"digest": ..., "n_features": ..., "kind": ...}
+# and every callback resolves the features from here. Files go to a
+# directory shared by all gunicorn workers on the host; a small per-process
+# LRU sits in front so repeated callbacks don't re-read the pickle.
+# The pickles are loaded back, so the folder must be this user's alone.
+_DEFAULT_STORE_DIR = Path(tempfile.gettempdir()) / "dairybiocontrol" / "features"
+STORE_DIR = Path(os.environ.get("FEATURE_STORE_DIR", _DEFAULT_STORE_DIR))
+STORE_TTL_S = int(os.environ.get("FEATURE_STORE_TTL", str(24 * 3600)))
+MAX_GENOMES = 8  # in-process LRU
+
+# digests come back from the browser: only a bare sha256 hex may name a file
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+_mem: "OrderedDict[str, FeatureTable]" = OrderedDict()
+_lock = threading.Lock()
+
+def valid_digest(digest: Any) -> bool:
+    return isinstance(digest, str) and bool(_DIGEST_RE.match(digest))
+
+def _store_dir() -> Path:
+    """STORE_DIR created 0o700 (PermissionError if another user owns it), with its temp-dir parent."""
+    if STORE_DIR == _DEFAULT_STORE_DIR:
+        private_dir(STORE_DIR.parent)
+    return private_dir(STORE_DIR)
+
+def _path(digest: str) -> Path:
+    if not valid_digest(digest):
+        raise ValueError(f"invalid feature digest {digest!r}")
+    root = _store_dir().resolve()
+    p = (root / f"{digest}.pkl").resolve()
+    if p.parent != root:
+        raise ValueError(f"feature digest {digest!r} escapes the store")
+    return p
+
+def _remember(digest: str, table: FeatureTable) -> None:
+    with _lock:
+        _mem[digest] = table
+        _mem.move_to_end(digest)
+        while len(_mem) > MAX_GENOMES:
+            _mem.popitem(last=False)
+
+def _prune(now: float) -> None:
+    try:
+        for p in STORE_DIR.glob("*.pkl"):
+            if now - p.stat().st_mtime > STORE_TTL_S:
+                p.unlink(missing_ok=True)
+    except OSError:
+        pass
+
+def feature_key(content_digest: str, fmt: str) -> str:
+    """Store key for an upload: the same bytes parsed as GenBank and as FASTA are different genomes."""
+    return hashlib.sha256(f"{fmt}\0{content_digest}".encode()).hexdigest()
+
+def feature_handle(digest: str, n_features: int, kind: str = "") -> Dict[str, Any]:
+    return {"digest": digest, "n_features": int(n_features), "kind": kind or ""}
+
+def put_features(digest: str, features: FeatureInput, kind: str = "") -> Dict[str, Any]:
+    """Persist a genome's features (atomically) and return the browser-side handle."""
+    table = as_feature_table(features)
+    if not valid_digest(digest):
+        return feature_handle("", len(table), kind)
+    _remember(digest, table)
+    try:
+        dest = _path(digest)
+        fd, tmp = tempfile.mkstemp(dir=dest.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                pickle.dump(table, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, dest)
+        finally:
+            Path(tmp).unlink(missing_ok=True)  # only left over when the dump failed
+        _prune(time.time())
+    except OSError:
+        # disk store is best-effort; this worker still has it in memory
+        pass
+    return feature_handle(digest, len(table), kind)
+
+def get_features(digest: str) -> Optional[FeatureTable]:
+    if not valid_digest(digest):
+        return None
+    with _lock:
+        table = _mem.get(digest)
+        if table is not None:
+            _mem.move_to_end(digest)
+            return table
+    try:
+        p = _path(digest)
+        with open(p, "rb") as fh:
+            table = pickle.load(fh)
+        os.utime(p)  # keep active sessions from aging out
+    except (OSError, ValueError, pickle.UnpicklingError, EOFError):
+        return None
+    _remember(digest, table)
+    return table
+
+def handle_digest(store_data: Any) -> str:
+    """The handle's digest, or "" when it is missing or not a well-formed sha256 hex."""
+    if isinstance(store_data, dict):
+        digest = store_data.get("digest")
+        return digest if valid_digest(digest) else ""
+    return ""
+
+def resolve_features(store_data: Any) -> FeatureTable:
+    """
+    store-features payload -> FeatureTable.
+    Accepts the digest handle, or a legacy list of feature dicts.
+    """
+    if isinstance(store_data, dict):
+        return get_features(handle_digest(store_data)) or FeatureTable.from_records([])
+    if isinstance(store_data, FeatureTable):
+        return store_data
+    return as_feature_table(store_data if isinstance(store_data, list) else [])
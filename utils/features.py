@@ -0,0 +1,235 @@
+# utils/features.py
+from __future__ import annotations
+
+import hashlib, re, sys
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+# Columns of the parser's feature dicts
+STRING_COLUMNS = ("gene", "product", "KO", "EC", "locus_tag")
+INT_COLUMNS = ("start", "end", "strand")
+
+# ---------------- Cross-references ----------------
+# db_xref namespaces matched by exact ID. Aliases fold onto one namespace;
+# anything else is kept under its upper-cased prefix.
+XREF_NAMESPACES = ("KO", "COG", "PFAM", "UNIPROT", "INTERPRO")
+_XREF_ALIASES = {
+    "ko": "KO", "kegg_ko": "KO", "kegg.orthology": "KO",
+    "cog": "COG",
+    "pfam": "PFAM",
+    "uniprot": "UNIPROT", "uniprotkb": "UNIPROT", "uniprotkb/swiss-prot": "UNIPROT",
+    "uniprotkb/trembl": "UNIPROT", "swiss-prot": "UNIPROT", "trembl": "UNIPROT", "sp": "UNIPROT",
+    "interpro": "INTERPRO", "ipr": "INTERPRO",
+}
+_KO_ID = re.compile(r"^K\d{5}$")
+
+def normalize_xref(value: str, namespace: str = "") -> Optional[str]:
+    """
+    "InterPro:IPR000123" / ("PF00005.27", "Pfam") -> "INTERPRO:IPR000123" / "PFAM:PF00005".
+    `namespace` is the default for bare IDs (e.g. a "KO" column). None if empty.
+    """
+    v = (value or "").strip()
+    ns, sep, ident = v.partition(":")
+    if not sep or (namespace and ns.strip().lower() not in _XREF_ALIASES and ns.strip().lower() != "kegg"):
+        ns, ident = namespace, v
+    ns_l, ident = ns.strip().lower(), ident.strip()
+    if not ident or not ns_l:
+        return None
+    if ns_l == "kegg":
+        canon = "KO" if _KO_ID.match(ident.upper()) else "KEGG"
+    else:
+        canon = _XREF_ALIASES.get(ns_l, ns.strip().upper())
+    if canon in XREF_NAMESPACES:
+        ident = ident.upper()
+        if canon == "PFAM":
+            ident = ident.split(".", 1)[0]  # PF00005.27 -> PF00005
+    return f"{canon}:{ident}"
+
+def split_xrefs(value: str) -> List[str]:
+    return [x for x in (value or "").split(";") if x]
+
+def _as_str(x: Any) -> str:
+    if isinstance(x, str):
+        return x
+    return "" if x is None else str(x)
+
+class FeatureTable:
+    """
+    Columnar view of a genome's features.
+
+    gene/product/KO/EC/locus_tag are categorical: an int32 code per row plus
+    one interned list of distinct values, so a string shared by many CDS (e.g.
+    "hypothetical protein") is stored and normalised once. start/end/strand
+    are int64 arrays. Matchers work on the distinct values and broadcast the
+    result back to rows via the codes. aa_len is the protein length, taken
+    from the translation or, for records without one, from "aa_len".
+    """
+    __slots__ = ("_codes", "_cats", "start", "end", "strand", "aa_len", "translation",
+                 "xref_ptr", "xref_codes", "xref_vocab", "_derived")
+
+    def __init__(self, codes: Dict[str, np.ndarray], cats: Dict[str, List[str]],
+                 start: np.ndarray, end: np.ndarray, strand: np.ndarray,
+                 translation: List[str], aa_len: np.ndarray = None,
+                 xrefs: Optional[Tuple[np.ndarray, np.ndarray, List[str]]] = None):
+        self._codes = codes
+        self._cats = cats
+        self.start = start
+        self.end = end
+        self.strand = strand
+        self.translation = translation
+        self.aa_len = aa_len if aa_len is not None else \
+            np.fromiter((len(t) for t in translation), dtype=np.int64, count=len(translation))
+        if xrefs is None:
+            xrefs = (np.zeros(len(translation) + 1, dtype=np.int64), np.zeros(0, dtype=np.int32), [])
+        self.xref_ptr, self.xref_codes, self.xref_vocab = xrefs
+        self._derived: Dict[Any, Any] = {}
+
+    def __getstate__(self):
+        # memoized derived columns are cheap to rebuild; don't persist them
+        return {k: getattr(self, k) for k in self.__slots__ if k != "_derived"}
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+        if "xref_ptr" not in state:  # pickled before xrefs existed
+            self.xref_ptr = np.zeros(len(self.translation) + 1, dtype=np.int64)
+            self.xref_codes, self.xref_vocab = np.zeros(0, dtype=np.int32), []
+        self._derived = {}
+
+    # ---------------- construction ----------------
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "FeatureTable":
+        records = list(records or [])
+        n = len(records)
+        codes: Dict[str, np.ndarray] = {}
+        cats: Dict[str, List[str]] = {}
+        for col in STRING_COLUMNS:
+            lookup: Dict[str, int] = {}
+            values: List[str] = []
+            arr = np.empty(n, dtype=np.int32)
+            for i, r in enumerate(records):
+                v = _as_str(r.get(col, ""))
+                code = lookup.get(v)
+                if code is None:
+                    code = lookup[v] = len(values)
+                    values.append(sys.intern(v))
+                arr[i] = code
+            codes[col] = arr
+            cats[col] = values
+        ints = {col: np.fromiter((int(r.get(col, 0) or 0) for r in records), dtype=np.int64, count=n)
+                for col in INT_COLUMNS}
+        translation = [_as_str(r.get("translation", "")) for r in records]
+        aa_len = np.fromiter((len(t) if t else int(r.get("aa_len", 0) or 0)
+                              for t, r in zip(translation, records)), dtype=np.int64, count=n)
+        # xrefs: CSR over one interned vocabulary of "NS:ID" strings
+        lookup, vocab, flat = {}, [], []
+        ptr = np.zeros(n + 1, dtype=np.int64)
+        for i, r in enumerate(records):
+            xs = r.get("xrefs")
+            if xs is None:  # older feature dicts only carry KO
+                xs = ";".join(filter(None, (normalize_xref(k, "KO") for k in split_xrefs(_as_str(r.get("KO", ""))))))
+            for x in split_xrefs(_as_str(xs)):
+                code = lookup.get(x)
+                if code is None:
+                    code = lookup[x] = len(vocab)
+                    vocab.append(sys.intern(x))
+                flat.append(code)
+            ptr[i + 1] = len(flat)
+        xrefs = (ptr, np.array(flat, dtype=np.int32), vocab)
+        return cls(codes, cats, ints["start"], ints["end"], ints["strand"], translation, aa_len, xrefs)
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        return [self.record(i) for i in range(len(self))]
+
+    # ---------------- access ----------------
+    def __len__(self) -> int:
+        return int(self.start.shape[0])
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self.record(i)
+
+    def record(self, i: int) -> Dict[str, Any]:
+        return {
+            "gene": self.value("gene", i), "product": self.value("product", i),
+            "KO": self.value("KO", i), "EC": self.value("EC", i),
+            "translation": self.translation[i], "locus_tag": self.value("locus_tag", i),
+            "start": int(self.start[i]), "end": int(self.end[i]), "strand": int(self.strand[i]),
+            "aa_len": int(self.aa_len[i]), "xrefs": ";".join(self.xrefs(i))
+        }
+
+    def xrefs(self, i: int) -> List[str]:
+        vocab = self.xref_vocab
+        return [vocab[c] for c in self.xref_codes[self.xref_ptr[i]:self.xref_ptr[i + 1]]]
+
+    def xref_rows(self) -> np.ndarray:
+        """Row number of each entry in xref_codes."""
+        return np.repeat(np.arange(len(self)), np.diff(self.xref_ptr))
+
+    def codes(self, col: str) -> np.ndarray:
+        return self._codes[col]
+
+    def categories(self, col: str) -> List[str]:
+        return self._cats[col]
+
+    def value(self, col: str, i: int) -> str:
+        return self._cats[col][self._codes[col][i]]
+
+    def column(self, col: str) -> List[str]:
+        cats = self._cats[col]
+        return [cats[c] for c in self._codes[col]]
+
+    def content_digest(self) -> str:
+        """sha256 over every column (memoized); equal digests <=> equal tables."""
+        d = self._derived.get("digest")
+        if d is None:
+            h = hashlib.sha256(f"n={len(self)}".encode())
+            for col in STRING_COLUMNS:
+                h.update(self._codes[col].tobytes())
+                # length-prefixed so no two category lists serialise alike
+                h.update("".join(f"{len(v)}:{v}" for v in self._cats[col]).encode("utf-8", "surrogatepass"))
+            for arr in (self.start, self.end, self.strand, self.aa_len):
+                h.update(np.ascontiguousarray(arr, dtype=np.int64).tobytes())
+            h.update("".join(f"{len(t)}:{t}" for t in self.translation).encode("utf-8", "surrogatepass"))
+            h.update(self.xref_ptr.tobytes())
+            h.update(self.xref_codes.tobytes())
+            h.update("".join(f"{len(v)}:{v}" for v in self.xref_vocab).encode("utf-8", "surrogatepass"))
+            d = self._derived["digest"] = h.hexdigest()
+        return d
+
+    def nbytes(self) -> int:
+        """Rough in-memory size, for cache budgets."""
+        arrays = sum(a.nbytes for a in self._codes.values()) + \
+            self.start.nbytes + self.end.nbytes + self.strand.nbytes + self.aa_len.nbytes + \
+            self.xref_ptr.nbytes + self.xref_codes.nbytes + sum(len(v) + 49 for v in self.xref_vocab)
+        strings = sum(len(v) + 49 for vals in self._cats.values() for v in vals)
+        return arrays + strings + sum(len(t) + 49 for t in self.translation)
+
+    # ---------------- vectorized helpers ----------------
+    def derived(self, col: str, fn: Callable[[str], Any]) -> List[Any]:
+        """fn applied once per distinct value of `col`, memoized per (col, fn)."""
+        k = (col, fn)
+        out = self._derived.get(k)
+        if out is None:
+            out = [fn(v) for v in self._cats[col]]
+            self._derived[k] = out
+        return out
+
+    def row_mask(self, col: str, category_mask: np.ndarray) -> np.ndarray:
+        """Broadcast a per-category boolean mask to a per-row mask."""
+        if len(self) == 0:
+            return np.zeros(0, dtype=bool)
+        return np.asarray(category_mask, dtype=bool)[self._codes[col]]
+
+FeatureInput = Union[FeatureTable, List[Dict[str, Any]], None]
+
+def as_feature_table(features: FeatureInput) -> FeatureTable:
+    if isinstance(features, FeatureTable):
+        return features
+    return FeatureTable.from_records(features or [])
+
+def as_feature_records(features: FeatureInput) -> List[Dict[str, Any]]:
+    if isinstance(features, FeatureTable):
+        return features.to_records()
+    return list(features or [])
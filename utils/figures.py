@@ -0,0 +1,35 @@
+# utils/figures.py
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+# Module bar charts as plain figure dicts: one bar trace with a per-bar
+# colour array instead of px.bar(color="Trait")'s one trace per trait, and
+# no Plotly validation on the server. Colours follow the plotly template's
+# colourway, so the bars look as they did with px.bar.
+COLORWAY = ["#636efa", "#EF553B", "#00cc96", "#ab63fa", "#FFA15A",
+            "#19d3f3", "#FF6692", "#B6E880", "#FF97FF", "#FECB52"]
+
+_AXIS = {"title_font": {"size": 16}, "tickfont": {"size": 13}, "showgrid": True, "gridcolor": "rgba(0,0,0,0.07)"}
+
+def bar_figure(summary: Optional[pd.DataFrame], palette: Optional[List[str]] = None,
+               empty_label: str = "No traits found") -> Dict[str, Any]:
+    """Detected count per trait as a single-trace bar figure dict."""
+    if summary is None or summary.empty:
+        x, y = [empty_label], [0]
+    else:
+        x = summary["Trait"].astype(str).tolist()
+        y = pd.to_numeric(summary["Detected"], errors="coerce").fillna(0).tolist()
+    colors = palette or COLORWAY
+    return {
+        "data": [{"type": "bar", "x": x, "y": y,
+                  "marker": {"color": [colors[i % len(colors)] for i in range(len(x))],
+                             "line": {"width": 0.8, "color": "rgba(0,0,0,0.3)"}},
+                  "hovertemplate": "Trait=%{x}<br>Detected=%{y}<extra></extra>"}],
+        "layout": {"width": 1200, "height": 620, "margin": {"l": 40, "r": 20, "t": 10, "b": 80},
+                   "plot_bgcolor": "white", "paper_bgcolor": "white", "showlegend": False,
+                   "xaxis": dict(_AXIS, title={"text": "Trait"}),
+                   "yaxis": dict(_AXIS, title={"text": "Detected"})},
+    }
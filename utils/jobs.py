@@ -0,0 +1,305 @@
+# utils/jobs.py
+from __future__ import annotations
+
+import hashlib, json, multiprocessing as mp, os, re, shutil, tempfile, threading, time, traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from utils.parsing import iter_upload_bytes, parse_chunks
+
+# Background analysis jobs: an upload is written to JOB_DIR and run as
+# parse -> detect -> score in a small process pool, so the request thread
+# returns at once. The job's output is the upload's result bundle
+# (perf.build_result_bundle) that every page renders from. Each job keeps a JSON state file
+#   {"id", "status": queued|running|done|error, "stage", "progress" (0..1),
+#    "message", "result", "updated"}
+# that any gunicorn worker on the host can read, so the browser's poll is
+# one small file read. Features land in the feature store and the bundle
+# in the shared result cache, where the pages pick them up. Batch Analysis
+# uploads run the same way (run_batch_job); their result is kept by batch id.
+JOB_DIR = Path(os.environ.get("JOB_DIR", Path(tempfile.gettempdir()) / "dairybiocontrol" / "jobs"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_TTL_S = int(os.environ.get("JOB_TTL", str(24 * 3600)))
+JOB_STALE_S = 600  # a queued/running job silent this long is resubmitted
+
+# stage -> (start, end) share of the overall progress bar
+STAGES = {"parse": (0.0, 0.6), "detect": (0.6, 0.95), "score": (0.95, 1.0)}
+READ_CHUNK = 1 << 20
+_MIN_WRITE_S = 0.2  # progress state is rewritten at most this often
+_JOB_ID_RE = re.compile(r"^[0-9a-f]{24}$")  # job_id_for; ids also come back from the browser
+
+# trait DB for the job processes: set by configure() before the pool forks
+_DB: Optional[Dict[str, Any]] = None
+
+def configure(TRAIT_DB: Optional[Dict[str, Any]]) -> None:
+    """Hand the app's loaded trait DB to the job runner (call before the first submit)."""
+    global _DB
+    _DB = TRAIT_DB
+
+# ---------------- State files ----------------
+def _state_path(job_id: str) -> Path:
+    return JOB_DIR / f"{job_id}.json"
+
+def _input_path(job_id: str) -> Path:
+    return JOB_DIR / f"{job_id}.in"
+
+def _batch_dir(job_id: str) -> Path:
+    return JOB_DIR / f"{job_id}.batch"
+
+def write_state(job_id: str, **fields: Any) -> Dict[str, Any]:
+    st = read_state(job_id) or {"id": job_id}
+    st.update(fields, updated=time.time())
+    JOB_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=JOB_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w") as fh:
+        json.dump(st, fh)
+    os.replace(tmp, _state_path(job_id))
+    return st
+
+def read_state(job_id: str) -> Optional[Dict[str, Any]]:
+    if not isinstance(job_id, str) or not _JOB_ID_RE.match(job_id):
+        return None
+    try:
+        return json.loads(_state_path(job_id).read_text())
+    except (OSError, ValueError):
+        return None
+
+def _prune(now: float) -> None:
+    try:
+        for p in JOB_DIR.iterdir():
+            if now - p.stat().st_mtime > JOB_TTL_S:
+                if p.is_dir():
+                    shutil.rmtree(p, ignore_errors=True)
+                else:
+                    p.unlink(missing_ok=True)
+    except OSError:
+        pass
+
+class _Progress:
+    """Maps a stage's fractional progress onto the overall bar, throttling writes."""
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self._last = 0.0
+
+    def __call__(self, stage: str, frac: float, message: str = "", force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last < _MIN_WRITE_S:
+            return
+        self._last = now
+        lo, hi = STAGES[stage]
+        frac = max(0.0, min(1.0, float(frac)))
+        write_state(self.job_id, status="running", stage=stage, stage_progress=round(frac, 4),
+                    progress=round(lo + (hi - lo) * frac, 4), message=message)
+
+# ---------------- The job ----------------
+def upload_kind(parsed: Dict[str, Any]) -> str:
+    """Human label for a parsed upload ("GenBank (PROKKA), gzip", ...); "" if unsupported."""
+    if parsed["format"] == "genbank":
+        kind = f"GenBank ({(parsed['annotator'] or 'unknown').upper()})"
+    elif parsed["format"] == "fasta":
+        kind = "Protein FASTA (.faa)"
+    else:
+        return ""
+    if parsed["compression"]:
+        kind = f"{kind}, {parsed['compression']}"
+    return kind
+
+def _read_chunks(path: Path, on_progress: Callable[[float], None]) -> Iterator[bytes]:
+    total = max(1, path.stat().st_size)
+    done = 0
+    with open(path, "rb") as fh:
+        while True:
+            chunk = fh.read(READ_CHUNK)
+            if not chunk:
+                break
+            done += len(chunk)
+            yield chunk
+            on_progress(done / total)
+
+def run_job(job_id: str, filename: str, genome_name: str) -> Dict[str, Any]:
+    """Parse -> detect -> score one upload; state goes to the job's state file."""
+    from utils.feature_store import feature_key, put_features  # lazy import
+    from utils.perf import build_result_bundle, bundle_ref
+
+    db = _load_db()
+
+    prog = _Progress(job_id)
+    src = _input_path(job_id)
+    try:
+        prog("parse", 0.0, "Reading file", force=True)
+        parsed = parse_chunks(_read_chunks(src, lambda f: prog("parse", f, "Parsing features")), filename)
+        kind = upload_kind(parsed)
+        feats = parsed["features"]
+        if not kind:
+            return write_state(job_id, status="error", message="Unsupported file type.")
+        if parsed["error"] and not feats:
+            return write_state(job_id, status="error", message=f"Could not read {filename}: {parsed['error']}")
+        handle = put_features(feature_key(parsed["digest"], parsed["format"]), feats, kind)
+
+        prog("detect", 0.0, f"Matching {len(feats)} features", force=True)
+        messages = {"detect": "Matching traits", "score": "Scoring"}
+        bundle = build_result_bundle(handle, genome_name, db,
+                                     progress=lambda stage, f: prog(stage, f, messages[stage], force=(stage == "score")))
+        result = {"features": handle, "bundle": bundle_ref(bundle, handle), "kind": kind,
+                  "n_features": len(feats), "biocontrol": round(float(bundle["score"]["Biocontrol"]), 2)}
+        return write_state(job_id, status="done", stage="score", stage_progress=1.0, progress=1.0,
+                           message="Done", result=result)
+    except Exception as e:
+        traceback.print_exc()
+        return write_state(job_id, status="error", message=f"Analysis failed: {e}")
+    finally:
+        try:
+            src.unlink(missing_ok=True)
+        except OSError:
+            pass
+
+def _load_db() -> Dict[str, Any]:
+    if _DB is not None:
+        return _DB
+    from utils.trait_db import load_trait_db  # spawned worker or plain thread without configure()
+    return load_trait_db()
+
+def run_batch_job(job_id: str) -> Dict[str, Any]:
+    """Batch Analysis upload: expand archives -> parse -> detect -> score; result is kept by batch id."""
+    from utils.batch import BATCH_WORKERS, expand_files, run_batch  # lazy import
+
+    db = _load_db()
+    prog = _Progress(job_id)
+    src = _batch_dir(job_id)
+    try:
+        prog("parse", 0.0, "Reading files", force=True)
+        names = json.loads((src / "manifest.json").read_text())
+        # archives are extracted into the job folder and every file is parsed
+        # from disk; reading stops at BATCH_MAX_GENOMES / BATCH_MAX_TOTAL_MB
+        files, skipped = expand_files((fn, src / f"{i:05d}") for i, fn in enumerate(names))
+        if not files:
+            return write_state(job_id, status="error", message="No GenBank/FASTA files found in the upload.",
+                               result={"skipped": skipped})
+        messages = {"parse": f"Parsing {len(files)} genomes", "detect": "Matching traits", "score": "Scoring"}
+        # in a job-pool process the parse pool gets this worker's share of
+        # BATCH_WORKERS, so JOB_WORKERS batches never fan out beyond it
+        workers = max(1, BATCH_WORKERS // max(1, JOB_WORKERS)) if _in_pool else None
+        res = run_batch(files, db, workers=workers, progress=lambda stage, f: prog(stage, f, messages[stage]))
+        result = {"batch": {"id": res["id"], "n_genomes": len(res["scores"])}, "nnz": res["matrix"].nnz,
+                  "skipped": skipped + res["errors"]}
+        return write_state(job_id, status="done", stage="score", stage_progress=1.0, progress=1.0,
+                           message="Done", result=result)
+    except Exception as e:
+        traceback.print_exc()
+        return write_state(job_id, status="error", message=f"Batch analysis failed: {e}")
+    finally:
+        shutil.rmtree(src, ignore_errors=True)
+
+# ---------------- Runner ----------------
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_in_pool = False  # True inside the pool's worker processes
+
+def _mark_pool_worker() -> None:
+    global _in_pool
+    _in_pool = True
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    with _pool_lock:
+        if _pool is None and JOB_WORKERS > 0:
+            methods = mp.get_all_start_methods()
+            try:
+                # fork: workers inherit the loaded trait DB instead of reloading it
+                _pool = ProcessPoolExecutor(max_workers=JOB_WORKERS,
+                                            mp_context=mp.get_context("fork" if "fork" in methods else "spawn"),
+                                            initializer=_mark_pool_worker)
+            except (OSError, NotImplementedError):
+                _pool = None
+        return _pool
+
+def _reset_pool() -> None:
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+def job_id_for(content_digest: bytes, filename: str, version: str = "") -> str:
+    """Same bytes (their sha256) + name + DB version -> same job, so a repeat upload reuses a finished one."""
+    h = hashlib.sha256(content_digest)
+    h.update(b"\0" + (filename or "").encode() + b"\0" + version.encode())
+    return h.hexdigest()[:24]
+
+def _spool(contents: str, dest: Path) -> bytes:
+    """Decode a dcc.Upload payload into dest chunk by chunk; returns the sha256 of the bytes."""
+    h = hashlib.sha256()
+    with open(dest, "wb") as fh:
+        for chunk in iter_upload_bytes(contents):
+            h.update(chunk)
+            fh.write(chunk)
+    return h.digest()
+
+def _reusable(job_id: str, now: float) -> bool:
+    """A finished job, or one still alive, is reused instead of resubmitted."""
+    st = read_state(job_id)
+    return bool(st) and (st.get("status") == "done" or
+                         (st.get("status") in ("queued", "running") and now - st.get("updated", 0) < JOB_STALE_S))
+
+def _launch(job_id: str, fn: Callable[..., Any], args: tuple, in_process: bool = False) -> None:
+    if not in_process:
+        pool = _get_pool()
+        if pool is not None:
+            try:
+                pool.submit(fn, *args)
+                return
+            except (BrokenProcessPool, RuntimeError):
+                _reset_pool()
+    # no process pool available (or wanted): a daemon thread still frees the request
+    threading.Thread(target=fn, args=args, daemon=True).start()
+
+def submit_upload(contents: str, filename: str, genome_name: str = "") -> str:
+    """Queue a dcc.Upload payload for analysis and return its job id."""
+    from utils.perf import _db_version  # lazy import
+    JOB_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=JOB_DIR, suffix=".tmp")
+    os.close(fd)
+    try:
+        # the payload goes straight to disk; it is never held decoded in this worker
+        job_id = job_id_for(_spool(contents, Path(tmp)), filename, _db_version(_DB))
+        now = time.time()
+        if _reusable(job_id, now):
+            return job_id
+        _prune(now)
+        os.replace(tmp, _input_path(job_id))
+    finally:
+        Path(tmp).unlink(missing_ok=True)
+    write_state(job_id, status="queued", stage="parse", stage_progress=0.0, progress=0.0,
+                message="Queued", filename=filename, result=None, submitted=now)
+    _launch(job_id, run_job, (job_id, filename, genome_name or filename))
+    return job_id
+
+def submit_batch(contents: Sequence[str], filenames: Sequence[str]) -> str:
+    """Queue a dcc.Upload(multiple=True) payload as one Batch Analysis job and return its id."""
+    from utils.perf import _db_version  # lazy import
+    from utils.result_cache import NullCache, get_result_cache
+    contents = list(contents or [])
+    names: List[str] = [fn or "" for fn in filenames or []][:len(contents)]
+    JOB_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=JOB_DIR, suffix=".tmp"))
+    try:
+        h = hashlib.sha256(b"batch\0" + _db_version(_DB).encode())
+        for i, (c, fn) in enumerate(zip(contents, names)):
+            h.update(b"\0" + fn.encode() + b"\0" + _spool(c, tmp / f"{i:05d}"))
+        job_id = h.hexdigest()[:24]
+        now = time.time()
+        if _reusable(job_id, now):
+            return job_id
+        _prune(now)
+        (tmp / "manifest.json").write_text(json.dumps(names))
+        src = _batch_dir(job_id)
+        shutil.rmtree(src, ignore_errors=True)
+        os.replace(tmp, src)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    write_state(job_id, status="queued", stage="parse", stage_progress=0.0, progress=0.0,
+                message="Queued", filename=f"{len(names)} files", result=None, submitted=now)
+    # batch results reach the pages through the shared result cache; without
+    # one they can only be kept by this process, so the job runs on a thread here
+    _launch(job_id, run_batch_job, (job_id,), in_process=type(get_result_cache()) is NullCache)
+    return job_id
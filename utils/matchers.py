@@ -0,0 +1,147 @@
+# utils/matchers.py
+from __future__ import annotations
+
+import re
+from collections import deque
+from typing import Any, Dict, FrozenSet, Hashable, Iterable, List, Tuple
+
+_EMPTY: FrozenSet[Hashable] = frozenset()
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over many keywords, each tagged with one or more
+    payloads (e.g. (category, trait)). find(text) scans text once and returns
+    the payloads of every keyword occurring in it as a substring, however
+    many keywords there are.
+    """
+    __slots__ = ("_goto", "_fail", "_out", "n_keywords")
+
+    def __init__(self, keywords: Iterable[Tuple[str, Hashable]]):
+        goto: List[Dict[str, int]] = [{}]
+        out: List[FrozenSet[Hashable]] = [_EMPTY]  # most states emit nothing: share one set
+        n = 0
+        for kw, payload in keywords:
+            if not kw:
+                continue
+            state = 0
+            for ch in kw:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = goto[state][ch] = len(goto)
+                    goto.append({})
+                    out.append(_EMPTY)
+                state = nxt
+            out[state] = out[state] | {payload}
+            n += 1
+        # breadth-first fail links; each state inherits its fail state's outputs
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            s = queue.popleft()
+            for ch, t in goto[s].items():
+                queue.append(t)
+                f = fail[s]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[t] = goto[f].get(ch, 0)
+                if out[fail[t]]:
+                    out[t] = out[t] | out[fail[t]]
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+        self.n_keywords = n
+
+    def find(self, text: str) -> FrozenSet[Hashable]:
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        found: set = set()
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+        return frozenset(found)
+
+    def __getstate__(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __setstate__(self, state: Dict[str, Any]):
+        for k, v in state.items():
+            setattr(self, k, v)
+
+# ---------------- EC numbers ----------------
+_EC_SPLIT = re.compile(r"[;,\s]+")
+
+def split_ecs(value: str) -> List[str]:
+    """Multi-valued EC field ("1.1.1.1;3.2.1.-") -> individual EC numbers."""
+    return [e for e in _EC_SPLIT.split(value or "") if e]
+
+def ec_levels(ec: str) -> Tuple[str, ...]:
+    """
+    "3.2.1.23" -> ("3","2","1","23"); "EC:3.2.-.-" -> ("3","2").
+    Levels stop at the first "-" (or empty) level, so a partial EC is a prefix.
+    """
+    s = (ec or "").strip()
+    if s[:2].upper() == "EC":
+        s = s[2:].lstrip(": ")
+    out = []
+    for part in s.split(".")[:4]:
+        part = part.strip()
+        if not part or part == "-":
+            break
+        out.append(part)
+    return tuple(out)
+
+def ec_prefix_match(value: str, patterns: Iterable[str]) -> bool:
+    """Reference (non-indexed) form of ECTrie: does any EC in value fall under any pattern?"""
+    pats = [p for p in (ec_levels(x) for x in patterns) if p]
+    for ec in split_ecs(value):
+        lv = ec_levels(ec)
+        if any(lv[:len(p)] == p for p in pats):
+            return True
+    return False
+
+class ECTrie:
+    """
+    Trie over the four dotted EC levels. A pattern is stored at the node of
+    its last concrete level ("3.2.1.-" at 3 -> 2 -> 1), so find() collects
+    every payload along a feature EC's path: at most four dict lookups per EC.
+    """
+    __slots__ = ("_root", "n_patterns")
+
+    def __init__(self, patterns: Iterable[Tuple[str, Hashable]] = ()):
+        self._root: Dict[str, Any] = {}
+        self.n_patterns = 0
+        for pattern, payload in patterns:
+            self.add(pattern, payload)
+
+    def add(self, pattern: str, payload: Hashable) -> None:
+        levels = ec_levels(pattern)
+        if not levels:
+            return  # "-.-.-.-" says nothing
+        node = self._root
+        for part in levels:
+            node = node.setdefault(part, {})
+        node[None] = node.get(None, _EMPTY) | {payload}
+        self.n_patterns += 1
+
+    def find(self, value: str) -> FrozenSet[Hashable]:
+        found: set = set()
+        for ec in split_ecs(value):
+            node = self._root
+            for part in ec_levels(ec):
+                node = node.get(part)
+                if node is None:
+                    break
+                hit = node.get(None)
+                if hit:
+                    found |= hit
+        return frozenset(found)
+
+    def __getstate__(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __setstate__(self, state: Dict[str, Any]):
+        for k, v in state.items():
+            setattr(self, k, v)
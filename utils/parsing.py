@@ -1,21 +1,30 @@
 # utils/parsing.py
-import base64, re
+import base64, bz2, codecs, hashlib, io, itertools, re, zlib
 from io import StringIO
-from typing import List, Dict, Optional
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from Bio import SeqIO  # install via requirements
 
+from utils.features import normalize_xref
+
 GENBANK_EXTS = (".gb", ".gbk", ".gbff", ".genbank")
-PROTEIN_FASTA_EXTS = (".faa", ".faa.gz")
+PROTEIN_FASTA_EXTS = (".faa",)
+COMPRESSION_EXTS = {".gz": "gzip", ".bz2": "bzip2", ".zst": "zstd"}
+
+def strip_compression_ext(fn: str) -> str:
+    fl = (fn or "").lower()
+    for ext in COMPRESSION_EXTS:
+        if fl.endswith(ext):
+            return fl[:-len(ext)]
+    return fl
 
 def is_genbank(fn: str) -> bool:
-    return (fn or "").lower().endswith(GENBANK_EXTS)
+    return strip_compression_ext(fn).endswith(GENBANK_EXTS)
 
 def is_protein_fasta(fn: str) -> bool:
-    return (fn or "").lower().endswith(PROTEIN_FASTA_EXTS)
+    return strip_compression_ext(fn).endswith(PROTEIN_FASTA_EXTS)
 
-def detect_annotator_from_text(text: str) -> Optional[str]:
-    """Best-effort annotator detection; do NOT hard-fail if None."""
-    tl = (text or "").lower()
+def _annotator_from_lower(tl: str) -> Optional[str]:
     # Be more permissive with markers
     if "prokka" in tl or "annotation::prokka" in tl or "prokka_version" in tl:
         return "prokka"
@@ -23,71 +32,484 @@ def detect_annotator_from_text(text: str) -> Optional[str]:
         return "pgap"
     return None
 
+def detect_annotator_from_text(text: str) -> Optional[str]:
+    """Best-effort annotator detection; do NOT hard-fail if None."""
+    return _annotator_from_lower((text or "").lower())
+
+# ---------------- Chunked upload decoding ----------------
+# dcc.Upload hands us a "data:<mime>;base64,<payload>" string. Instead of
+# decoding it to one bytes object and then one str, the payload is walked in
+# fixed slices: base64 -> bytes chunk -> incremental UTF-8 -> lines. Peak
+# memory is the callback argument itself plus one chunk.
+CHUNK_SIZE = 1 << 20  # base64 characters per step (a multiple of 4)
+
+def iter_upload_bytes(contents: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield the decoded payload of a data URL in bounded bytes chunks."""
+    if not contents:
+        return
+    comma = contents.find(",")
+    if comma < 0:
+        return
+    step = max(4, chunk_size - chunk_size % 4)
+    rest = ""
+    for i in range(comma + 1, len(contents), step):
+        piece = rest + contents[i:i + step]
+        cut = len(piece) - len(piece) % 4
+        rest = piece[cut:]
+        if cut:
+            yield base64.b64decode(piece[:cut])
+    if rest:
+        yield base64.b64decode(rest + "=" * (-len(rest) % 4))
+
+# ---------------- Streaming decompression ----------------
+# Sniffed from magic bytes rather than the filename, so a mislabelled
+# ".gz" that is really plain text still parses. Each step inflates at most
+# DECOMPRESS_CHUNK bytes before handing them downstream.
+DECOMPRESS_CHUNK = 1 << 20
+_MAGIC = ((b"\x1f\x8b", "gzip"), (b"BZh", "bzip2"), (b"\x28\xb5\x2f\xfd", "zstd"))
+
+def sniff_compression(head: bytes) -> Optional[str]:
+    for magic, name in _MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+def _inflate_members(chunks: Iterator[bytes], new_decoder: Callable[[], Any]) -> Iterator[bytes]:
+    """
+    Multi-member inflate loop (concatenated gzip members, multi-stream
+    bzip2). A decoder is opened per member, and only once input for it
+    arrives, so a member ending exactly on a chunk boundary is fine.
+    """
+    d = None
+    for chunk in chunks:
+        buf = chunk
+        while buf:
+            if d is None:
+                d = new_decoder()
+            out = d.decompress(buf, DECOMPRESS_CHUNK)
+            while out:
+                yield out
+                # bz2 keeps input it could not inflate within DECOMPRESS_CHUNK; drain it
+                if d.eof or getattr(d, "needs_input", True):
+                    break
+                out = d.decompress(b"", DECOMPRESS_CHUNK)
+            if d.eof:
+                buf = d.unused_data  # the next member starts here, if any
+                d = None
+            else:
+                buf = getattr(d, "unconsumed_tail", b"")
+    if d is not None and hasattr(d, "flush"):
+        tail = d.flush()
+        if tail:
+            yield tail
+
+def _inflate_gzip(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    # concatenated gzip members (bgzip, `cat a.gz b.gz`)
+    return _inflate_members(chunks, lambda: zlib.decompressobj(16 + zlib.MAX_WBITS))
+
+def _inflate_bzip2(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    return _inflate_members(chunks, bz2.BZ2Decompressor)
+
+class _ChunkReader(io.RawIOBase):
+    """Read-only file over an iterator of byte chunks."""
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._buf = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buf:
+            self._buf = next(self._chunks, None)
+            if self._buf is None:
+                self._buf = b""
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+def _inflate_zstd(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    try:
+        import zstandard  # optional: only needed for .zst uploads
+    except ImportError:
+        raise ValueError("zstd-compressed upload, but the 'zstandard' package is not installed")
+    # read_across_frames: pzstd / concatenated frames are one stream
+    with zstandard.ZstdDecompressor().stream_reader(_ChunkReader(iter(chunks)), read_size=DECOMPRESS_CHUNK,
+                                                    read_across_frames=True) as r:
+        while True:
+            out = r.read(DECOMPRESS_CHUNK)
+            if not out:
+                break
+            yield out
+
+_INFLATERS = {"gzip": _inflate_gzip, "bzip2": _inflate_bzip2, "zstd": _inflate_zstd}
+
+def iter_decompressed(chunks: Iterable[bytes], info: Optional[Dict] = None) -> Iterator[bytes]:
+    """Transparently inflate gzip/bzip2/zstd byte chunks; plain input passes through."""
+    it = iter(chunks)
+    head = b""
+    for chunk in it:
+        head += chunk
+        if len(head) >= 4:
+            break
+    method = sniff_compression(head)
+    if info is not None:
+        info["compression"] = method
+    stream = itertools.chain([head] if head else [], it)
+    if method is None:
+        yield from stream
+    else:
+        yield from _INFLATERS[method](stream)
+
+def iter_text_chunks(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Incrementally decode bytes chunks as UTF-8 (multi-byte chars may straddle chunks)."""
+    dec = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    for chunk in chunks:
+        text = dec.decode(chunk)
+        if text:
+            yield text
+    tail = dec.decode(b"", final=True)
+    if tail:
+        yield tail
+
+def iter_lines(text_chunks: Iterable[str]) -> Iterator[str]:
+    """Re-split decoded text chunks into lines (without the newline)."""
+    carry = ""
+    for text in text_chunks:
+        if carry:
+            text = carry + text
+        lines = text.split("\n")
+        carry = lines.pop()
+        yield from lines
+    if carry:
+        yield carry
+
+def iter_upload_lines(contents: str, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    return iter_lines(iter_text_chunks(iter_decompressed(iter_upload_bytes(contents, chunk_size))))
+
 def parse_contents(contents: str) -> str:
     if not contents:
         return ""
     try:
-        _, payload = contents.split(",", 1)
+        return "".join(iter_text_chunks(iter_decompressed(iter_upload_bytes(contents))))
     except ValueError:
         return ""
-    decoded = base64.b64decode(payload)
+
+def _first(q: Dict[str, List[str]], key: str) -> str:
+    vals = q.get(key)
+    return (vals[0] or "").strip() if vals else ""
+
+def _feature_record(q: Dict[str, List[str]], start: int, end: int, strand: int) -> Dict:
+    """Shared qualifier -> feature dict projection for both GenBank parsers."""
+    gene = _first(q, "gene")
+    locus_tag = _first(q, "locus_tag")
+    product = _first(q, "product")
+    # every db_xref as a normalised "NS:ID" (first-seen order); KO ids also ";"-joined in KO
+    xrefs = list(dict.fromkeys(filter(None, (normalize_xref(x) for x in q.get("db_xref", []) if isinstance(x, str)))))
+    KO = ";".join(x[3:] for x in xrefs if x.startswith("KO:"))
+    # every EC_number, ";"-joined (first-seen order, duplicates dropped)
+    EC = ";".join(dict.fromkeys(e.strip() for e in q.get("EC_number", []) if e and e.strip()))
+    trans = (q.get("translation", [""])[0]) if q.get("translation") else ""
+    trans = re.sub(r"[\s\r\n]+", "", trans)
+
+    # --- fallback: infer gene token from product if gene is blank ---
+    if not gene and product:
+        last = re.split(r"[ ,;/()\[\]]+", product.strip())[-1]
+        if last and len(last) <= 12 and re.search(r"[A-Za-z]", last):
+            gene = last
+
+    return {
+        "gene": gene, "product": product, "KO": KO, "EC": EC, "translation": trans,
+        "locus_tag": locus_tag, "start": start, "end": end, "strand": strand, "xrefs": ";".join(xrefs)
+    }
+
+# ---------------- Streaming GenBank feature table ----------------
+# Only the qualifiers the trait matcher reads are kept; everything else
+# (notes, inference, the ORIGIN block, ...) is skipped line by line.
+_FEATURE_TYPES = ("CDS", "gene")
+_KEEP_QUALIFIERS = {"gene", "locus_tag", "product", "db_xref", "EC_number", "translation"}
+_QUALIFIER_INDENT = 21
+_POS_RE = re.compile(r"\d+")
+_REMOTE_REF_RE = re.compile(r"[A-Za-z0-9_]+(?:\.\d+)?:")
+
+def _split_top_level(s: str) -> List[str]:
+    parts, depth, buf = [], 0, []
+    for ch in s:
+        if ch == "," and depth == 0:
+            parts.append("".join(buf)); buf = []
+            continue
+        depth += (ch == "(") - (ch == ")")
+        buf.append(ch)
+    parts.append("".join(buf))
+    return parts
+
+def _location_parts(loc: str, seq_len: int, circular: bool) -> List[Tuple[int, int, int]]:
+    """(start, end, strand) for every simple span; 0-based half-open like Biopython."""
+    if loc.startswith("complement(") and loc.endswith(")"):
+        return [(s, e, -st) for s, e, st in _location_parts(loc[11:-1], seq_len, circular)]
+    for op in ("join(", "order(", "bond("):
+        if loc.startswith(op) and loc.endswith(")"):
+            out: List[Tuple[int, int, int]] = []
+            for part in _split_top_level(loc[len(op):-1]):
+                out.extend(_location_parts(part, seq_len, circular))
+            return out
+    nums = [int(x) for x in _POS_RE.findall(_REMOTE_REF_RE.sub("", loc))]
+    if not nums:
+        return []
+    if "^" in loc:
+        return [(nums[0], nums[0], 1)]
+    if ".." not in loc:
+        return [(nums[0] - 1, nums[0], 1)]
+    start, end = nums[0] - 1, nums[-1]
+    if start > end and circular and seq_len:
+        # origin-spanning span on a circular record: Biopython splits it in two
+        return [(start, seq_len, 1), (0, end, 1)]
+    return [(start, end, 1)]
+
+def _parse_location(loc: str, seq_len: int = 0, circular: bool = False,
+                    stranded: bool = True) -> Tuple[int, int, int]:
+    parts = _location_parts(re.sub(r"\s+", "", loc), seq_len, circular)
+    if not parts:
+        return 0, 0, 0
+    strands = {st for _, _, st in parts}
+    strand = strands.pop() if (stranded and len(strands) == 1) else 0
+    return min(s for s, _, _ in parts), max(e for _, e, _ in parts), strand
+
+def _unquote(value: str) -> str:
+    if len(value) > 1 and value[0] == '"' and value[-1] == '"':
+        value = value[1:-1]
+    return value.replace('""', '"')
+
+def _build_feature(body: List[str], seq_len: int, circular: bool, stranded: bool) -> Optional[Dict]:
+    """Turn one feature's stripped lines (location first) into a feature dict."""
+    i = 0
+    loc = body[0]
+    while i + 1 < len(body) and (loc.endswith(",") or loc.count("(") > loc.count(")")):
+        i += 1
+        loc += body[i]
+
+    q: Dict[str, List[str]] = {}
+    key, chunks, open_quote = "", [], False
+
+    def _flush():
+        if key in _KEEP_QUALIFIERS and chunks:
+            q.setdefault(key, []).append(_unquote(" ".join(chunks)))
+
+    for line in body[i + 1:]:
+        if open_quote:
+            # inside a quoted value a leading "/" is just text
+            chunks.append(line)
+            open_quote = not line.endswith('"')
+        elif line.startswith("/"):
+            _flush()
+            name, eq, value = line[1:].partition("=")
+            value = value.lstrip()
+            key, chunks = name, ([value] if eq else [])
+            open_quote = value.startswith('"') and (len(value) == 1 or not value.endswith('"'))
+            if not eq and name in _KEEP_QUALIFIERS:
+                q.setdefault(name, [""])
+        elif key:
+            chunks.append(line)
+    _flush()
+
+    start, end, strand = _parse_location(loc, seq_len, circular, stranded)
+    return _feature_record(q, start, end, strand)
+
+def iter_genbank_features(lines: Iterable[str]) -> Iterator[Dict]:
+    """
+    Stream CDS/gene feature dicts out of GenBank text, one line at a time.
+    Only LOCUS and the FEATURES table are looked at; ORIGIN sequence blocks
+    are skipped without being stored. Yields the same dicts as the SeqIO path.
+    """
+    in_features = False
+    seq_len, circular, stranded = 0, False, True
+    ftype: Optional[str] = None
+    body: List[str] = []
+
+    def _emit():
+        if ftype in _FEATURE_TYPES and body:
+            try:
+                return _build_feature(body, seq_len, circular, stranded)
+            except Exception:
+                return None
+        return None
+
+    for raw in lines:
+        line = raw.rstrip("\r\n")
+        if not in_features:
+            if line.startswith("LOCUS"):
+                toks = line.split()
+                m = re.search(r"\s(\d+)\s+(bp|aa)\b", line)
+                seq_len = int(m.group(1)) if m else 0
+                stranded = not (m and m.group(2) == "aa")
+                circular = "circular" in (t.lower() for t in toks)
+            elif line.startswith("FEATURES"):
+                in_features, ftype, body = True, None, []
+            continue
+
+        if line[:1] not in (" ", ""):
+            # ORIGIN / CONTIG / BASE COUNT / "//" all close the feature table
+            rec = _emit()
+            if rec is not None:
+                yield rec
+            in_features, ftype, body = False, None, []
+            continue
+        if not line.strip():
+            continue
+        if line[:_QUALIFIER_INDENT].strip():
+            rec = _emit()
+            if rec is not None:
+                yield rec
+            toks = line.split(None, 1)
+            ftype = toks[0]
+            body = [toks[1].strip()] if (ftype in _FEATURE_TYPES and len(toks) > 1) else []
+        elif ftype in _FEATURE_TYPES:
+            body.append(line.strip())
+
+    rec = _emit()
+    if rec is not None:
+        yield rec
+
+def _iter_text_lines(text: str) -> Iterator[str]:
+    # slices one line at a time; StringIO would copy the whole upload again
+    i, n = 0, len(text)
+    while i < n:
+        j = text.find("\n", i)
+        if j < 0:
+            j = n
+        yield text[i:j]
+        i = j + 1
+
+def parse_genbank_features(text: str) -> List[Dict]:
+    feats: List[Dict] = []
     try:
-        return decoded.decode("utf-8", errors="ignore")
+        feats.extend(iter_genbank_features(_iter_text_lines(text)))
     except Exception:
-        return decoded.decode("latin-1", errors="ignore")
+        # swallow and let fallback (partial/empty) be returned
+        pass
+    return feats
 
-def parse_genbank_features(text: str) -> List[Dict]:
+def parse_genbank_features_seqio(text: str) -> List[Dict]:
+    """Reference Biopython implementation; builds full SeqRecords (slow, memory heavy)."""
     feats: List[Dict] = []
     try:
         for rec in SeqIO.parse(StringIO(text), "genbank"):
             for feat in getattr(rec, "features", []):
-                if getattr(feat, "type", "") not in ("CDS", "gene"):
+                if getattr(feat, "type", "") not in _FEATURE_TYPES:
                     continue
                 q = getattr(feat, "qualifiers", {}) or {}
-                gene = (q.get("gene", [""])[0]).strip() if q.get("gene") else ""
-                locus_tag = (q.get("locus_tag", [""])[0]).strip() if q.get("locus_tag") else ""
-                product = (q.get("product", [""])[0]).strip() if q.get("product") else ""
-                KO = ""
-                for x in q.get("db_xref", []):
-                    if isinstance(x, str) and x.startswith("KO:"):
-                        KO = x.split(":", 1)[-1].strip()
-                        break
-                EC = (q.get("EC_number", [""])[0]).strip() if q.get("EC_number") else ""
-                trans = (q.get("translation", [""])[0]) if q.get("translation") else ""
-                trans = re.sub(r"[\s\r\n]+", "", trans)
-
-                # --- fallback: infer gene token from product if gene is blank ---
-                if not gene and product:
-                    last = re.split(r"[ ,;/()\[\]]+", product.strip())[-1]
-                    if last and len(last) <= 12 and re.search(r"[A-Za-z]", last):
-                        gene = last
-
                 loc = getattr(feat, "location", None)
                 start = int(getattr(loc, "start", 0))
                 end = int(getattr(loc, "end", 0))
                 strand = int(getattr(loc, "strand", 0) or 0)
-                feats.append({
-                    "gene": gene, "product": product, "KO": KO, "EC": EC, "translation": trans,
-                    "locus_tag": locus_tag, "start": start, "end": end, "strand": strand
-                })
+                feats.append(_feature_record(q, start, end, strand))
     except Exception:
         # swallow and let fallback (empty) be returned
         pass
     return feats
 
+def iter_protein_fasta_features(lines: Iterable[str]) -> Iterator[Dict]:
+    """Stream protein FASTA records as feature dicts (same shape as the SeqIO path)."""
+    title: Optional[str] = None
+    seq: List[str] = []
+
+    def _record():
+        ident = title.split(None, 1)[0] if title.strip() else ""
+        return {
+            "gene": ident.strip(),
+            "product": title.strip(),
+            "KO": "", "EC": "",
+            "translation": re.sub(r"[\s\r\n]+", "", "".join(seq)),
+            "locus_tag": "", "start": 0, "end": 0, "strand": 0, "xrefs": ""
+        }
+
+    for line in lines:
+        if line[:1] == ">":
+            if title is not None:
+                yield _record()
+            title, seq = line[1:].rstrip(), []
+        elif title is not None:
+            seq.append(line.rstrip())
+    if title is not None:
+        yield _record()
+
 def parse_protein_fasta_features(text: str) -> List[Dict]:
     feats: List[Dict] = []
     try:
-        for rec in SeqIO.parse(StringIO(text), "fasta"):
-            seq = str(rec.seq or "")
-            feats.append({
-                "gene": (str(rec.id) or "").strip(),
-                "product": (str(rec.description) or "").strip(),
-                "KO": "", "EC": "",
-                "translation": re.sub(r"[\s\r\n]+", "", seq),
-                "locus_tag": "", "start": 0, "end": 0, "strand": 0
-            })
+        feats.extend(iter_protein_fasta_features(_iter_text_lines(text)))
     except Exception:
         pass
     return feats
 
+# ---------------- One-pass upload parsing ----------------
+def parse_upload(contents: str, filename: str, chunk_size: int = CHUNK_SIZE) -> Dict:
+    """
+    Decode, hash, sniff the annotator and extract features from a dcc.Upload
+    payload in a single streaming pass.
+    Compressed payloads (gzip/bzip2/zstd) are inflated on the fly; the digest
+    is the sha256 of the bytes as uploaded.
+    Returns {"features", "format" ("genbank"/"fasta"/""), "annotator", "digest",
+             "compression", "error"}.
+    """
+    return parse_chunks(iter_upload_bytes(contents, chunk_size), filename)
+
+def parse_bytes(data: bytes, filename: str, chunk_size: int = DECOMPRESS_CHUNK) -> Dict:
+    """parse_upload for raw file bytes."""
+    view = memoryview(data)
+    return parse_chunks((bytes(view[i:i + chunk_size]) for i in range(0, len(view), chunk_size)), filename)
+
+def iter_file_bytes(path: Union[str, Path], chunk_size: int = DECOMPRESS_CHUNK) -> Iterator[bytes]:
+    with open(path, "rb") as fh:
+        while True:
+            chunk = fh.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+def parse_file(path: Union[str, Path], filename: str = "", chunk_size: int = DECOMPRESS_CHUNK) -> Dict:
+    """parse_upload for a file on disk (read in chunk_size blocks); filename defaults to the path's."""
+    return parse_chunks(iter_file_bytes(path, chunk_size), filename or str(path))
+
+def parse_chunks(chunks: Iterable[bytes], filename: str) -> Dict:
+    """Shared body of parse_upload/parse_bytes over a stream of raw bytes chunks."""
+    out = {"features": [], "format": "", "annotator": None, "digest": "",
+           "compression": None, "error": ""}
+    fname = (filename or "").lower()
+    if is_genbank(fname):
+        out["format"] = "genbank"
+    elif is_protein_fasta(fname):
+        out["format"] = "fasta"
+    else:
+        return out
+
+    sha = hashlib.sha256()
+    seen = {"prokka": False, "pgap": False}
+
+    def _hashed(chunks: Iterable[bytes]) -> Iterator[bytes]:
+        for chunk in chunks:
+            sha.update(chunk)
+            yield chunk
+
+    def _sniffed(lines: Iterable[str]) -> Iterator[str]:
+        for line in lines:
+            if not seen["prokka"]:
+                found = _annotator_from_lower(line.lower())
+                if found:
+                    seen[found] = True
+            yield line
+
+    raw = iter_decompressed(_hashed(chunks), out)
+    lines = _sniffed(iter_lines(iter_text_chunks(raw)))
+    parser = iter_genbank_features if out["format"] == "genbank" else iter_protein_fasta_features
+    feats: List[Dict] = []
+    try:
+        feats.extend(parser(lines))
+    except Exception as e:
+        # keep whatever was parsed before the bad input
+        out["error"] = str(e)
+    out["features"] = feats
+    out["annotator"] = "prokka" if seen["prokka"] else ("pgap" if seen["pgap"] else None)
+    out["digest"] = sha.hexdigest()
+    return out
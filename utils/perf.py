@@ -1,62 +1,282 @@
 # utils/perf.py
 from __future__ import annotations
 
-import json
-from functools import lru_cache
-from typing import Any, Dict, List, Tuple
-
-# lightweight in-memory blob store keyed by a short fingerprint
-_blob_cache: Dict[str, List[Dict[str, Any]]] = {}
-
-def _fingerprint_features(features: List[Dict[str, Any]]) -> str:
-    """
-    Build a short, stable fingerprint from a small slice of the features.
-    Avoids hashing the entire file every time while still invalidating cache
-    when user uploads a different genome.
-    """
-    if not features:
-        return "empty:0"
-    # take at most first/last 50 records and only the most discriminative fields
-    head = features[:50]
-    tail = features[-50:] if len(features) > 50 else []
-    mini = []
-    for f in (head + tail):
-        mini.append({
-            "g": (f.get("gene") or "").lower(),
-            "p": (f.get("product") or "").lower(),
-            "k": f.get("KO") or "",
-            "e": f.get("EC") or "",
-            "l": f.get("locus_tag") or ""
-        })
-    try:
-        payload = json.dumps(mini, separators=(",", ":"), ensure_ascii=False)
-    except Exception:
-        payload = str(mini)
-    # a tiny rolling hash
-    h = 2166136261
-    for ch in payload:
-        h ^= ord(ch)
-        h = (h * 16777619) & 0xFFFFFFFF
-    return f"fp:{h:x}:{len(features)}"
+import hashlib, os, threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.features import FeatureInput, FeatureTable, as_feature_table
+from utils.feature_store import handle_digest, resolve_features
+from utils.figures import bar_figure
+from utils.result_cache import cache_key, get_result_cache
+
+# ---------------- Bounded LRU ----------------
+CACHE_MAX_MB = float(os.environ.get("DETECTION_CACHE_MB", "256"))
+CACHE_MAX_ENTRIES = int(os.environ.get("DETECTION_CACHE_ENTRIES", "128"))
+
+def _sizeof(value: Any) -> int:
+    """Rough in-memory size of a cached value."""
+    if isinstance(value, FeatureTable):
+        return value.nbytes()
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sum(_sizeof(v) for v in value.values())
+    if isinstance(value, (tuple, list)):
+        return sum(_sizeof(v) for v in value)
+    return 64
+
+class BoundedLRU:
+    """
+    Thread-safe LRU bounded by entry count and (estimated) bytes.
+    Keys are tuples whose first item is the entry kind ("features",
+    "detect", ...); hits/misses are counted per kind.
+    """
+    def __init__(self, max_bytes: int, max_entries: int):
+        self.max_bytes = int(max_bytes)
+        self.max_entries = int(max_entries)
+        self._data: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self.evictions = 0
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            kind = str(key[0])
+            if item is None:
+                self.misses[kind] = self.misses.get(kind, 0) + 1
+                return None
+            self._data.move_to_end(key)
+            self.hits[kind] = self.hits.get(kind, 0) + 1
+            return item[0]
+
+    def put(self, key: Tuple, value: Any) -> None:
+        size = _sizeof(value)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if size > self.max_bytes:
+                return  # would evict everything else and still not fit
+            self._data[key] = (value, size)
+            self._bytes += size
+            while self._data and (self._bytes > self.max_bytes or len(self._data) > self.max_entries):
+                _, (_, s) = self._data.popitem(last=False)
+                self._bytes -= s
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            kinds: Dict[str, int] = {}
+            for k in self._data:
+                kinds[str(k[0])] = kinds.get(str(k[0]), 0) + 1
+            return {"entries": len(self._data), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "max_entries": self.max_entries, "by_kind": kinds, "hits": dict(self.hits),
+                    "misses": dict(self.misses), "evictions": self.evictions}
+
+# one budget shared by feature tables and detection results
+_cache = BoundedLRU(int(CACHE_MAX_MB * 1024 * 1024), CACHE_MAX_ENTRIES)
+
+_shared_hits = [0]  # results served by the shared cache instead of recomputed
+
+# per-page reuse: {page: {"calls", "memory", "shared", "computed"}}
+_page_stats: Dict[str, Dict[str, int]] = {}
+_page_lock = threading.Lock()
+
+def _count(page: str, outcome: str) -> None:
+    with _page_lock:
+        st = _page_stats.setdefault(page or "other", {"calls": 0, "memory": 0, "shared": 0, "computed": 0})
+        st["calls"] += 1
+        st[outcome] += 1
+
+def cached_value(key: Tuple, fn: Callable[[], Any]) -> Any:
+    """Value for key from the process LRU, computed with fn() and stored on a miss."""
+    value = _cache.get(key)
+    if value is None:
+        value = fn()
+        _cache.put(key, value)
+    return value
+
+def cache_stats() -> Dict[str, Any]:
+    out = _cache.stats()
+    out["shared_hits"] = _shared_hits[0]
+    out["shared"] = get_result_cache().stats()
+    with _page_lock:
+        out["pages"] = {p: dict(st, reuse_rate=round((st["memory"] + st["shared"]) / st["calls"], 3))
+                        for p, st in _page_stats.items() if st["calls"]}
+    out["pid"] = os.getpid()
+    return out
+
+# ---------------- Keys ----------------
+def _db_version(TRAIT_DB: Optional[Dict[str, Any]] = None) -> str:
+    from utils.trait_db import _get_live_db, trait_db_version  # lazy import
+    db = _get_live_db(TRAIT_DB)
+    # a DB built without a version tag is still told apart from other instances
+    return trait_db_version(db) or f"id:{id(db)}"
+
+def resolve_cached_features(features: FeatureInput) -> FeatureTable:
+    """
+    FeatureTable for a store-features handle, a FeatureTable or a feature
+    list. Handles are looked up by their feature-store key (computed once
+    at upload) so repeat callbacks skip the feature store.
+    """
+    digest = handle_digest(features)
+    if not digest:
+        # a handle without a usable digest resolves to no features
+        return as_feature_table([] if isinstance(features, dict) else features)
+    key = ("features", digest)
+    table = _cache.get(key)
+    if table is None:
+        table = resolve_features(features)
+        # a store miss resolves to an empty table: don't pin that under the digest
+        if len(table) == int((features or {}).get("n_features", len(table)) or 0):
+            _cache.put(key, table)
+    return table
+
+# ---------------- Cached detection ----------------
+def cached_detect_all(features: FeatureInput, genome_name: str,
+                      TRAIT_DB: Optional[Dict[str, Any]] = None,
+                      page: str = "",
+                      progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Tuple[Any, Any]]:
+    """
+    Cached wrapper around trait_db.detect_all: one matching pass for all
+    categories, shared by the module pages and the results page.
+    `features` is the store-features handle ({"digest", ...}) or a feature list.
+    Cache key = (sha256 of the feature table, genome, trait-DB version): the
+    digest covers every row, so results are only shared by identical tables.
+    Lookups go process LRU -> shared result cache (other workers) -> compute;
+    `page` tags the call for the per-page reuse counters in cache_stats();
+    `progress` is handed to detect_all when the result has to be computed.
+    """
+    from utils.trait_db import detect_all, get_trait_index  # lazy import
+
+    table = resolve_cached_features(features)
+    digest, version = table.content_digest(), _db_version(TRAIT_DB)
+    key = ("detect", digest, genome_name, version)
+    res = _cache.get(key)
+    if res is not None:
+        _count(page, "memory")
+        return res
+
+    shared = get_result_cache()
+    cats = list(get_trait_index(TRAIT_DB)["traits"].keys())
+    skeys = {c: cache_key("detect", digest, c, genome_name, version) for c in cats}
+    found = shared.get_many(skeys.values())
+    if cats and len(found) == len(cats):
+        res = {c: found[skeys[c]] for c in cats}
+        _shared_hits[0] += 1
+        _count(page, "shared")
+    else:
+        res = detect_all(table, genome_name, TRAIT_DB, progress=progress)
+        shared.set_many({skeys[c]: res[c] for c in cats if c in res})
+        _count(page, "computed")
+    _cache.put(key, res)
+    return res
 
 def cached_build_detection(category: str,
-                           features: List[Dict[str, Any]],
-                           genome_name: str):
+                           features: FeatureInput,
+                           genome_name: str,
+                           page: str = ""):
     """
-    Cached wrapper around trait_db.build_detection_table_and_hits.
-    Cache key = (category, genome, fingerprint(features)).
+    Per-category view of cached_detect_all, same (summary, hits) as
+    trait_db.build_detection_table_and_hits.
     """
-    from utils.trait_db import build_detection_table_and_hits  # lazy import
+    res = cached_detect_all(features, genome_name, page=page).get(category)
+    if res is None:
+        from utils.trait_db import build_detection_table_and_hits  # lazy import
+        res = build_detection_table_and_hits(category, [], genome_name)
+    return res
+
+# ---------------- Result bundle ----------------
+# One pipeline run per upload materialises every module's (summary, hits)
+# and the composite score; all pages render from this bundle. The browser's
+# store-bundle only holds a ref {"id", "features" (feature handle), "genome"}.
+RESULTS_EXPIRED = "Results expired; please upload the file again."
 
-    fp = _fingerprint_features(features or [])
-    _blob_cache[fp] = features or []
-    return _cached_core(category, genome_name, fp, build_detection_table_and_hits)
+def bundle_id(digest: str, genome_name: str, version: str) -> str:
+    return hashlib.sha256(f"{digest}|{genome_name}|{version}".encode()).hexdigest()[:24]
+
+def build_result_bundle(features: FeatureInput, genome_name: str,
+                        TRAIT_DB: Optional[Dict[str, Any]] = None,
+                        progress: Optional[Callable[[str, float], None]] = None) -> Dict[str, Any]:
+    """
+    detect_all + score_detection (+ each module's bar figure) for one genome,
+    kept in the process LRU and the shared result cache. progress(stage,
+    fraction) reports "detect"/"score".
+    """
+    from utils.trait_db import detect_all  # lazy import
+    from utils.score_engine import score_detection
+
+    table = resolve_cached_features(features)
+    version = _db_version(TRAIT_DB)
+    det = detect_all(table, genome_name, TRAIT_DB,
+                     progress=(lambda d, t: progress("detect", d / t)) if progress else None)
+    if progress:
+        progress("score", 0.0)
+    bundle = {"id": bundle_id(table.content_digest(), genome_name, version), "genome": genome_name,
+              "version": version, "n_features": len(table), "modules": det,
+              "figures": {cat: bar_figure(summary) for cat, (summary, _) in det.items()},
+              "score": score_detection(det, TRAIT_DB)}
+    _cache.put(("bundle", bundle["id"]), bundle)
+    get_result_cache().set(cache_key("bundle", bundle["id"]), bundle)
+    return bundle
+
+def bundle_ref(bundle: Dict[str, Any], features: FeatureInput) -> Dict[str, Any]:
+    """Browser-side reference to a bundle (enough to rebuild it if it was evicted)."""
+    return {"id": bundle["id"], "features": features, "genome": bundle["genome"]}
+
+def get_result_bundle(ref: Optional[Dict[str, Any]], TRAIT_DB: Optional[Dict[str, Any]] = None,
+                      page: str = "", rebuild: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Bundle for a store-bundle ref: process LRU -> shared cache -> rebuilt
+    from the ref's features (unless rebuild=False, then None). None as well
+    when the rebuild does not reproduce ref["id"] (e.g. the feature handle
+    expired), so callers show RESULTS_EXPIRED instead of empty results.
+    """
+    if not ref or not ref.get("id"):
+        return None
+    key = ("bundle", ref["id"])
+    bundle = _cache.get(key)
+    if bundle is not None:
+        _count(page, "memory")
+        return bundle
+    bundle = get_result_cache().get(cache_key("bundle", ref["id"]))
+    if bundle is not None:
+        _shared_hits[0] += 1
+        _count(page, "shared")
+        _cache.put(key, bundle)
+        return bundle
+    if not rebuild:
+        return None
+    _count(page, "computed")
+    bundle = build_result_bundle(ref.get("features"), ref.get("genome") or "query", TRAIT_DB)
+    return bundle if bundle["id"] == ref["id"] else None
 
-@lru_cache(maxsize=128)
-def _cached_core(category: str,
-                 genome_name: str,
-                 fp: str,
-                 _builder) -> Tuple[Any, Any]:
-    feats = _blob_cache.get(fp, [])
-    return _builder(category, feats, genome_name)
+def bundle_module(bundle: Optional[Dict[str, Any]], category: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """(summary, hits) of one module; empty frames when there is no bundle."""
+    res = (bundle or {}).get("modules", {}).get(category)
+    if res is None:
+        from utils.trait_db import build_detection_table_and_hits  # lazy import
+        res = build_detection_table_and_hits(category, [], (bundle or {}).get("genome") or "query")
+    return res
 
+def bundle_figure(bundle: Optional[Dict[str, Any]], category: str) -> Dict[str, Any]:
+    """One module's bar figure dict, built once per bundle."""
+    figures = bundle.setdefault("figures", {}) if bundle is not None else {}
+    fig = figures.get(category)
+    if fig is None:
+        fig = figures[category] = bar_figure(bundle_module(bundle, category)[0])
+    return fig
@@ -0,0 +1,265 @@
+# utils/result_cache.py
+from __future__ import annotations
+
+import os, pickle, sqlite3, stat, tempfile, threading, time, warnings
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+# Result cache shared by every gunicorn worker on the host (SQLite file), or
+# by every host (Redis). perf.py keeps a per-process LRU in front of it.
+#   RESULT_CACHE_URL  sqlite:///path/to/results.sqlite (default: a 0o700
+#                     folder of this user's in the temp dir)
+#                     redis://host:6379/0  (needs the optional `redis` package)
+#                     off                  (disable the shared layer)
+RESULT_CACHE_URL = os.environ.get("RESULT_CACHE_URL", "")
+RESULT_CACHE_TTL_S = int(os.environ.get("RESULT_CACHE_TTL", str(24 * 3600)))
+RESULT_CACHE_MAX_MB = float(os.environ.get("RESULT_CACHE_MB", "512"))
+DEFAULT_SQLITE_PATH = Path(tempfile.gettempdir()) / "dairybiocontrol" / "results.sqlite"
+
+def cache_key(*parts: Any) -> str:
+    """e.g. cache_key("detect", digest, category, genome, db_version)"""
+    return "|".join(str(p) for p in parts)
+
+def private_dir(path: Path) -> Path:
+    """
+    mkdir -p with mode 0o700 for a directory whose pickles are loaded back.
+    One that already exists must be a real directory owned by this user
+    (it is narrowed to 0o700); anything else raises PermissionError.
+    """
+    path = Path(path)
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or (hasattr(os, "getuid") and st.st_uid != os.getuid()):
+        raise PermissionError(f"{path} is not a directory owned by this user")
+    if st.st_mode & 0o077:
+        os.chmod(path, 0o700)
+    return path
+
+def _dumps(value: Any) -> bytes:
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+def _loads(blob: Optional[bytes]) -> Optional[Any]:
+    if blob is None:
+        return None
+    try:
+        return pickle.loads(blob)
+    except Exception:
+        return None
+
+# ---------------- Backends ----------------
+class NullCache:
+    name = "off"
+
+    def get(self, key: str) -> Optional[Any]:
+        return None
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        return {}
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+class SQLiteCache(NullCache):
+    """
+    One SQLite file shared across processes (WAL mode). Entries expire after
+    `ttl_s`; when the total payload exceeds `max_bytes` the least recently
+    read entries go first.
+    """
+    name = "sqlite"
+
+    def __init__(self, path: Path, ttl_s: int, max_bytes: int):
+        self.path = Path(path)
+        self.ttl_s = int(ttl_s)
+        self.max_bytes = int(max_bytes)
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL,"
+            " expires REAL NOT NULL, accessed REAL NOT NULL)")
+        self._conn().execute("CREATE INDEX IF NOT EXISTS results_accessed ON results(accessed)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread, reopened after fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(str(self.path), timeout=10, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        now = time.time()
+        marks = ",".join("?" * len(keys))
+        try:
+            conn = self._conn()
+            rows = conn.execute(f"SELECT key, value FROM results WHERE key IN ({marks}) AND expires > ?",
+                                (*keys, now)).fetchall()
+            if rows:
+                conn.execute(f"UPDATE results SET accessed = ? WHERE key IN ({marks})", (now, *keys))
+        except sqlite3.Error:
+            return {}
+        out = {}
+        for k, blob in rows:
+            v = _loads(blob)
+            if v is not None:
+                out[k] = v
+        return out
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for k, v in items.items():
+            blob = _dumps(v)
+            rows.append((k, sqlite3.Binary(blob), len(blob), now + self.ttl_s, now))
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany("INSERT OR REPLACE INTO results VALUES (?,?,?,?,?)", rows)
+                self._evict(conn, now)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            pass  # shared cache is best-effort
+
+    def set(self, key: str, value: Any) -> None:
+        self.set_many({key: value})
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM results WHERE expires <= ?", (now,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        drop: List[str] = []
+        for k, size in conn.execute("SELECT key, size FROM results ORDER BY accessed ASC"):
+            if total <= self.max_bytes:
+                break
+            drop.append(k)
+            total -= size
+        conn.executemany("DELETE FROM results WHERE key = ?", [(k,) for k in drop])
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            n, size = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        except sqlite3.Error:
+            n, size = 0, 0
+        return {"backend": self.name, "path": str(self.path), "entries": n, "bytes": size,
+                "max_bytes": self.max_bytes, "ttl_s": self.ttl_s}
+
+class RedisCache(NullCache):
+    """
+    Any server speaking the Redis protocol. TTL via SET EX; size-based
+    eviction is the server's job (maxmemory + an allkeys-lru policy).
+    """
+    name = "redis"
+
+    def __init__(self, url: str, ttl_s: int, prefix: str = "dbc:"):
+        import redis  # optional dependency
+        self.client = redis.Redis.from_url(url, socket_timeout=2)
+        self.url = url
+        self.ttl_s = int(ttl_s)
+        self.prefix = prefix
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        try:
+            blobs = self.client.mget([self.prefix + k for k in keys])
+        except Exception:
+            return {}
+        out = {}
+        for k, blob in zip(keys, blobs):
+            v = _loads(blob)
+            if v is not None:
+                out[k] = v
+        return out
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        if not items:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for k, v in items.items():
+                pipe.set(self.prefix + k, _dumps(v), ex=self.ttl_s)
+            pipe.execute()
+        except Exception:
+            pass  # shared cache is best-effort
+
+    def set(self, key: str, value: Any) -> None:
+        self.set_many({key: value})
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"backend": self.name, "url": self.url.split("@")[-1], "ttl_s": self.ttl_s}
+        try:
+            mem = self.client.info("memory")
+            out["used_memory"] = mem.get("used_memory")
+            out["maxmemory_policy"] = mem.get("maxmemory_policy")
+        except Exception:
+            pass
+        return out
+
+# ---------------- Factory ----------------
+_backend: Optional[NullCache] = None
+_backend_lock = threading.Lock()
+
+def make_backend(url: str = "") -> NullCache:
+    url = (url or "").strip()
+    max_bytes = int(RESULT_CACHE_MAX_MB * 1024 * 1024)
+    if url.lower() in ("off", "none", "0"):
+        return NullCache()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            return RedisCache(url, RESULT_CACHE_TTL_S)
+        except ImportError:
+            warnings.warn("RESULT_CACHE_URL is redis but the `redis` package is not installed; "
+                          "using the SQLite result cache")
+            url = ""
+    try:
+        if url.startswith("sqlite:///"):
+            path = Path(url[len("sqlite:///"):])
+        else:
+            # the default sits in the shared temp dir, where another user could plant pickles
+            path = private_dir(DEFAULT_SQLITE_PATH.parent) / DEFAULT_SQLITE_PATH.name
+        return SQLiteCache(path, RESULT_CACHE_TTL_S, max_bytes)
+    except PermissionError as e:
+        warnings.warn(f"shared result cache disabled: {e}")
+        return NullCache()
+    except (OSError, sqlite3.Error):
+        return NullCache()
+
+def get_result_cache() -> NullCache:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = make_backend(RESULT_CACHE_URL)
+    return _backend
+
+def set_result_cache(backend: Optional[NullCache]) -> None:
+    """Swap the backend (e.g. make_backend("redis://localhost:6379/0")); None resets to RESULT_CACHE_URL."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -0,0 +1,97 @@
+# utils/score_engine.py
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Composite Biocontrol score, as shown on the Results page, for one genome or
+# many at once. Inputs are two match matrices (one row per genome):
+#   benefit_w (G, 3)  weighted hits per benefit module (BENEFIT_MODULES order)
+#   safety_n  (G, 3)  distinct ARG / VF / TA hits (SAFETY_TRAITS order)
+# utils/scoring.py is the separate Monte Carlo evidence model.
+BENEFIT_MODULES = (("DairyAdaptation", 40), ("Antibacterial", 30), ("Antifungal", 30))  # (category, top-K cap)
+SAFETY_TRAITS = ("ARGs", "Virulence Factors", "Toxin-Antitoxin")
+GAMMA = 0.5  # gentler penalty
+
+Detection = Dict[str, Tuple[pd.DataFrame, pd.DataFrame]]
+
+def reference_caps(TRAIT_DB: Optional[Dict[str, Any]] = None) -> np.ndarray:
+    """
+    Per-module reference caps (sum of the top-K gene weights). Computed once
+    per loaded DB and kept on its compiled trait index.
+    """
+    from utils.trait_db import get_module_ref_cap, get_trait_index  # lazy import
+    index = get_trait_index(TRAIT_DB)
+    caps = index.get("ref_caps")
+    if caps is None:
+        caps = np.array([get_module_ref_cap(c, k, TRAIT_DB) for c, k in BENEFIT_MODULES], dtype=float)
+        index["ref_caps"] = caps
+    return caps
+
+def match_vectors(det: Detection) -> Tuple[np.ndarray, np.ndarray]:
+    """One genome's detect_all result -> (benefit_w (3,), safety_n (3,))."""
+    benefit_w = np.zeros(len(BENEFIT_MODULES))
+    safety_n = np.zeros(len(SAFETY_TRAITS), dtype=np.int64)
+    for b, (cat, _) in enumerate(BENEFIT_MODULES):
+        hits = det.get(cat, (None, None))[1]
+        if hits is not None and not hits.empty:
+            benefit_w[b] = float(hits["Weight"].sum())
+    hits = det.get("Safety", (None, None))[1]
+    if hits is not None and not hits.empty:
+        n = hits.groupby("Trait")["Hit"].nunique()
+        safety_n[:] = [int(n.get(t, 0)) for t in SAFETY_TRAITS]
+    return benefit_w, safety_n
+
+def match_matrices(dets: Iterable[Detection]) -> Tuple[np.ndarray, np.ndarray]:
+    """Stacked match_vectors: (G, 3) benefit weights and (G, 3) safety counts."""
+    rows = [match_vectors(d) for d in dets]
+    if not rows:
+        return np.zeros((0, len(BENEFIT_MODULES))), np.zeros((0, len(SAFETY_TRAITS)), dtype=np.int64)
+    return np.vstack([b for b, _ in rows]), np.vstack([s for _, s in rows])
+
+def score_matrices(benefit_w: np.ndarray, safety_n: np.ndarray,
+                   TRAIT_DB: Optional[Dict[str, Any]] = None,
+                   ref_cap: Optional[float] = None, gamma: float = GAMMA) -> Dict[str, np.ndarray]:
+    """
+    Score components for G genomes (1-D inputs are one genome):
+      benefit = Σ module weights, norm_benefit = benefit / ref_cap,
+      PPRS = ‖safety_n‖₂, PPRI = PPRS / (1 + PPRS),
+      Biocontrol = clip(100 · norm_benefit / (1 + gamma · PPRI), 0, 100).
+    """
+    benefit_w = np.asarray(benefit_w, dtype=float).reshape(-1, len(BENEFIT_MODULES))
+    safety_n = np.asarray(safety_n, dtype=float).reshape(-1, len(SAFETY_TRAITS))
+    if ref_cap is None:
+        ref_cap = float(reference_caps(TRAIT_DB).sum())
+    ref_cap = max(float(ref_cap), 1e-9)
+    benefit = benefit_w.sum(axis=1)
+    pprs = np.sqrt((safety_n ** 2).sum(axis=1))
+    ppri = pprs / (1.0 + pprs)
+    norm_benefit = benefit / ref_cap
+    return {"benefit_w": benefit_w, "safety_n": safety_n, "benefit": benefit, "norm_benefit": norm_benefit,
+            "PPRS": pprs, "PPRI": ppri, "ref_cap": ref_cap,
+            "Biocontrol": np.clip(100.0 * norm_benefit / (1.0 + gamma * ppri), 0.0, 100.0)}
+
+def score_detection(det: Detection, TRAIT_DB: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Single-genome score_matrices with scalar components."""
+    sc = score_matrices(*match_vectors(det), TRAIT_DB=TRAIT_DB)
+    return {k: (v[0] if isinstance(v, np.ndarray) else v) for k, v in sc.items()}
+
+def scores_frame(names: Sequence[str], n_features: Sequence[int], n_traits: Sequence[int],
+                 benefit_w: np.ndarray, safety_n: np.ndarray,
+                 TRAIT_DB: Optional[Dict[str, Any]] = None, ref_cap: Optional[float] = None) -> pd.DataFrame:
+    """Per-genome score table (Batch page, CLI)."""
+    sc = score_matrices(benefit_w, safety_n, TRAIT_DB, ref_cap)
+    bw, sn = sc["benefit_w"], sc["safety_n"].astype(np.int64)
+    return pd.DataFrame({
+        "Genome": list(names),
+        "Features": list(n_features),
+        "Traits detected": list(n_traits),
+        "Adaptation (w)": bw[:, 0].round(3),
+        "Antibacterial (w)": bw[:, 1].round(3),
+        "Antifungal (w)": bw[:, 2].round(3),
+        "ARGs": sn[:, 0], "VFs": sn[:, 1], "TAs": sn[:, 2],
+        "PPRI": sc["PPRI"].round(4),
+        "Biocontrol": sc["Biocontrol"].round(2),
+    })
@@ -1,7 +1,13 @@
+# utils/scoring.py
+# Monte Carlo evidence model (tier-weighted BPI intervals). The composite
+# Biocontrol score shown in the app, Batch page and CLI is utils/score_engine.py.
 from typing import List, Dict, Tuple
 import numpy as np
 import pandas as pd
 
+from utils.features import as_feature_table
+from utils.matchers import ECTrie, KeywordAutomaton, ec_prefix_match
+
 TIER_WEIGHTS = {"gene":1.0,"product":0.6,"ko":0.6,"ec":0.6,"context":0.3}
 
 def normalize(s): return (s or "").strip().lower()
@@ -22,33 +28,107 @@ def get_trait_entry(db, category, trait):
         out["EC"] = [str(x) for x in val.get("EC",[])]
     return out
 
+def _ko_hit(value, kos):
+    """A feature's KO field may carry several ids ("K01190;K12308")."""
+    return any(k in kos for k in str(value).split(";") if k)
+
 def match_feature_to_trait(feature, entry):
     g = normalize(feature.get("gene")); p = normalize(feature.get("product"))
     ko = feature.get("KO",""); ec = feature.get("EC","")
     genes = [normalize(x) for x in entry.get("genes",[])]
     if g and g in genes: return "gene"
     if p and fuzzy_contains_any(p, entry.get("product_keywords", [])): return "product"
-    if ko and ko in entry.get("KO", []): return "ko"
-    if ec and any(str(ec).startswith(prefix) for prefix in entry.get("EC", [])): return "ec"
+    if ko and _ko_hit(ko, entry.get("KO", [])): return "ko"
+    if ec and ec_prefix_match(str(ec), entry.get("EC", [])): return "ec"
     return None
 
+class ScoringIndex:
+    """
+    Per-DB matchers, built once (see scoring_index). `products` is one
+    Aho-Corasick automaton over every trait's product keywords, so a
+    feature's product is scanned once for all (category, trait) pairs;
+    `ecs` is an EC prefix trie ("3.2.1.-" covers 3.2.1.*).
+    """
+    def __init__(self, db):
+        kws=[]; always=set(); ecs=ECTrie()
+        for cat, val in db.items():
+            if not (isinstance(val, dict) and isinstance(val.get("Subcategories"), dict)): continue
+            for trait in val["Subcategories"]:
+                entry = get_trait_entry(db, cat, trait)
+                for k in entry["product_keywords"]:
+                    nk = normalize(k)
+                    if nk: kws.append((nk, (cat, trait)))
+                    elif k: always.add((cat, trait))  # fuzzy_contains_any: "" is in every text
+                for e in entry["EC"]:
+                    ecs.add(e, (cat, trait))
+        self.products = KeywordAutomaton(kws)
+        self.always = frozenset(always)
+        self.ecs = ecs
+
+    def product_traits(self, product):
+        """(category, trait) pairs whose keywords occur in the normalised product."""
+        p = normalize(product)
+        return (self.products.find(p) | self.always) if p else frozenset()
+
+    def ec_traits(self, ec):
+        """(category, trait) pairs with an EC pattern covering any of the feature's ECs."""
+        return self.ecs.find(ec) if ec else frozenset()
+
+_INDEX_KEY = "_scoring_index"
+
+def scoring_index(db):
+    idx = db.get(_INDEX_KEY) if isinstance(db, dict) else None
+    if idx is None:
+        idx = ScoringIndex(db)
+        if isinstance(db, dict): db[_INDEX_KEY] = idx
+    return idx
+
+_TIER_ORDER = ("gene", "product", "ko", "ec")
+
+def match_tiers(table, entry, index=None, key=None):
+    """
+    Vectorized match_feature_to_trait over a FeatureTable: tier label per row
+    ("" where nothing matched). Each distinct gene/product/KO/EC is tested once;
+    with a ScoringIndex and the entry's (category, trait) key, products come
+    from the shared keyword automaton instead of per-keyword substring tests.
+    """
+    genes = {normalize(x) for x in entry.get("genes",[])}
+    kws = entry.get("product_keywords", [])
+    kos = entry.get("KO", []); ecs = entry.get("EC", [])
+    if index is not None and key is not None:
+        products = [key in found for found in table.derived("product", index.product_traits)]
+        ec_hits = [key in found for found in table.derived("EC", index.ec_traits)]
+    else:
+        products = [bool(p) and fuzzy_contains_any(p, kws) for p in table.derived("product", normalize)]
+        ec_hits = [bool(e) and ec_prefix_match(e, ecs) for e in table.categories("EC")]
+    cats = (
+        ("gene",    [bool(g) and g in genes for g in table.derived("gene", normalize)]),
+        ("product", products),
+        ("KO",      [bool(k) and _ko_hit(k, kos) for k in table.categories("KO")]),
+        ("EC",      ec_hits),
+    )
+    masks = [table.row_mask(col, m) for col, m in cats]
+    return np.select(masks, list(_TIER_ORDER), default="") if len(table) else np.array([], dtype="<U7")
+
 def build_detection_table_and_hits(db, category, features, genome_name):
+    table = as_feature_table(features)
     subs = db.get(category,{}).get("Subcategories",{})
+    index = scoring_index(db)
     rows=[]; hits=[]
     for trait in sorted(subs.keys()):
         entry = get_trait_entry(db, category, trait)
+        tiers = match_tiers(table, entry, index, (category, trait))
         matched=set(); count=0
-        for f in features:
-            tier = match_feature_to_trait(f, entry)
-            if not tier: continue
+        for i in np.flatnonzero(tiers != ""):
+            f = table.record(i)
             disp = f.get("gene") or f.get("product") or f.get("KO") or f.get("EC") or ""
             disp = (disp or "").strip()
             if disp: matched.add(disp)
             count+=1
             hits.append({
                 "Genome":genome_name,"Trait":trait,"Category":category,
-                "Hit":disp,"Product":f.get("product",""),"Tier":tier,
-                "LengthAA":len(f.get("translation","") or ""),
+                "Hit":disp,"Product":f.get("product",""),"Tier":str(tiers[i]),
+                "LengthAA":int(table.aa_len[i]),
                 "Locus":f.get("locus_tag",""),"Start":f.get("start",0),
                 "End":f.get("end",0),"Strand":f.get("strand",0)
             })
@@ -62,8 +142,9 @@ def build_detection_table_and_hits(db, category, features, genome_name):
 def compute_ppri_counts(db, features):
     _, hits = build_detection_table_and_hits(db, "Safety", features, "query")
     buckets = {"ARGs":0,"Virulence Factors":0,"Toxins/Enterotoxins":0}
-    for _,r in hits.iterrows():
-        if r["Trait"] in buckets: buckets[r["Trait"]] += 1
+    if not hits.empty:
+        for trait, k in hits["Trait"].value_counts().items():
+            if trait in buckets: buckets[trait] = int(k)
     return {"ARGs": buckets["ARGs"], "VFs": buckets["Virulence Factors"], "PGs": buckets["Toxins/Enterotoxins"]}
 
 def compute_pprs(ppri): 
@@ -73,15 +154,16 @@ def compute_pprs(ppri):
 def norm01(x,k=1.0): return float(1.0 - np.exp(-k*max(0.0,x)))
 
 def compute_evidence_scores(db, features):
+    features = as_feature_table(features)
     trait_rows=[]; S_by_cat={"DairyAdaptation":0.0,"Antibacterial":0.0,"Antifungal":0.0}
+    index = scoring_index(db)
     for cat in list(S_by_cat.keys()):
         sub = db.get(cat,{}).get("Subcategories",{})
         for trait in sub.keys():
             entry = get_trait_entry(db, cat, trait)
             E=0.0
-            for f in features:
-                tier = match_feature_to_trait(f, entry)
-                if tier: E += TIER_WEIGHTS.get(tier,0.3)*1.0
+            for tier in match_tiers(features, entry, index, (cat, trait)):
+                if tier: E += TIER_WEIGHTS.get(str(tier),0.3)*1.0
             trait_rows.append({"Trait":trait,"Category":cat,"E_trait":E})
             S_by_cat[cat] += norm01(E, k=0.8)
     trait_df = pd.DataFrame(trait_rows)
@@ -92,31 +174,43 @@ def compute_evidence_scores(db, features):
     BPI = benefit/(1.0 + 1.0*PPRI_norm)
     return trait_df, S_by_cat, BPI
 
+# Monte Carlo weight ranges, one column per tier (_MC_TIERS order)
+_MC_TIERS = ("gene", "product", "ko", "ec", "context")
+_MC_LOW  = np.array([0.9, 0.5, 0.5, 0.5, 0.2])
+_MC_HIGH = np.array([1.0, 0.7, 0.7, 0.7, 0.4])
+
+def tier_count_matrix(db, features, cats):
+    """
+    (counts, trait_cat): counts[t, j] = features matching trait t at tier
+    _MC_TIERS[j]; trait_cat[t] = index into cats. Matches don't depend on
+    weights, so this is computed once per genome.
+    """
+    table = as_feature_table(features)
+    index = scoring_index(db)
+    counts=[]; trait_cat=[]
+    for ci, c in enumerate(cats):
+        for trait in (db.get(c,{}).get("Subcategories",{})).keys():
+            tiers = match_tiers(table, get_trait_entry(db,c,trait), index, (c, trait))
+            counts.append([int(np.count_nonzero(tiers == t)) for t in _MC_TIERS])
+            trait_cat.append(ci)
+    return np.array(counts, dtype=float).reshape(-1, len(_MC_TIERS)), np.array(trait_cat, dtype=int)
+
 def compute_mc_intervals(db, features, n=1000, seed=13):
+    features = as_feature_table(features)
     rng=np.random.default_rng(seed)
     cats=["DairyAdaptation","Antibacterial","Antifungal"]
-    sims={c:[] for c in cats}; sims["BPI"]=[]
-    for _ in range(n):
-        w = {"gene":rng.uniform(0.9,1.0),"product":rng.uniform(0.5,0.7),
-             "ko":rng.uniform(0.5,0.7),"ec":rng.uniform(0.5,0.7),"context":rng.uniform(0.2,0.4)}
-        S={}
-        for c in cats:
-            Sval=0.0
-            for trait in (db.get(c,{}).get("Subcategories",{})).keys():
-                entry = get_trait_entry(db,c,trait)
-                E=0.0
-                for f in features:
-                    tier = match_feature_to_trait(f,entry)
-                    if tier: E += w.get(tier, w["context"])*1.0
-                Sval += norm01(E, k=0.8)
-            S[c]=Sval
-        ppri = compute_ppri_counts(db, features)
-        risk_raw = ppri["ARGs"]+ppri["VFs"]+ppri["PGs"]
-        PPRI_norm = risk_raw/(risk_raw+5.0) if risk_raw>=0 else 0.0
-        sims["BPI"].append(sum(S.values())/(1.0+PPRI_norm))
-        for c in cats: sims[c].append(S[c])
+    counts, trait_cat = tier_count_matrix(db, features, cats)
+    # same stream as drawing gene/product/ko/ec/context per iteration
+    W = rng.uniform(_MC_LOW, _MC_HIGH, size=(n, len(_MC_TIERS)))
+    E = W @ counts.T                                   # (n, traits)
+    N = 1.0 - np.exp(-0.8*np.maximum(E, 0.0))          # norm01 per trait
+    S = np.stack([N[:, trait_cat == ci].sum(axis=1) for ci in range(len(cats))], axis=1)
+    ppri = compute_ppri_counts(db, features)
+    risk_raw = ppri["ARGs"]+ppri["VFs"]+ppri["PGs"]
+    PPRI_norm = risk_raw/(risk_raw+5.0) if risk_raw>=0 else 0.0
+    sims={c:S[:, ci] for ci, c in enumerate(cats)}
+    sims["BPI"]=S.sum(axis=1)/(1.0+PPRI_norm)
     ci={}
     for k,arr in sims.items():
         lo,hi=np.percentile(arr,[2.5,97.5]); ci[k]=(float(lo),float(hi))
     return ci
-
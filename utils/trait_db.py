@@ -1,11 +1,14 @@
 from __future__ import annotations
 
-import json, re
+import gc, hashlib, json, os, pickle, re, tempfile
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple, Set
+from typing import Any, Callable, Dict, List, Optional, Tuple, Set
 
+import numpy as np
 import pandas as pd
 
+from utils.features import FeatureInput, FeatureTable, XREF_NAMESPACES, as_feature_table, normalize_xref
+
 # ---------------- Files ----------------
 ASSETS = Path("assets")
 
@@ -19,6 +22,13 @@ ADAPT_CSV    = ASSETS / "adaptation_db.csv"
 ANTIBACT_CSV = ASSETS / "antibacterial_db.csv"
 ANTIFUNG_CSV = ASSETS / "antifungal_db.csv"
 
+# Compiled snapshot of the whole DB (incl. the trait index). Built by
+# `python -m utils.trait_db` at deploy time, or on first load; reused while
+# the source tables hash the same. Bump SNAPSHOT_VERSION whenever the DB
+# layout or the builders change.
+SNAPSHOT_PATH = Path(os.environ.get("TRAIT_DB_SNAPSHOT", "build/trait_db.snapshot.pkl"))
+SNAPSHOT_VERSION = 3
+
 # ---- Counting / throttling ----
 MAX_PER_TRAIT = 150
 INTEGER_WEIGHT = 1.0  # every unique hit counts as 1 in the module pages
@@ -76,12 +86,26 @@ def _to_list(x: Any) -> List[Any]:
     return [x]
 
 # ---------------- Canonical entry coercer ----------------
+# non-KO ID namespaces carried in an entry's "xrefs" list ("COG:COG0001", ...)
+_XREF_KEYS = {ns: (ns, ns.lower(), {"PFAM": "Pfam", "UNIPROT": "UniProt", "INTERPRO": "InterPro"}.get(ns, ns))
+              for ns in XREF_NAMESPACES if ns != "KO"}
+
+def _xrefs_from(obj: Dict[str, Any]) -> List[str]:
+    out = [x for x in (normalize_xref(_norm_str(v)) for v in _to_list(obj.get("xrefs", []))) if x]
+    for ns, keys in _XREF_KEYS.items():
+        for key in keys:
+            v = obj.get(key)
+            vals = v if isinstance(v, list) else ([v] if isinstance(v, str) else [])
+            out.extend(x for x in (normalize_xref(_norm_str(i), ns) for i in vals) if x)
+    return out
+
 def _coerce_entry(any_obj: Any) -> Dict[str, List[str]]:
-    out = {"genes": [], "product_keywords": [], "KO": [], "EC": []}
+    out = {"genes": [], "product_keywords": [], "KO": [], "EC": [], "xrefs": []}
     if any_obj is None:
         return out
 
-    def _finish(genes: List[str], prods: List[str], kos: List[str], ecs: List[str]) -> Dict[str, List[str]]:
+    def _finish(genes: List[str], prods: List[str], kos: List[str], ecs: List[str],
+                xrefs: List[str] = ()) -> Dict[str, List[str]]:
         prods_n = []
         for p in prods:
             pn = _norm_product(p)
@@ -92,15 +116,16 @@ def _coerce_entry(any_obj: Any) -> Dict[str, List[str]]:
             "product_keywords": sorted({q for q in prods_n if q}),
             "KO": sorted({_norm_str(k) for k in kos if _norm_str(k)}),
             "EC": sorted({_norm_str(e) for e in ecs if _norm_str(e)}),
+            "xrefs": sorted({x for x in xrefs if x and not x.startswith("KO:")}),
         }
 
     # canonical dict?
-    if isinstance(any_obj, dict) and any(k in any_obj for k in ("genes","product_keywords","KO","EC")):
+    if isinstance(any_obj, dict) and any(k in any_obj for k in ("genes","product_keywords","KO","EC","xrefs")):
         genes = [_norm_lower(g) for g in _to_list(any_obj.get("genes", []))]
         prods = [_norm_product(k) for k in _to_list(any_obj.get("product_keywords", []))]
         kos   = [_norm_str(k) for k in _to_list(any_obj.get("KO", []))]
         ecs   = [_norm_str(k) for k in _to_list(any_obj.get("EC", []))]
-        return _finish(genes, prods, kos, ecs)
+        return _finish(genes, prods, kos, ecs, _xrefs_from(any_obj))
 
     # list[str] => genes
     if isinstance(any_obj, list) and all(isinstance(x, str) for x in any_obj):
@@ -113,7 +138,7 @@ def _coerce_entry(any_obj: Any) -> Dict[str, List[str]]:
 
     # list[dict]
     if isinstance(any_obj, list) and all(isinstance(x, dict) for x in any_obj):
-        genes, prods, kos, ecs = [], [], [], []
+        genes, prods, kos, ecs, xrefs = [], [], [], [], []
         for row in any_obj:
             for gkey in ("gene","Gene","name","Name","symbol","Symbol","locus","locus_tag"):
                 if gkey in row and _norm_str(row[gkey]):
@@ -138,7 +163,8 @@ def _coerce_entry(any_obj: Any) -> Dict[str, List[str]]:
                     ecs.append(v)
                 elif isinstance(v, list):
                     ecs.extend(_norm_str(k) for k in v if _norm_str(k))
-        return _finish(genes, prods, kos, ecs)
+            xrefs.extend(_xrefs_from(row))
+        return _finish(genes, prods, kos, ecs, xrefs)
 
     # other dict shapes
     if isinstance(any_obj, dict):
@@ -155,9 +181,63 @@ def _merge_entries(a: Dict[str, List[str]], b: Dict[str, List[str]]) -> Dict[str
         "product_keywords": sorted(set(a.get("product_keywords",[])) | set(b.get("product_keywords",[]))),
         "KO":               sorted(set(a.get("KO",[]))               | set(b.get("KO",[]))),
         "EC":               sorted(set(a.get("EC",[]))               | set(b.get("EC",[]))),
+        "xrefs":            sorted(set(a.get("xrefs",[]))            | set(b.get("xrefs",[]))),
     }
 
 # ---------------- Robust readers ----------------
+_DELIMITERS = (",", "\t", ";", "|")
+
+def _sniff_delimiter(path: Path) -> Optional[str]:
+    """Delimiter from the header line; None for binary files (e.g. a spreadsheet saved as .csv)."""
+    with open(path, "rb") as fh:
+        head = fh.read(1 << 16)
+    if b"\x00" in head or head.startswith(b"PK\x03\x04"):
+        return None
+    header = head.decode("utf-8", errors="ignore").splitlines()[0] if head else ""
+    counts = {d: header.count(d) for d in _DELIMITERS}
+    best = max(_DELIMITERS, key=lambda d: counts[d])
+    return best if counts[best] else ("\t" if path.suffix.lower() == ".tsv" else ",")
+
+def _map_distinct(s: pd.Series, fn) -> pd.Series:
+    """Apply a vectorized Series->Series fn to the distinct values of s only, then broadcast back."""
+    codes, uniques = pd.factorize(s, use_na_sentinel=False)
+    if len(uniques) == len(s):
+        return fn(s)
+    mapped = fn(pd.Series(uniques, dtype=object)).to_numpy()
+    return pd.Series(mapped[codes], index=s.index)
+
+def _strip_strings(s: pd.Series) -> pd.Series:
+    # str.strip yields NaN for non-str cells; keep those as they were
+    def strip(x: pd.Series) -> pd.Series:
+        stripped = x.str.strip()
+        return stripped.where(stripped.notna(), x)
+    return _map_distinct(s, strip)
+
+def _norm_str_series(s: pd.Series) -> pd.Series:
+    """Vectorized _norm_str: `x or ""` (NaN is truthy -> "nan"), str(), strip."""
+    s = s.where(s.astype(bool), "")
+    return s.astype(str).str.strip()
+
+def _norm_product_series(s: pd.Series) -> pd.Series:
+    """Vectorized _norm_product."""
+    t = _norm_str_series(s).str.lower()
+    t = t.str.replace(r"[^a-z0-9\s\.\-\/]+", " ", regex=True)
+    return t.str.replace(r"\s+", " ", regex=True).str.strip()
+
+def _product_is_specific_series(p: pd.Series) -> pd.Series:
+    """Vectorized _product_is_specific, for _norm_product_series output (only [a-z] are letters)."""
+    n = p.str.len()
+    letters = p.str.count(r"[a-z]")
+    return (n >= 6) & ~p.isin(_GENERIC_PRODUCTS) & (letters >= 4) & (letters / n.clip(lower=1) >= 0.5)
+
+# optional exact-ID columns (lower-cased header aliases) -> namespace
+_ID_COLUMNS = {"KO": ("ko", "kegg_ko"), "COG": ("cog",), "PFAM": ("pfam",),
+               "UNIPROT": ("uniprot", "uniprotkb"), "INTERPRO": ("interpro",)}
+
+def _split_ids(s: pd.Series) -> pd.Series:
+    """Optional EC/ID column: "3.2.1.23; 3.2.1.-" -> ["3.2.1.23", "3.2.1.-"] per row (may hold "")."""
+    return s.fillna("").astype(str).str.strip().str.split(r"[;,\s]+", regex=True)
+
 def _read_table_auto(path: Path) -> Optional[pd.DataFrame]:
     try:
         if not path.exists():
@@ -170,23 +250,27 @@ def _read_table_auto(path: Path) -> Optional[pd.DataFrame]:
         if path.suffix.lower() in (".xlsx",".xls"):
             df = pd.read_excel(path)
         else:
-            df = pd.read_csv(path, sep=None, engine="python", encoding_errors="ignore")
+            sep = _sniff_delimiter(path)
+            if sep is None:
+                return None
+            df = pd.read_csv(path, sep=sep, encoding_errors="ignore")
         df.columns = [str(c).strip() for c in df.columns]
         for c in df.columns:
             if pd.api.types.is_string_dtype(df[c]):
-                df[c] = df[c].map(lambda x: x.strip() if isinstance(x, str) else x)
+                df[c] = _strip_strings(df[c])
         return df
     except Exception:
         return None
 
 def _read_safety_table(path: Path) -> Dict[str, List[str]]:
     df = _read_table_auto(path)
-    out = {"genes": [], "product_keywords": [], "KO": [], "EC": []}
+    out = {"genes": [], "product_keywords": [], "KO": [], "EC": [], "xrefs": []}
     if df is None or df.empty:
         return out
     cols_lower = {c.lower(): c for c in df.columns}
     gene_col = next((cols_lower[k] for k in ("gene","genes","name","symbol") if k in cols_lower), None)
     prod_col = next((cols_lower[k] for k in ("product","description","function") if k in cols_lower), None)
+    ec_col   = next((cols_lower[k] for k in ("ec","ec_number") if k in cols_lower), None)
 
     genes, prods = [], []
     if gene_col:
@@ -195,7 +279,16 @@ def _read_safety_table(path: Path) -> Dict[str, List[str]]:
         prods_raw = [_norm_product(x) for x in df[prod_col].fillna("").astype(str) if _norm_str(x)]
         prods = [p for p in prods_raw if _product_is_specific(p)]
 
-    return {"genes": sorted(set(genes)), "product_keywords": sorted(set(prods)), "KO": [], "EC": []}
+    ecs = sorted({e for xs in _split_ids(df[ec_col]) for e in xs if e}) if ec_col else []
+    ids = set()
+    for ns, aliases in _ID_COLUMNS.items():
+        col = next((cols_lower[k] for k in aliases if k in cols_lower), None)
+        if col:
+            ids.update(x for xs in _split_ids(df[col]) for x in (normalize_xref(i, ns) for i in xs if i) if x)
+    kos = sorted(x[3:] for x in ids if x.startswith("KO:"))
+    xrefs = sorted(x for x in ids if not x.startswith("KO:"))
+
+    return {"genes": sorted(set(genes)), "product_keywords": sorted(set(prods)), "KO": kos, "EC": ecs, "xrefs": xrefs}
 
 def _read_benefit_csv(path: Path) -> Optional[pd.DataFrame]:
     df = _read_table_auto(path)
@@ -207,16 +300,19 @@ def _read_benefit_csv(path: Path) -> Optional[pd.DataFrame]:
             if n in cols_lower: return cols_lower[n]
         return None
     gc = colget("gene"); pc = colget("product","description","function")
-    cc = colget("category"); tc = colget("tier")
+    cc = colget("category"); tc = colget("tier"); ec = colget("ec","ec_number")
     if gc is None: df["Gene"] = ""; gc = "Gene"
     if pc is None: df["Product"] = ""; pc = "Product"
     if cc is None: df["Category"] = ""; cc = "Category"
     if tc is None: df["Tier"] = ""; tc = "Tier"
-    df = df.rename(columns={gc:"Gene", pc:"Product", cc:"Category", tc:"Tier"})
-    for c in ("Gene","Product","Category","Tier"):
-        if pd.api.types.is_string_dtype(df[c]):
-            df[c] = df[c].map(lambda x: x.strip() if isinstance(x, str) else x)
-    return df
+    if ec is None: df["EC"] = ""; ec = "EC"
+    renames = {gc:"Gene", pc:"Product", cc:"Category", tc:"Tier", ec:"EC"}
+    for ns, aliases in _ID_COLUMNS.items():
+        col = colget(*aliases)
+        if col is None: df[ns] = ""; col = ns
+        renames[col] = ns
+    # cells are already stripped by _read_table_auto
+    return df.rename(columns=renames)
 
 def _build_module_from_csv(csv_path: Path) -> Dict[str, Any]:
     df = _read_benefit_csv(csv_path)
@@ -224,40 +320,59 @@ def _build_module_from_csv(csv_path: Path) -> Dict[str, Any]:
     if df is None or df.empty:
         return out
 
-    cap_total = 0.0
-    cap_weights: List[float] = []
+    # rows without a Category are dropped, as groupby does
+    df = df[df["Category"].notna()]
+    subcats = df.groupby("Category", sort=True).size().index
+    # products and tiers repeat a lot: normalise distinct values, broadcast to rows
+    prod = _map_distinct(df["Product"], _norm_product_series)
+    rows = pd.DataFrame({
+        "Category": df["Category"],
+        "gene":     _norm_str_series(df["Gene"]).str.lower(),
+        "prod":     prod,
+        "specific": _map_distinct(prod, _product_is_specific_series).astype(bool),
+        "tier":     _map_distinct(df["Tier"], lambda x: _norm_str_series(x).str.lower()),
+    })
+    rows.loc[~rows["tier"].isin(list(TIER_WEIGHTS)), "tier"] = "supportive"
+
+    with_gene = rows[rows["gene"] != ""]
+    # gene -> tier of its last row, keyed in first-seen order
+    tiers = with_gene.groupby(["Category", "gene"], sort=False)["tier"].last().reset_index()
+    tiers_by_cat = {k: dict(zip(g["gene"], g["tier"])) for k, g in tiers.groupby("Category", sort=False)}
+    specific = rows[rows["specific"]]
+    keywords_by_cat = {k: sorted(set(g)) for k, g in specific.groupby("Category", sort=False)["prod"]}
+    ec_rows = df[["Category"]].assign(ec=_split_ids(df["EC"])).explode("ec")
+    ec_rows = ec_rows[ec_rows["ec"].notna() & (ec_rows["ec"] != "")]
+    ecs_by_cat = {k: sorted(set(g)) for k, g in ec_rows.groupby("Category", sort=False)["ec"]}
+    # exact IDs: "NS:ID" per row, tier of the last row per ID (as for genes)
+    id_parts = []
+    for ns in _ID_COLUMNS:
+        ex = rows[["Category", "tier"]].assign(x=_split_ids(df[ns])).explode("x")
+        ex = ex[ex["x"].notna() & (ex["x"] != "")]
+        if not ex.empty:
+            ex["x"] = _map_distinct(ex["x"], lambda u, ns=ns: u.map(lambda v: normalize_xref(v, ns) or ""))
+            id_parts.append(ex[ex["x"] != ""])
+    id_tiers_by_cat: Dict[Any, Dict[str, str]] = {}
+    if id_parts:
+        last = pd.concat(id_parts).groupby(["Category", "x"], sort=False)["tier"].last().reset_index()
+        id_tiers_by_cat = {k: dict(zip(g["x"], g["tier"])) for k, g in last.groupby("Category", sort=False)}
 
-    for subcat, g in df.groupby("Category"):
+    cap_total = 0.0
+    for subcat in subcats:
         sub = _norm_str(subcat) or "Misc"
-
-        genes: Set[str] = set()
-        keywords: Set[str] = set()
-        tiers_map: Dict[str, str] = {}
-
-        for _, row in g.iterrows():
-            gene = _norm_lower(row.get("Gene",""))
-            prod = _norm_product(row.get("Product",""))
-            tier = _norm_lower(row.get("Tier",""))
-            if tier not in TIER_WEIGHTS:
-                tier = "supportive"
-            if gene:
-                genes.add(gene)
-                tiers_map[gene] = tier
-                cap_weights.append(TIER_WEIGHTS[tier])
-            if _product_is_specific(prod):
-                keywords.add(prod)
-
+        tiers_map = tiers_by_cat.get(subcat, {})
         out["Subcategories"][sub] = {
-            "genes": sorted(genes),
-            "product_keywords": sorted(keywords),
-            "KO": [],
-            "EC": [],
-            "tiers": tiers_map
+            "genes": sorted(tiers_map),
+            "product_keywords": keywords_by_cat.get(subcat, []),
+            "KO": sorted(x[3:] for x in id_tiers_by_cat.get(subcat, {}) if x.startswith("KO:")),
+            "EC": ecs_by_cat.get(subcat, []),
+            "xrefs": sorted(x for x in id_tiers_by_cat.get(subcat, {}) if not x.startswith("KO:")),
+            "tiers": tiers_map,
+            "id_tiers": id_tiers_by_cat.get(subcat, {})
         }
-        cap_total += len(genes)  # integer capacity for module tables
+        cap_total += len(tiers_map)  # integer capacity for module tables
 
     out["Cap"] = float(cap_total)
-    out["CapList"] = sorted(cap_weights, reverse=True)
+    out["CapList"] = sorted(with_gene["tier"].map(TIER_WEIGHTS).tolist(), reverse=True)
     return out
 
 # ---------------- Builders ----------------
@@ -280,15 +395,88 @@ def _build_antibacterial() -> Dict[str, Any]:
 def _build_antifungal() -> Dict[str, Any]:
     return _build_module_from_csv(ANTIFUNG_CSV)
 
-# ---------------- Public: load DB ----------------
-def load_trait_db() -> Dict[str, Any]:
+# ---------------- Snapshot ----------------
+VERSION_KEY = "_version"
+
+def _source_files() -> List[Path]:
+    out = []
+    for p in (ARGS_PATH, VFS_PATH, TA_PATH, ADAPT_CSV, ANTIBACT_CSV, ANTIFUNG_CSV):
+        # same fallbacks _read_table_auto looks at
+        for cand in (p, p.with_suffix(".tsv"), p.with_suffix(".xlsx"), p.with_suffix(".xls")):
+            if cand.exists():
+                out.append(cand)
+    return out
+
+def source_signature() -> str:
+    """Content hash of every source table + SNAPSHOT_VERSION (mtime-independent, so fresh checkouts reuse it)."""
+    h = hashlib.sha256(f"v{SNAPSHOT_VERSION}".encode())
+    for p in _source_files():
+        h.update(p.name.encode())
+        try:
+            h.update(p.read_bytes())
+        except OSError:
+            h.update(b"<unreadable>")
+    return h.hexdigest()
+
+def _read_snapshot(signature: str, path: Path = SNAPSHOT_PATH) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "rb") as fh:
+            gc.disable()  # ~50k small tuples; the collector only slows unpickling down
+            try:
+                blob = pickle.load(fh)
+            finally:
+                gc.enable()
+    except Exception:
+        return None
+    if not isinstance(blob, dict) or blob.get("signature") != signature:
+        return None
+    db = blob.get("db")
+    return db if isinstance(db, dict) else None
+
+def _write_snapshot(db: Dict[str, Any], signature: str, path: Path = SNAPSHOT_PATH) -> bool:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            pickle.dump({"signature": signature, "db": db}, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        return True
+    except OSError:
+        return False
+
+def build_trait_db() -> Dict[str, Any]:
+    """Build the DB from the asset tables (slow path; no snapshot involved)."""
     db: Dict[str, Any] = {}
     db["Safety"]          = _build_safety()
     db["DairyAdaptation"] = _build_adaptation()
     db["Antibacterial"]   = _build_antibacterial()
     db["Antifungal"]      = _build_antifungal()
+    db[INDEX_KEY]         = compile_trait_index(db)
     return db
 
+def build_snapshot(path: Path = SNAPSHOT_PATH) -> Dict[str, Any]:
+    sig = source_signature()
+    db = build_trait_db()
+    db[VERSION_KEY] = sig[:16]
+    _write_snapshot(db, sig, path)
+    return db
+
+def trait_db_version(TRAIT_DB: Optional[Dict[str, Any]] = None) -> str:
+    """Short source hash identifying the loaded DB (for cache keys)."""
+    return str(_get_live_db(TRAIT_DB).get(VERSION_KEY, "") or "")
+
+# ---------------- Public: load DB ----------------
+def load_trait_db(use_snapshot: bool = True) -> Dict[str, Any]:
+    if not use_snapshot:
+        db = build_trait_db()
+        db[VERSION_KEY] = source_signature()[:16]
+        return db
+    db = _read_snapshot(source_signature())
+    if db is not None:
+        return db
+    # stale or missing: rebuild and (best-effort) refresh the snapshot for the next worker
+    return build_snapshot()
+
 # ---------------- Matching utils ----------------
 def _get_live_db(TRAIT_DB: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     if TRAIT_DB is not None:
@@ -329,6 +517,10 @@ def get_trait_entry(category: str, trait: str, TRAIT_DB: Optional[Dict[str,Any]]
     if isinstance(raw, dict) and isinstance(raw.get("tiers"), dict):
         tiers = {str(k).lower(): str(v).lower() for k,v in raw["tiers"].items() if str(k)}
     entry["tiers"] = tiers
+    id_tiers = {}
+    if isinstance(raw, dict) and isinstance(raw.get("id_tiers"), dict):
+        id_tiers = {x: str(v).lower() for k, v in raw["id_tiers"].items() for x in [normalize_xref(str(k))] if x}
+    entry["id_tiers"] = id_tiers
     return entry
 
 def match_feature_to_trait(feature: Dict[str, Any], trait_entry: Dict[str, Any], *, is_benefit: bool) -> Tuple[Optional[str], str, float, bool]:
@@ -359,36 +551,114 @@ def match_feature_to_trait(feature: Dict[str, Any], trait_entry: Dict[str, Any],
 
     return None, "", 0.0, False
 
-def build_detection_table_and_hits(category: str, features: List[Dict[str, Any]], genome_name: str,
-                                   TRAIT_DB: Optional[Dict[str,Any]]=None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+# ---------------- Compiled trait index ----------------
+# One hash map per match kind, over every category at once:
+#   normalised gene    -> [(category, trait, weight), ...]
+#   ids[namespace][ID] -> [(category, trait, weight), ...]   (KO, COG, PFAM, ...)
+#   normalised product -> [(category, trait, weight), ...]
+# Tiers are resolved to weights here, so a request does one probe per
+# distinct gene/product instead of re-coercing every trait entry.
+INDEX_KEY = "_index"
+BENEFIT_CATEGORIES = ("DairyAdaptation", "Antibacterial", "Antifungal")
+
+def compile_trait_index(TRAIT_DB: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    db = _get_live_db(TRAIT_DB)
+    traits: Dict[str, List[str]] = {}
+    gene_map: Dict[str, List[Tuple[str, str, float]]] = {}
+    product_map: Dict[str, List[Tuple[str, str, float]]] = {}
+    id_maps: Dict[str, Dict[str, List[Tuple[str, str, float]]]] = {}
+    for category in [c for c in db if c not in (INDEX_KEY, VERSION_KEY) and isinstance(db.get(c), dict)]:
+        subcats = (db.get(category, {}) or {}).get("Subcategories", {}) or {}
+        if not isinstance(subcats, dict):
+            subcats = {}
+        is_benefit = category in BENEFIT_CATEGORIES
+        traits[category] = sorted(subcats.keys())
+        for trait in traits[category]:
+            entry = get_trait_entry(category, trait, db)
+            tiers = entry.get("tiers", {}) or {}
+            for g in entry.get("genes", []) or []:
+                w = float(TIER_WEIGHTS.get(tiers.get(g, "supportive"), 0.6)) if is_benefit else 1.0
+                gene_map.setdefault(g, []).append((category, trait, w))
+            for p in entry.get("product_keywords", []) or []:
+                if _product_is_specific(p):
+                    w = PRODUCT_MATCH_WEIGHT if is_benefit else 1.0
+                    product_map.setdefault(p, []).append((category, trait, w))
+            id_tiers = entry.get("id_tiers", {}) or {}
+            ids = [normalize_xref(k, "KO") for k in entry.get("KO", []) or []] + list(entry.get("xrefs", []) or [])
+            for x in dict.fromkeys(i for i in ids if i):
+                w = float(TIER_WEIGHTS.get(id_tiers.get(x, "supportive"), 0.6)) if is_benefit else 1.0
+                ns, _, ident = x.partition(":")
+                id_maps.setdefault(ns, {}).setdefault(ident, []).append((category, trait, w))
+    return {"traits": traits, "gene": gene_map, "product": product_map, "ids": id_maps}
+
+def get_trait_index(TRAIT_DB: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Index compiled by load_trait_db; compiled (and attached) on first use otherwise."""
+    db = _get_live_db(TRAIT_DB)
+    idx = db.get(INDEX_KEY)
+    if not isinstance(idx, dict):
+        idx = compile_trait_index(db)
+        db[INDEX_KEY] = idx
+    return idx
+
+def _match_table(table: FeatureTable, index: Dict[str, Any],
+                 categories: Tuple[str, ...]) -> Dict[Tuple[str, str], List[Tuple[int, str, str, float, bool]]]:
     """
-    For module pages:
-      - Detected = integer unique count (no decimals)
-    For Results:
-      - hits Weight carries tier/product weights (benefit only) so weighted sums are possible.
+    Probe the index once per distinct normalised gene/product/xref and return,
+    per (category, trait), the matching rows in feature order as
+    (row, disp_name, kind, weight, is_gene). Per trait a gene match wins over
+    an exact-ID match ("id"), which wins over a product match.
     """
-    db = _get_live_db(TRAIT_DB)
-    cat_blob = db.get(category, {}) or {}
-    subcats = cat_blob.get("Subcategories", {}) or {}
-    if isinstance(subcats, list) or not isinstance(subcats, dict):
-        subcats = {}
-
-    is_benefit_cat = category in ("DairyAdaptation","Antibacterial","Antifungal")
+    wanted = set(categories)
+    gene_map, product_map, id_maps = index.get("gene", {}), index.get("product", {}), index.get("ids", {})
+
+    def _probe(mapping, keys):
+        return [[h for h in mapping.get(k, ()) if h[0] in wanted] if k else [] for k in keys]
+
+    gene_n = table.derived("gene", _norm_lower)
+    prod_n = table.derived("product", _norm_product)
+    gene_hits = _probe(gene_map, gene_n)
+    prod_hits = _probe(product_map, prod_n)
+    xref_hits = [[h for h in id_maps.get(ns, {}).get(ident, ()) if h[0] in wanted]
+                 for ns, _, ident in (x.partition(":") for x in table.xref_vocab)]
+
+    gmask = table.row_mask("gene", np.fromiter((bool(h) for h in gene_hits), dtype=bool, count=len(gene_hits)))
+    pmask = table.row_mask("product", np.fromiter((bool(h) for h in prod_hits), dtype=bool, count=len(prod_hits)))
+    xhit = np.fromiter((bool(h) for h in xref_hits), dtype=bool, count=len(xref_hits))[table.xref_codes]
+    xmask = np.bincount(table.xref_rows()[xhit], minlength=len(table)) > 0
+    gene_codes, prod_codes = table.codes("gene"), table.codes("product")
+    xptr, xcodes, xvocab = table.xref_ptr, table.xref_codes, table.xref_vocab
+
+    out: Dict[Tuple[str, str], List[Tuple[int, str, str, float, bool]]] = {}
+    for i in np.flatnonzero(gmask | pmask | xmask):
+        gc, pc = gene_codes[i], prod_codes[i]
+        taken = set()
+        for category, trait, w in gene_hits[gc]:
+            out.setdefault((category, trait), []).append((int(i), gene_n[gc], "gene", w, True))
+            taken.add((category, trait))
+        if xmask[i]:
+            for xc in xcodes[xptr[i]:xptr[i + 1]]:
+                for category, trait, w in xref_hits[xc]:
+                    if (category, trait) not in taken:
+                        out.setdefault((category, trait), []).append((int(i), xvocab[xc], "id", w, False))
+                        taken.add((category, trait))
+        for category, trait, w in prod_hits[pc]:
+            if (category, trait) not in taken:
+                out.setdefault((category, trait), []).append((int(i), prod_n[pc], "product", w, False))
+    return out
 
+def _assemble_category(category: str, traits: List[str],
+                       matches: Dict[Tuple[str, str], List[Tuple[int, str, str, float, bool]]],
+                       table: FeatureTable, genome_name: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    is_benefit_cat = category in BENEFIT_CATEGORIES
     rows, hits_rows = [], []
 
-    for trait in sorted(subcats.keys()):
-        entry = get_trait_entry(category, trait, db)
-
+    for trait in traits:
         # best weight per unique name; track whether name came from a gene (priority)
         best_weight: Dict[str, float] = {}
         is_gene_name: Dict[str, bool] = {}
         raw_rows: Dict[str, Dict[str, Any]] = {}
 
-        for f in features or []:
-            disp, kind, w, is_gene = match_feature_to_trait(f, entry, is_benefit=is_benefit_cat)
-            if not disp:
-                continue
+        for i, disp, kind, w, is_gene in matches.get((category, trait), ()):
             # keep the *max* weight for this name
             if w > best_weight.get(disp, 0.0):
                 best_weight[disp] = w
@@ -398,14 +668,14 @@ def build_detection_table_and_hits(category: str, features: List[Dict[str, Any]]
                     "Trait": trait,
                     "Category": category,
                     "Hit": disp,
-                    "Product": f.get("product",""),
+                    "Product": table.value("product", i),
                     "Kind": kind,
-                    "TierLabel": "" if not is_benefit_cat else ("gene" if is_gene else "product"),
+                    "TierLabel": "" if not is_benefit_cat else kind,
                     "Weight": w,
-                    "Locus": f.get("locus_tag",""),
-                    "Start": f.get("start",0),
-                    "End": f.get("end",0),
-                    "Strand": f.get("strand",0)
+                    "Locus": table.value("locus_tag", i),
+                    "Start": int(table.start[i]),
+                    "End": int(table.end[i]),
+                    "Strand": int(table.strand[i])
                 }
 
         # apply cap with gene-first priority
@@ -431,6 +701,45 @@ def build_detection_table_and_hits(category: str, features: List[Dict[str, Any]]
          "TierLabel": [], "Weight": [], "Locus": [], "Start": [], "End": [], "Strand": []})
     return summary_df, hits_df
 
+def build_detection_table_and_hits(category: str, features: FeatureInput, genome_name: str,
+                                   TRAIT_DB: Optional[Dict[str,Any]]=None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    For module pages:
+      - Detected = integer unique count (no decimals)
+    For Results:
+      - hits Weight carries tier/product weights (benefit only) so weighted sums are possible.
+    Accepts a FeatureTable or the parser's list of feature dicts; matching
+    goes through the compiled trait index.
+    """
+    index = get_trait_index(TRAIT_DB)
+    table = as_feature_table(features)
+    matches = _match_table(table, index, (category,))
+    return _assemble_category(category, index["traits"].get(category, []), matches, table, genome_name)
+
+def detect_all(features: FeatureInput, genome_name: str,
+               TRAIT_DB: Optional[Dict[str, Any]] = None,
+               categories: Optional[List[str]] = None,
+               progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Tuple[pd.DataFrame, pd.DataFrame]]:
+    """
+    Single-pass detection over every category: each feature's gene/product is
+    normalised and probed once against the combined index, then split into
+    {category: (summary_df, hits_df)} -- the same frames
+    build_detection_table_and_hits returns for that category.
+    progress(done, total) is called after matching and after each category.
+    """
+    index = get_trait_index(TRAIT_DB)
+    cats = list(categories) if categories is not None else list(index["traits"].keys())
+    table = as_feature_table(features)
+    matches = _match_table(table, index, tuple(cats))
+    out = {}
+    for i, c in enumerate(cats):
+        if progress is not None:
+            progress(i + 1, len(cats) + 1)
+        out[c] = _assemble_category(c, index["traits"].get(c, []), matches, table, genome_name)
+    if progress is not None:
+        progress(len(cats) + 1, len(cats) + 1)
+    return out
+
 # ---- Categories helper ----
 ALL_CATEGORIES = ["Safety", "DairyAdaptation", "Antibacterial", "Antifungal"]
 
@@ -453,8 +762,12 @@ def category_trait_map(TRAIT_DB: Optional[Dict[str, Any]] = None) -> Dict[str, L
 
 # Back-compat alias
 def build_detection_tables(category: str,
-                           features: List[Dict[str, Any]],
+                           features: FeatureInput,
                            genome_name: str,
                            TRAIT_DB: Optional[Dict[str, Any]] = None):
     return build_detection_table_and_hits(category, features, genome_name, TRAIT_DB)
 
+if __name__ == "__main__":
+    # deploy-time build step: python -m utils.trait_db
+    _db = build_snapshot()
+    print(f"trait DB snapshot {_db[VERSION_KEY]} -> {SNAPSHOT_PATH}")